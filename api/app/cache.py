@@ -0,0 +1,214 @@
+"""In-process caches with bounded size and time to live."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+# all caches by name, used to report their statistics
+CACHES: dict[str, "TTLCache"] = {}
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU cache whose entries expire after ttl seconds.
+
+    The cache is meant to be used from the event loop only, so it takes
+    no locks.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float) -> None:
+        """
+        Create an empty cache and register it by name.
+
+        Args:
+            name (str): name of the cache in statistics.
+            maxsize (int): maximum number of entries.
+            ttl (float): time to live of an entry in seconds.
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        CACHES[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return a live entry and mark it as recently used.
+
+        Args:
+            key (Hashable): key of the entry.
+            default (Any): value returned on a miss.
+
+        Returns:
+            Any: cached value or default.
+        """
+        value = self._lookup(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def _lookup(self, key: Hashable) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Store an entry evicting the least recently used one if full.
+
+        Args:
+            key (Hashable): key of the entry.
+            value (Any): value to store.
+        """
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Drop an entry if it is cached.
+
+        Args:
+            key (Hashable): key of the entry.
+        """
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return hit and miss counters and the current size.
+
+        Returns:
+            dict[str, int]: statistics of the cache.
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _Abandoned(Exception):
+    """The loading request was cancelled before it got the value."""
+
+
+class SingleFlightCache(TTLCache):
+    """
+    TTL cache loading a missing entry once for all concurrent callers.
+
+    Callers asking for a key which is being loaded wait for that load
+    instead of starting their own (request coalescing). None is not
+    cached, so a missing object is looked up again.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float) -> None:
+        """
+        Create an empty cache and register it by name.
+
+        Args:
+            name (str): name of the cache in statistics.
+            maxsize (int): maximum number of entries.
+            ttl (float): time to live of an entry in seconds, 0 to only
+                coalesce concurrent loads.
+        """
+        super().__init__(name, maxsize, ttl)
+        self.coalesced = 0
+        self._flights: dict[Hashable, asyncio.Future] = {}
+        # bumped by clear() so that loads started before it aren't stored
+        self._generation = 0
+
+    async def get_or_load(
+        self, key: Hashable, load: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Return a live entry, join a running load of it or load it.
+
+        An error of the load is raised to all callers waiting for it and
+        nothing is cached. If the loading caller is cancelled, one of the
+        waiting callers loads the entry again.
+
+        Args:
+            key (Hashable): key of the entry.
+            load (Callable[[], Awaitable[Any]]): coroutine function
+                returning the value.
+
+        Returns:
+            Any: cached or loaded value.
+        """
+        value = self._lookup(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(flight)
+            except _Abandoned:
+                return await self.get_or_load(key, load)
+
+        self.misses += 1
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        generation = self._generation
+        try:
+            value = await load()
+        except BaseException as error:
+            if isinstance(error, Exception):
+                flight.set_exception(error)
+            else:
+                flight.set_exception(_Abandoned())
+            # retrieved here, nobody may be waiting for the flight
+            flight.exception()
+            raise
+        else:
+            if value is not None and generation == self._generation:
+                self.set(key, value)
+            flight.set_result(value)
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Drop an entry, loads already running are not cached.
+
+        Args:
+            key (Hashable): key of the entry.
+        """
+        super().invalidate(key)
+        self._flights.pop(key, None)
+        self._generation += 1
+
+    def clear(self) -> None:
+        """Drop all entries, loads already running are not cached."""
+        super().clear()
+        self._flights.clear()
+        self._generation += 1
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return hit, miss and coalesced counters and the current size.
+
+        Returns:
+            dict[str, int]: statistics of the cache.
+        """
+        return {**super().stats(), "coalesced": self.coalesced}
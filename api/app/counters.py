@@ -0,0 +1,103 @@
+"""
+Repair job for the denormalized like and follower counters.
+
+The counters are kept up to date on write; the job recomputes them from
+the association tables in case of drift, e.g. after manual data fixes.
+
+Usage:
+    python -m app.counters
+"""
+
+import asyncio
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import async_session
+from .models import (
+    CHANGE_VERSION,
+    Tweet,
+    User,
+    associated_followers,
+    associated_likes,
+)
+
+
+async def repair_counters(
+    session: AsyncSession,
+    batch_size: int = 10000,
+) -> dict[str, int]:
+    """
+    Recompute like, follower and following counters in batches by ID range.
+
+    Every batch is committed separately so that rows are not locked
+    for the whole run.
+
+    Args:
+        session (AsyncSession): async session instance.
+        batch_size (int): number of IDs processed in one transaction.
+
+    Returns:
+        dict[str, int]: number of fixed rows per table.
+    """
+    like_count = (
+        select(func.count())
+        .where(associated_likes.c.tweet_id == Tweet.id)
+        .scalar_subquery()
+    )
+    follower_count = (
+        select(func.count())
+        .where(associated_followers.c.following_id == User.id)
+        .scalar_subquery()
+    )
+    following_count = (
+        select(func.count())
+        .where(associated_followers.c.follower_id == User.id)
+        .scalar_subquery()
+    )
+    jobs = {
+        "tweets": (
+            Tweet,
+            # syncing clients get the fixed counters as changes
+            {"like_count": like_count, "version": CHANGE_VERSION},
+            Tweet.like_count != like_count,
+        ),
+        "users": (
+            User,
+            {
+                "follower_count": follower_count,
+                "following_count": following_count,
+                "version": CHANGE_VERSION,
+            },
+            (User.follower_count != follower_count)
+            | (User.following_count != following_count),
+        ),
+    }
+
+    fixed = {}
+    for table, (model, values, drifted) in jobs.items():
+        fixed[table] = 0
+        max_id = await session.scalar(select(func.max(model.id))) or 0
+        for start in range(0, max_id + 1, batch_size):
+            result = await session.execute(
+                update(model)
+                .where(model.id >= start, model.id < start + batch_size)
+                .where(drifted)
+                .values(values)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            fixed[table] += result.rowcount
+
+    return fixed
+
+
+async def main() -> None:
+    async with async_session() as session:
+        fixed = await repair_counters(session)
+    for table, count in fixed.items():
+        print(f"{table}: {count} rows fixed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,22 +1,165 @@
 """Async engine, bound to PostgreSQL, and async session are created."""
 
+import dataclasses
+import time
+import uuid
+
+from sqlalchemy import exc
 from sqlalchemy.ext.asyncio import (
     AsyncAttrs,
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .settings import settings
+
+
+@dataclasses.dataclass
+class PoolStats:
+    """Counters of connection checkouts from the pool."""
+
+    checkouts: int = 0
+    timeouts: int = 0
+    wait_seconds_total: float = 0
+    wait_seconds_max: float = 0
+
+
+# statistics by the logging name of the pool, it survives pool recreation
+pool_stats: dict[str, PoolStats] = {}
+
+
+class MeasuredQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that measures time spent on getting a connection."""
+
+    def connect(self):
+        stats = pool_stats.setdefault(self._orig_logging_name, PoolStats())
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            stats.timeouts += 1
+            raise
+        finally:
+            wait = time.perf_counter() - start
+            stats.checkouts += 1
+            stats.wait_seconds_total += wait
+            stats.wait_seconds_max = max(stats.wait_seconds_max, wait)
+
+
+def get_connect_args(statement_cache_size: int) -> dict:
+    """
+    Return arguments of asyncpg connections for the statement cache size.
+
+    With the size 0 nothing is cached neither by SQLAlchemy nor by asyncpg,
+    and prepared statements get unique names, as pgbouncer in transaction
+    mode may run the next statement on another server connection.
+
+    Args:
+        statement_cache_size (int): prepared statements cached
+            per connection.
 
-DATABASE_URL = "postgresql+asyncpg://admin:admin@db"
+    Returns:
+        dict: connect_args of the engine.
+    """
+    connect_args = {
+        "prepared_statement_cache_size": statement_cache_size,
+        "statement_cache_size": statement_cache_size,
+    }
+    if not statement_cache_size:
+        connect_args[
+            "prepared_statement_name_func"
+        ] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+    return connect_args
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+
+def make_engine(url: str, name: str) -> AsyncEngine:
+    """
+    Create async engine with the pool configured by the settings.
+
+    Args:
+        url (str): database URL.
+        name (str): name of the pool in statistics.
+
+    Returns:
+        AsyncEngine: engine instance.
+    """
+    return create_async_engine(
+        url,
+        echo=settings.db_echo,
+        poolclass=MeasuredQueuePool,
+        pool_logging_name=name,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args=get_connect_args(settings.db_statement_cache_size),
+    )
+
+
+engine = make_engine(settings.database_url, name="primary")
 async_session = async_sessionmaker(
     engine,
     expire_on_commit=False,
     class_=AsyncSession,
 )
 
+# without a replica reads share the primary engine and session factory
+read_engine = engine
+read_session = async_session
+if settings.read_database_url:
+    read_engine = make_engine(settings.read_database_url, name="replica")
+    read_session = async_sessionmaker(
+        read_engine,
+        expire_on_commit=False,
+        class_=AsyncSession,
+    )
+
+
+async def warm_up_pool(pool_engine: AsyncEngine, size: int) -> None:
+    """
+    Open connections in advance, so that first requests don't wait for them.
+
+    Args:
+        pool_engine (AsyncEngine): engine whose pool is filled.
+        size (int): number of connections to open, at most the pool size.
+    """
+    connections = []
+    try:
+        for _ in range(size):
+            connections.append(await pool_engine.connect())
+    finally:
+        # the connections stay open in the pool
+        for connection in connections:
+            await connection.close()
+
+
+def get_pool_stats(
+    pool_engine: AsyncEngine = engine,
+) -> dict[str, int | float]:
+    """
+    Return current state of the engine pool and checkout counters.
+
+    Args:
+        pool_engine (AsyncEngine): engine whose pool is reported.
+
+    Returns:
+        dict[str, int | float]: pool statistics of this worker.
+    """
+    pool = pool_engine.sync_engine.pool
+    stats = pool_stats.get(pool._orig_logging_name, PoolStats())
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        **dataclasses.asdict(stats),
+    }
+
 
 class Base(AsyncAttrs, DeclarativeBase):
     """Extend Base class by AsyncAttrs."""
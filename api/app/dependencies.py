@@ -1,13 +1,36 @@
 """Dependencies applied to all API."""
 
+import hashlib
+import hmac
+import math
+import time
 from typing import Annotated
 
-from fastapi import Depends, Header, HTTPException, status
+from fastapi import Cookie, Depends, Header, HTTPException, Response, status
 from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from .database import async_session
+from . import schemas
+from .cache import SingleFlightCache, TTLCache
+from .database import async_session, read_session
 from .models import User
+from .settings import settings
+
+# api-key -> identity of the user, saves a query on every request
+auth_cache = TTLCache(
+    "auth", maxsize=settings.auth_cache_size, ttl=settings.auth_cache_ttl
+)
+# signed time of the last write of the user, their reads within
+# the read-your-writes window go to the primary whatever worker serves them
+LAST_WRITE_COOKIE = "last_write"
+# the key has to be the same in all workers
+LAST_WRITE_KEY = (settings.secret_key or settings.database_url).encode()
+# (limit, before_id, ETag) -> serialized page of GET /api/tweets
+timeline_cache = SingleFlightCache(
+    "timeline",
+    maxsize=settings.timeline_cache_size,
+    ttl=settings.timeline_cache_ttl,
+)
 
 
 async def get_db_session():
@@ -24,6 +47,19 @@ async def get_db_session():
         await db.close()
 
 
+def get_session_maker() -> async_sessionmaker:
+    """
+    Return factory of sessions for work outliving the request.
+
+    Background tasks open their own sessions, the one of the request
+    is closed when it ends.
+
+    Returns:
+        async_sessionmaker: factory of sessions of the primary database.
+    """
+    return async_session
+
+
 async def get_api_key(
     api_key: Annotated[
         str,
@@ -33,10 +69,12 @@ async def get_api_key(
         ),
     ],
     db: Annotated[AsyncSession, Depends(get_db_session)],
-) -> User:
+) -> schemas.BaseUser:
     """
     Check if user with api-key exists in database.
 
+    Known api-keys are taken from the auth cache without a query.
+
     Args:
         api_key (str): User api-key passed in header.
         db (AsyncSession): async session instance.
@@ -45,17 +83,147 @@ async def get_api_key(
         HTTPException: if there are no user with such api_key.
 
     Returns:
-        User: user instance or 404 status code.
+        schemas.BaseUser: ID and name of the user or 401 status code.
 
     """
-    stmt = select(User).where(User.api_key == api_key)
+    user = auth_cache.get(api_key)
+    if user is not None:
+        return user
+
+    stmt = select(User.id, User.name).where(User.api_key == api_key)
     result = await db.execute(stmt)
-    user = result.scalar()
+    row = result.first()
 
-    if not user:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Access is denied for unauthorized users",
         )
 
+    user = schemas.BaseUser(id=row.id, name=row.name)
+    auth_cache.set(api_key, user)
     return user
+
+
+def invalidate_api_key(api_key: str | None = None) -> None:
+    """
+    Drop cached identity of api-key, call it when the key or user changes.
+
+    Args:
+        api_key (str | None): api-key to drop, all keys if None.
+    """
+    if api_key is None:
+        auth_cache.clear()
+    else:
+        auth_cache.invalidate(api_key)
+
+
+def sign_last_write(user_id: int, written_at: float) -> str:
+    """
+    Make the value of the last write cookie.
+
+    Args:
+        user_id (int): ID of the user who wrote.
+        written_at (float): unix time of the write.
+
+    Returns:
+        str: user ID and time with their HMAC.
+    """
+    message = f"{user_id}:{written_at:.3f}"
+    digest = hmac.new(LAST_WRITE_KEY, message.encode(), hashlib.sha256)
+    return f"{message}:{digest.hexdigest()}"
+
+
+def wrote_recently(last_write: str | None, user_id: int) -> bool:
+    """
+    Check if the cookie tells about a write of the user within the window.
+
+    Args:
+        last_write (str | None): value of the last write cookie.
+        user_id (int): ID of the current user.
+
+    Returns:
+        bool: True if the cookie is genuine, of the user and fresh.
+    """
+    if not last_write:
+        return False
+    message, _, _ = last_write.rpartition(":")
+    cookie_user_id, _, written_at = message.partition(":")
+    try:
+        expected = sign_last_write(int(cookie_user_id), float(written_at))
+    except ValueError:
+        return False
+    if not hmac.compare_digest(last_write, expected):
+        return False
+    age = time.time() - float(written_at)
+    return (
+        int(cookie_user_id) == user_id
+        and 0 <= age < settings.read_your_writes_seconds
+    )
+
+
+async def get_write_db_session(
+    db: Annotated[AsyncSession, Depends(get_db_session)],
+    user: Annotated[schemas.BaseUser, Depends(get_api_key)],
+    response: Response,
+):
+    """
+    Return session of the primary database for a request that writes.
+
+    The response gets a signed cookie with the time of the write, so that
+    the next reads of the user see their own changes in any worker
+    (see get_read_db_session).
+
+    Args:
+        db (AsyncSession): session of the primary database.
+        user (schemas.BaseUser): current user.
+        response (Response): response the cookie is set on.
+
+    Yields:
+        instance of async session
+    """
+    response.set_cookie(
+        LAST_WRITE_COOKIE,
+        sign_last_write(user.id, time.time()),
+        max_age=math.ceil(settings.read_your_writes_seconds),
+        path="/api",
+        httponly=True,
+        samesite="lax",
+    )
+    yield db
+
+
+async def get_read_db_session(
+    db: Annotated[AsyncSession, Depends(get_db_session)],
+    user: Annotated[schemas.BaseUser, Depends(get_api_key)],
+    last_write: Annotated[
+        str | None,
+        Cookie(
+            alias=LAST_WRITE_COOKIE,
+            include_in_schema=False,
+        ),
+    ] = None,
+):
+    """
+    Return session of the read replica, if it is configured.
+
+    Users whose last write cookie is within the read-your-writes window
+    read from the primary.
+
+    Args:
+        db (AsyncSession): session of the primary database.
+        user (schemas.BaseUser): current user.
+        last_write (str | None): signed time of the last write.
+
+    Yields:
+        instance of async session
+    """
+    if read_session is async_session or wrote_recently(last_write, user.id):
+        yield db
+        return
+
+    replica = read_session()
+    try:
+        yield replica
+    finally:
+        await replica.close()
@@ -0,0 +1,178 @@
+"""Serving of stored media files with validators and byte ranges."""
+
+import os
+import re
+from typing import Mapping
+
+import aiofiles
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# a single range, other forms are answered with the whole file
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+# extension of ASGI servers able to send a file from the kernel
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+def etag_matches(etag: str, header: str | None) -> bool:
+    """
+    Check if an ETag is listed in If-None-Match or If-Range header.
+
+    Args:
+        etag (str): quoted ETag of the file.
+        header (str | None): value of the request header.
+
+    Returns:
+        bool: True if the header matches the ETag.
+    """
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parse Range header into the first and the last byte positions.
+
+    Args:
+        header (str): value of the Range header.
+        size (int): size of the file in bytes.
+
+    Raises:
+        ValueError: if the range can't be satisfied.
+
+    Returns:
+        tuple[int, int] | None: inclusive byte positions or None if
+        the header is not a single byte range and must be ignored.
+    """
+    match = RANGE_PATTERN.fullmatch(header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+class MediaFileResponse(Response):
+    """
+    Response with a file supporting If-None-Match, Range and If-Range.
+
+    The body is sent by the server from the file descriptor if it supports
+    the zero-copy send extension, otherwise it is read in chunks, so the
+    file is never loaded into memory at once.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        request_headers: Mapping[str, str],
+        etag: str,
+        media_type: str | None = None,
+        headers: Mapping[str, str] | None = None,
+        background: BackgroundTask | None = None,
+    ) -> None:
+        """
+        Choose the status and the part of the file to send.
+
+        Args:
+            path (str): path of the file.
+            request_headers (Mapping[str, str]): headers of the request.
+            etag (str): quoted strong ETag of the file.
+            media_type (str | None): content type of the file.
+            headers (Mapping[str, str] | None): extra response headers.
+            background (BackgroundTask | None): task run after sending.
+
+        Raises:
+            OSError: if the file can't be accessed.
+        """
+        self.path = path
+        self.media_type = media_type or "application/octet-stream"
+        self.background = background
+        size = os.stat(path).st_size
+        self.start, self.end = 0, size - 1
+        self.status_code = 200
+
+        self.init_headers(headers)
+        self.headers["etag"] = etag
+        self.headers["accept-ranges"] = "bytes"
+        content_type = self.media_type
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if etag_matches(etag, request_headers.get("if-none-match")):
+            self.status_code = 304
+            self.start, self.end = 0, -1
+            content_type = None
+        elif range_header and (if_range is None or if_range == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                self.status_code = 416
+                self.start, self.end = 0, -1
+                self.headers["content-range"] = f"bytes */{size}"
+            else:
+                if byte_range is not None:
+                    self.status_code = 206
+                    self.start, self.end = byte_range
+                    self.headers[
+                        "content-range"
+                    ] = f"bytes {self.start}-{self.end}/{size}"
+
+        if content_type is not None:
+            self.headers["content-type"] = content_type
+        if self.status_code != 304:
+            self.headers["content-length"] = str(self.end - self.start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        count = self.end - self.start + 1
+        if count <= 0:
+            await send({"type": "http.response.body", "body": b""})
+        elif ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send(
+                    {
+                        "type": ZEROCOPY_EXTENSION,
+                        "file": file,
+                        "offset": self.start,
+                        "count": count,
+                    }
+                )
+        else:
+            async with aiofiles.open(self.path, mode="rb") as file:
+                await file.seek(self.start)
+                while count > 0:
+                    chunk = await file.read(min(self.chunk_size, count))
+                    if not chunk:
+                        break
+                    count -= len(chunk)
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": count > 0,
+                        }
+                    )
+                if count > 0:
+                    # the file was truncated while sending
+                    await send({"type": "http.response.body", "body": b""})
+
+        if self.background is not None:
+            await self.background()
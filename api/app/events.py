@@ -0,0 +1,255 @@
+"""
+Live events of the timeline: new and deleted tweets, changed like counts.
+
+Writes publish events by PostgreSQL NOTIFY in their transaction, so that
+an event is delivered only if the change is committed. Every worker holds
+one LISTEN connection and fans events out to its subscribers in process.
+A subscriber has a bounded queue; when it falls behind, it is dropped
+and has to reconnect and reload the timeline.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+from typing import Any, AsyncIterator, Callable
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "timeline_events"
+# seconds between attempts to restore a lost LISTEN connection
+RECONNECT_DELAY = 1
+# put into the queue of a dropped subscriber instead of an event
+DROPPED = None
+
+
+async def publish(db: AsyncSession, event_type: str, **data: Any) -> None:
+    """
+    Publish an event when the transaction of the session commits.
+
+    Args:
+        db (AsyncSession): session of the writing transaction.
+        event_type (str): type of the event, e.g. tweet_created.
+        data (Any): fields of the event.
+    """
+    payload = json.dumps({"type": event_type, **data})
+    await db.execute(select(func.pg_notify(CHANNEL, payload)))
+
+
+class Subscriber:
+    """Queue of events of one client."""
+
+    def __init__(self, queue_size: int) -> None:
+        self.queue: asyncio.Queue[str | None] = asyncio.Queue(queue_size)
+        self.dropped = False
+
+    def deliver(self, payload: str) -> bool:
+        """
+        Put an event into the queue without waiting.
+
+        Returns:
+            bool: False if the queue is full and the subscriber is dropped.
+        """
+        if self.dropped:
+            return False
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            pass
+        # the client will reload the timeline, pending events are useless
+        self.dropped = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(DROPPED)
+        return False
+
+
+class EventBroker:
+    """
+    Fan-out of the events received by LISTEN to in-process subscribers.
+    """
+
+    def __init__(self, database_url: str, queue_size: int) -> None:
+        """
+        Create a broker without a connection.
+
+        Args:
+            database_url (str): SQLAlchemy URL of the primary database.
+            queue_size (int): events kept for a slow subscriber
+                before it is dropped.
+        """
+        self.dsn = make_url(database_url).set(drivername="postgresql")
+        self.queue_size = queue_size
+        self.subscribers: set[Subscriber] = set()
+        self.dropped = 0
+        # callbacks of other channels listened on the same connection
+        self.listeners: dict[str, Callable[[str | None], None]] = {}
+        self._task: asyncio.Task | None = None
+        self._listening = asyncio.Event()
+
+    @property
+    def listening(self) -> bool:
+        """Whether the LISTEN connection is open."""
+        return self._listening.is_set()
+
+    def subscribe(self) -> Subscriber:
+        """
+        Register a new subscriber.
+
+        Returns:
+            Subscriber: subscriber to read events from.
+        """
+        subscriber = Subscriber(self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """
+        Stop delivering events to the subscriber.
+
+        Args:
+            subscriber (Subscriber): subscriber returned by subscribe.
+        """
+        self.subscribers.discard(subscriber)
+
+    def listen(
+        self, channel: str, callback: Callable[[str | None], None]
+    ) -> None:
+        """
+        Pass notifications of another channel to a callback.
+
+        The callback gets None every time the connection is opened, since
+        notifications sent before are lost. Call it before start.
+
+        Args:
+            channel (str): name of the channel.
+            callback (Callable[[str | None], None]): function called
+                with the payload of every notification.
+        """
+        self.listeners[channel] = callback
+
+    def dispatch(self, payload: str) -> None:
+        """
+        Deliver an event to every subscriber, dropping slow ones.
+
+        Args:
+            payload (str): event as JSON.
+        """
+        for subscriber in list(self.subscribers):
+            if not subscriber.deliver(payload):
+                self.subscribers.discard(subscriber)
+                self.dropped += 1
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        self.dispatch(payload)
+
+    def _on_message(self, callback, connection, pid, channel, payload) -> None:
+        callback(payload)
+
+    async def _listen_once(self) -> None:
+        terminated = asyncio.Event()
+        connection = await asyncpg.connect(
+            self.dsn.render_as_string(hide_password=False)
+        )
+        connection.add_termination_listener(lambda _: terminated.set())
+        try:
+            await connection.add_listener(CHANNEL, self._on_notification)
+            for channel, callback in self.listeners.items():
+                await connection.add_listener(
+                    channel, functools.partial(self._on_message, callback)
+                )
+            if self._listening.is_set():
+                # events were lost while reconnecting
+                self.dispatch(json.dumps({"type": "resync"}))
+            # including the first connection, as the worker may have
+            # served requests before it
+            for callback in self.listeners.values():
+                callback(None)
+            self._listening.set()
+            await terminated.wait()
+        finally:
+            await connection.close(timeout=RECONNECT_DELAY)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                await self._listen_once()
+                logger.warning("Connection listening for events is lost")
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                logger.exception("Can't listen for events")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def start(self) -> None:
+        """
+        Open the LISTEN connection in the background.
+
+        The connection is retried until the database accepts it, so the
+        worker starts serving requests meanwhile.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def wait_listening(self) -> None:
+        """Wait until the LISTEN connection listens."""
+        await self._listening.wait()
+
+    async def stop(self) -> None:
+        """Close the LISTEN connection and disconnect all subscribers."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._listening.clear()
+        for subscriber in list(self.subscribers):
+            subscriber.deliver(DROPPED)
+        self.subscribers.clear()
+
+
+async def stream_events(
+    broker: EventBroker,
+    subscriber: Subscriber,
+    heartbeat: float,
+) -> AsyncIterator[str]:
+    """
+    Format events of the subscriber as Server-Sent Events.
+
+    A comment is sent when there are no events for heartbeat seconds,
+    so that proxies keep the connection open.
+
+    Args:
+        broker (EventBroker): broker the subscriber belongs to.
+        subscriber (Subscriber): subscriber returned by subscribe.
+        heartbeat (float): seconds between keep-alive comments.
+
+    Yields:
+        str: messages of the stream.
+    """
+    try:
+        yield f"retry: {RECONNECT_DELAY * 1000}\n\n"
+        while True:
+            try:
+                payload = await asyncio.wait_for(
+                    subscriber.queue.get(), heartbeat
+                )
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if payload is DROPPED:
+                # the client reconnects and reloads the timeline
+                yield 'event: resync\ndata: {"type": "resync"}\n\n'
+                return
+            event_type = json.loads(payload)["type"]
+            yield f"event: {event_type}\ndata: {payload}\n\n"
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+broker = EventBroker(settings.database_url, settings.events_queue_size)
@@ -0,0 +1,92 @@
+"""
+Trimming of the inboxes of home feeds.
+
+Tweets are fanned out on write into the inboxes of the followers of
+their author. Only the newest tweets of every inbox are kept, so that
+the table grows with the number of users and not with their history.
+
+Usage:
+    python -m app.inbox
+"""
+
+import asyncio
+import logging
+
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .database import async_session
+from .models import timeline_inbox
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def trim_inboxes(
+    session: AsyncSession,
+    size: int = settings.inbox_max_size,
+) -> int:
+    """
+    Delete inbox entries older than the newest size tweets of every user.
+
+    Args:
+        session (AsyncSession): async session instance.
+        size (int): number of tweets kept in every inbox.
+
+    Returns:
+        int: number of deleted entries.
+    """
+    ranked = select(
+        timeline_inbox.c.user_id,
+        timeline_inbox.c.tweet_id,
+        func.row_number()
+        .over(
+            partition_by=timeline_inbox.c.user_id,
+            order_by=timeline_inbox.c.tweet_id.desc(),
+        )
+        .label("position"),
+    ).subquery()
+    result = await session.execute(
+        delete(timeline_inbox).where(
+            tuple_(timeline_inbox.c.user_id, timeline_inbox.c.tweet_id).in_(
+                select(ranked.c.user_id, ranked.c.tweet_id).where(
+                    ranked.c.position > size
+                )
+            )
+        )
+    )
+    await session.commit()
+    return result.rowcount
+
+
+async def run_periodically(
+    session_maker: async_sessionmaker = async_session,
+    interval: float = settings.inbox_trim_interval,
+) -> None:
+    """
+    Trim the inboxes every interval seconds until cancelled.
+
+    Args:
+        session_maker (async_sessionmaker): factory of sessions.
+        interval (float): pause in seconds between runs.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_maker() as session:
+                trimmed = await trim_inboxes(session)
+        except Exception:
+            logger.exception("Trimming of inboxes failed")
+            continue
+        if trimmed:
+            logger.info("Inbox entries trimmed: %d", trimmed)
+
+
+async def main() -> None:
+    async with async_session() as session:
+        trimmed = await trim_inboxes(session)
+    print(f"{trimmed} inbox entries trimmed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,11 +1,23 @@
 """Module for database initialization."""
 
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+import asyncio
+
+from sqlalchemy import exists, func, select, text
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+)
 
 from .database import Base
+from .migrate import upgrade_database
 from .models import Tweet, User
 
+# key of the advisory lock taken by a worker initializing the database
+BOOTSTRAP_LOCK_ID = 7_251_046_201
+# seconds between attempts to take the lock
+BOOTSTRAP_POLL_INTERVAL = 0.5
+
 
 async def init_database(
     engine: AsyncEngine,
@@ -20,16 +32,17 @@ async def init_database(
     :param drop:
     :return:
     """
-    async with engine.begin() as conn:
-        if drop:
+    if drop:
+        async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    await upgrade_database(engine)
 
     async with session:
         async with session.begin():
-            query = select(User)
-            users = await session.execute(query)
-            if not users.all():
+            # one index probe, the table may hold millions of users
+            seeded = await session.scalar(select(exists().select_from(User)))
+            if not seeded:
                 user1 = User(name="admin", api_key="admin")
                 user2 = User(name="sf", api_key="test")
                 session.add_all(
@@ -37,7 +50,46 @@ async def init_database(
                         user1,
                         user2,
                         Tweet(
-                            content="first tweet", author_id=1, likes=[user2]
+                            content="first tweet",
+                            author_id=1,
+                            likes=[user2],
+                            like_count=1,
                         ),
                     ]
                 )
+
+
+async def bootstrap_database(
+    engine: AsyncEngine,
+    session_maker: async_sessionmaker,
+) -> None:
+    """
+    Initialize the database holding a PostgreSQL advisory lock.
+
+    Workers starting together initialize the database one at a time;
+    the first one migrates and seeds it, the others find it ready.
+
+    Args:
+        engine (AsyncEngine): engine of the database.
+        session_maker (async_sessionmaker): factory of sessions.
+    """
+    async with engine.connect() as lock_connection:
+        # the lock is polled instead of waited for: a waiting statement
+        # holds a snapshot, and CREATE INDEX CONCURRENTLY run by the lock
+        # owner would wait for it forever
+        while True:
+            locked = await lock_connection.scalar(
+                select(func.pg_try_advisory_lock(BOOTSTRAP_LOCK_ID))
+            )
+            # the lock belongs to the connection, not to its transaction
+            await lock_connection.commit()
+            if locked:
+                break
+            await asyncio.sleep(BOOTSTRAP_POLL_INTERVAL)
+        try:
+            await init_database(engine=engine, session=session_maker())
+        finally:
+            await lock_connection.scalar(
+                select(func.pg_advisory_unlock(BOOTSTRAP_LOCK_ID))
+            )
+            await lock_connection.commit()
@@ -1,11 +1,26 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .database import async_session, engine
-from .init_db import init_database
+from . import schemas
+from .database import async_session, engine, read_engine, warm_up_pool
+from .events import broker
+from .inbox import run_periodically as run_inbox_trimming
+from .init_db import bootstrap_database
+from .media_gc import run_periodically as run_media_gc
+from .media_processing import shutdown_pool
+from .metrics import MetricsMiddleware, get_metrics
+from .profiles import CHANNEL as PROFILES_CHANNEL
+from .profiles import profile_cache
+from .query_stats import QueryStatsMiddleware
+from .routes.health import get_pool_status
+from .routes.health import router as health_routes
 from .routes.media import router as media_routes
 from .routes.tweets import router as tweets_routes
 from .routes.users import router as users_routes
+from .settings import settings
+from .tombstones import run_periodically as run_tombstones_pruning
 
 app = FastAPI()
 
@@ -14,6 +29,7 @@ API_PREFIX = "/api"
 app.include_router(users_routes, prefix=API_PREFIX)
 app.include_router(tweets_routes, prefix=API_PREFIX)
 app.include_router(media_routes, prefix=API_PREFIX)
+app.include_router(health_routes, prefix=API_PREFIX)
 
 ORIGINS = [
     "http://localhost",
@@ -27,10 +43,47 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# the outermost middlewares, so that they measure the whole request
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+# outside of /api, so that they are not published by nginx
+app.add_api_route("/metrics", get_metrics, include_in_schema=False)
+app.add_api_route(
+    "/health/pool",
+    get_pool_status,
+    response_model=schemas.PoolStatus,
+    include_in_schema=False,
+)
 
 
 @app.on_event("startup")
 async def startup():
-    # Инициализация должна выполняться 1 раз в 1 потоке
-    session = async_session()
-    await init_database(engine=engine, session=session)
+    # workers initialize the database one at a time under a lock
+    await bootstrap_database(engine, async_session)
+    await warm_up_pool(engine, settings.db_pool_size)
+    if read_engine is not engine:
+        await warm_up_pool(read_engine, settings.db_pool_size)
+    if settings.media_gc_interval > 0:
+        app.state.media_gc = asyncio.create_task(run_media_gc())
+    if settings.changes_prune_interval > 0:
+        app.state.tombstones_pruning = asyncio.create_task(
+            run_tombstones_pruning()
+        )
+    if settings.inbox_trim_interval > 0:
+        app.state.inbox_trimming = asyncio.create_task(run_inbox_trimming())
+    # follows made by other workers drop the profiles cached here
+    broker.listen(PROFILES_CHANNEL, profile_cache.on_notification)
+    # /api/tweets/stream answers 503 until the broker listens
+    broker.start()
+    app.state.ready = True
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.ready = False
+    for task_name in ("media_gc", "tombstones_pruning", "inbox_trimming"):
+        task = getattr(app.state, task_name, None)
+        if task is not None:
+            task.cancel()
+    await broker.stop()
+    shutdown_pool()
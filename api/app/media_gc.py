@@ -0,0 +1,182 @@
+"""
+Garbage collector of media files not attached to any tweet.
+
+Media are orphaned when an upload is never posted or the tweet is deleted.
+The collector deletes such rows older than a grace period together with
+their files, in small batches with pauses in between.
+
+Usage:
+    python -m app.media_gc
+"""
+
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from typing import NamedTuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .database import async_session
+from .models import Media
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CollectedMedia(NamedTuple):
+    rows: int
+    files: int
+    bytes: int
+
+
+def remove_files(paths: list[str]) -> tuple[int, int]:
+    """
+    Delete files skipping the ones already missing.
+
+    Args:
+        paths (list[str]): paths of the files.
+
+    Returns:
+        tuple[int, int]: number of deleted files and bytes reclaimed.
+    """
+    files = reclaimed = 0
+    for path in paths:
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        files += 1
+        reclaimed += size
+    return files, reclaimed
+
+
+async def collect_batch(
+    session: AsyncSession,
+    grace_period: float,
+    batch_size: int,
+) -> CollectedMedia:
+    """
+    Delete one batch of orphaned media and their files.
+
+    Rows are locked with SKIP LOCKED, so several workers can run the
+    collector at once. A file is kept while another row refers to it,
+    as equal uploads share one file. The check and the removal of files
+    are done under an advisory lock of the path, which create_media
+    takes as well, so an upload never refers to a removed file. If the
+    commit fails, the rows of removed files are deleted by the next run.
+
+    Args:
+        session (AsyncSession): async session instance.
+        grace_period (float): age in seconds of media to collect.
+        batch_size (int): maximum number of rows in the batch.
+
+    Returns:
+        CollectedMedia: number of deleted rows, files and bytes reclaimed.
+    """
+    orphaned = (
+        select(Media.id, Media.path, Media.variants)
+        .where(
+            Media.tweet_id.is_(None),
+            Media.created_at < func.now() - timedelta(seconds=grace_period),
+        )
+        .order_by(Media.created_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    rows = (await session.execute(orphaned)).all()
+    if not rows:
+        await session.rollback()
+        return CollectedMedia(0, 0, 0)
+
+    await session.execute(
+        delete(Media)
+        .where(Media.id.in_([row.id for row in rows]))
+        .execution_options(synchronize_session=False)
+    )
+    paths = {row.path: row.variants or {} for row in rows}
+    # sorted, so that workers take the locks in the same order
+    for path in sorted(paths):
+        await session.execute(
+            select(func.pg_advisory_xact_lock(func.hashtext(path)))
+        )
+    query = select(Media.path).where(Media.path.in_(paths)).distinct()
+    for path in (await session.scalars(query)).all():
+        del paths[path]
+
+    files = [
+        file
+        for path, variants in paths.items()
+        for file in (path, *variants.values())
+    ]
+    deleted, reclaimed = await asyncio.to_thread(remove_files, files)
+    await session.commit()
+    return CollectedMedia(len(rows), deleted, reclaimed)
+
+
+async def collect_media(
+    session: AsyncSession,
+    grace_period: float = settings.media_gc_grace_period,
+    batch_size: int = settings.media_gc_batch_size,
+    pause: float = settings.media_gc_pause,
+) -> CollectedMedia:
+    """
+    Delete orphaned media batch by batch until there are none left.
+
+    Args:
+        session (AsyncSession): async session instance.
+        grace_period (float): age in seconds of media to collect.
+        batch_size (int): maximum number of rows in one transaction.
+        pause (float): pause in seconds between batches.
+
+    Returns:
+        CollectedMedia: number of deleted rows, files and bytes reclaimed.
+    """
+    total = CollectedMedia(0, 0, 0)
+    while True:
+        batch = await collect_batch(session, grace_period, batch_size)
+        total = CollectedMedia(*map(sum, zip(total, batch)))
+        if batch.rows < batch_size:
+            return total
+        await asyncio.sleep(pause)
+
+
+async def run_periodically(
+    session_maker: async_sessionmaker = async_session,
+    interval: float = settings.media_gc_interval,
+) -> None:
+    """
+    Run the collector every interval seconds until cancelled.
+
+    Args:
+        session_maker (async_sessionmaker): factory of sessions.
+        interval (float): pause in seconds between runs.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_maker() as session:
+                collected = await collect_media(session)
+        except Exception:
+            logger.exception("Media garbage collection failed")
+            continue
+        if collected.rows:
+            logger.info(
+                "Media garbage collection: %d rows, %d files, %d bytes",
+                *collected,
+            )
+
+
+async def main() -> None:
+    async with async_session() as session:
+        collected = await collect_media(session)
+    print(
+        f"{collected.rows} media deleted, {collected.files} files "
+        f"and {collected.bytes} bytes reclaimed"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,258 @@
+"""
+Post-processing of uploaded media on a process pool.
+
+After upload the real type of a file is sniffed from its content,
+images are decoded and re-encoded without metadata into a full-size
+copy and downscaled variants; only these copies are published. The
+CPU-bound work runs in worker processes, off the event loop.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageOps
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .dependencies import timeline_cache
+from .models import CHANGE_VERSION, Media, Tweet
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+# maximum side in pixels of every variant, None keeps the size
+VARIANT_SIZES = {"original": None, "thumbnail": 320, "preview": 1280}
+
+# leading bytes of supported formats: mime type and (offset, bytes) pairs
+SIGNATURES = (
+    ("image/jpeg", ((0, b"\xff\xd8\xff"),)),
+    ("image/png", ((0, b"\x89PNG\r\n\x1a\n"),)),
+    ("image/gif", ((0, b"GIF87a"),)),
+    ("image/gif", ((0, b"GIF89a"),)),
+    ("image/webp", ((0, b"RIFF"), (8, b"WEBP"))),
+)
+PIL_FORMATS = {
+    "image/jpeg": "JPEG",
+    "image/png": "PNG",
+    "image/gif": "PNG",
+    "image/webp": "WEBP",
+}
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+_executor: ProcessPoolExecutor | None = None
+_semaphore: asyncio.Semaphore | None = None
+
+
+def sniff_mime_type(header: bytes) -> str | None:
+    """
+    Detect type of a file by its leading bytes.
+
+    Args:
+        header (bytes): first bytes of the file, at least 16.
+
+    Returns:
+        str | None: mime type or None if the type is not supported.
+    """
+    for mime_type, parts in SIGNATURES:
+        if all(
+            header[offset : offset + len(part)] == part
+            for offset, part in parts
+        ):
+            return mime_type
+    return None
+
+
+def process_image(path: str) -> dict:
+    """
+    Validate an image and write its variants next to it.
+
+    Runs in a worker process. Variants are re-encoded from pixels only,
+    so EXIF, GPS and other metadata of the upload are not copied. Every
+    variant is written to a temporary file and renamed in place, so
+    a variant being served is never seen half-written.
+
+    Args:
+        path (str): path of the uploaded file.
+
+    Returns:
+        dict: values of Media columns to update.
+    """
+    with open(path, "rb") as file:
+        mime_type = sniff_mime_type(file.read(16))
+    if mime_type is None:
+        return {"status": "rejected", "mime_type": None}
+
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        with Image.open(path) as image:
+            image = ImageOps.exif_transpose(image)
+            width, height = image.size
+            pil_format = PIL_FORMATS[mime_type]
+            if pil_format == "JPEG" and image.mode != "RGB":
+                image = image.convert("RGB")
+            elif image.mode not in {"RGB", "RGBA"}:
+                image = image.convert("RGBA")
+
+            stem = os.path.splitext(path)[0]
+            variants = {}
+            for name, size in VARIANT_SIZES.items():
+                variant = image.copy()
+                if size is not None:
+                    variant.thumbnail((size, size))
+                variant_path = f"{stem}_{name}{EXTENSIONS[pil_format]}"
+                temp_path = os.path.join(
+                    os.path.dirname(path), f".{uuid.uuid4().hex}.part"
+                )
+                try:
+                    variant.save(temp_path, format=pil_format)
+                    os.replace(temp_path, variant_path)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                variants[name] = variant_path
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        return {"status": "rejected", "mime_type": mime_type}
+
+    return {
+        "status": "ready",
+        "mime_type": mime_type,
+        "width": width,
+        "height": height,
+        "variants": variants,
+    }
+
+
+def start_pool() -> ProcessPoolExecutor:
+    """
+    Create the process pool if it is not running yet.
+
+    Workers are spawned, not forked, so they don't inherit the event loop
+    and open connections of the application.
+
+    Returns:
+        ProcessPoolExecutor: pool of worker processes.
+    """
+    global _executor, _semaphore
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.media_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        # jobs above the number of workers wait here, not in the pool queue
+        _semaphore = asyncio.Semaphore(settings.media_workers)
+    return _executor
+
+
+def shutdown_pool(wait: bool = True) -> None:
+    """
+    Stop the process pool.
+
+    Args:
+        wait (bool): wait for running jobs, False for a broken pool.
+    """
+    global _executor, _semaphore
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
+        _semaphore = None
+
+
+async def run_in_pool(path: str) -> dict:
+    """
+    Process an image in the pool, a failure of the pool fails the media.
+
+    A crashed worker breaks the whole pool, so it is replaced by a new
+    one for the next uploads.
+
+    Args:
+        path (str): path of the uploaded file.
+
+    Returns:
+        dict: values of Media columns to update.
+    """
+    executor = start_pool()
+    try:
+        async with _semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, process_image, path)
+    except BrokenProcessPool:
+        logger.exception("Process pool broke processing %s", path)
+        if _executor is executor:
+            shutdown_pool(wait=False)
+    except Exception:
+        logger.exception("Processing of %s failed", path)
+    return {"status": "failed"}
+
+
+async def process_media(
+    session_maker: async_sessionmaker, media_id: int, path: str
+) -> None:
+    """
+    Process an uploaded file and record the result on its Media row.
+
+    Runs as a background task after the response, so it opens its own
+    session instead of using the one of the request. Media whose file
+    can't be processed are marked as failed and never published.
+
+    Args:
+        session_maker (async_sessionmaker): factory of sessions.
+        media_id (int): ID of the media.
+        path (str): path of the uploaded file.
+    """
+    try:
+        async with session_maker() as db:
+            await record_processing(db, media_id, path)
+    except Exception:
+        logger.exception("Recording of processed media %d failed", media_id)
+
+
+async def record_processing(
+    db: AsyncSession, media_id: int, path: str
+) -> None:
+    status = await db.scalar(select(Media.status).where(Media.id == media_id))
+    if status not in ("pending", "failed"):
+        # the same content was uploaded and processed before
+        return
+
+    # a new row of content processed for another row, e.g. attached to
+    # a tweet, takes its result: the variants are served as immutable
+    # and are not rewritten; a failed one is processed again
+    done = await db.execute(
+        select(
+            Media.status,
+            Media.mime_type,
+            Media.width,
+            Media.height,
+            Media.variants,
+        )
+        .where(Media.path == path, Media.status.in_(("ready", "rejected")))
+        .limit(1)
+    )
+    values = done.mappings().first()
+    if values is not None:
+        values = dict(values)
+    else:
+        values = await run_in_pool(path)
+
+    processed = (
+        update(Media)
+        .where(Media.id == media_id)
+        .values(values)
+        .returning(Media.tweet_id)
+        .cte("processed_media")
+    )
+    # the variants change the tweet the media is already attached to
+    await db.execute(
+        update(Tweet)
+        .where(Tweet.id.in_(select(processed.c.tweet_id)))
+        .values(version=CHANGE_VERSION)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    timeline_cache.clear()
@@ -0,0 +1,203 @@
+"""
+Prometheus metrics of requests, the connection pools and the caches.
+
+Request metrics are updated by MetricsMiddleware, gauges of the pools
+and the caches are refreshed at most once a second and on every scrape.
+With several workers set PROMETHEUS_MULTIPROC_DIR to an empty directory,
+so that /metrics reports the sum of all workers.
+"""
+
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from . import query_stats
+from .cache import CACHES, SingleFlightCache
+from .database import engine, read_engine
+from .events import broker
+
+# label of requests not matched by any route, keeps the label set bounded
+UNMATCHED_ROUTE = "unmatched"
+# seconds between refreshes of the pool and cache gauges by requests
+GAUGES_REFRESH_INTERVAL = 1
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "Handled HTTP requests",
+    ["method", "route", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time of handling HTTP requests",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests being handled",
+    multiprocess_mode="livesum",
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL statements executed per HTTP request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections taken from the pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Connections open above the pool size",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+CACHE_HITS = Gauge(
+    "cache_hits",
+    "Hits of an in-process cache since start",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+CACHE_MISSES = Gauge(
+    "cache_misses",
+    "Misses of an in-process cache since start",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+CACHE_COALESCED = Gauge(
+    "cache_coalesced",
+    "Lookups of an in-process cache joining a running load since start",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+CACHE_HIT_RATIO = Gauge(
+    "cache_hit_ratio",
+    "Share of hits among lookups of an in-process cache",
+    ["cache"],
+    multiprocess_mode="liveall",
+)
+
+EVENT_SUBSCRIBERS = Gauge(
+    "events_subscribers",
+    "Clients of the live event stream",
+    multiprocess_mode="livesum",
+)
+EVENT_DROPPED_SUBSCRIBERS = Gauge(
+    "events_dropped_subscribers",
+    "Clients of the live event stream dropped for being slow since start",
+    multiprocess_mode="livesum",
+)
+
+_gauges_refreshed_at = 0.0
+
+
+def refresh_gauges() -> None:
+    """Copy the state of the pools, caches and events into the gauges."""
+    global _gauges_refreshed_at
+    _gauges_refreshed_at = time.monotonic()
+
+    pools = {"primary": engine}
+    if read_engine is not engine:
+        pools["replica"] = read_engine
+    for name, pool_engine in pools.items():
+        pool = pool_engine.sync_engine.pool
+        POOL_CHECKED_OUT.labels(name).set(pool.checkedout())
+        POOL_OVERFLOW.labels(name).set(max(pool.overflow(), 0))
+
+    for name, cache in CACHES.items():
+        lookups = cache.hits + cache.misses
+        CACHE_HITS.labels(name).set(cache.hits)
+        CACHE_MISSES.labels(name).set(cache.misses)
+        if isinstance(cache, SingleFlightCache):
+            CACHE_COALESCED.labels(name).set(cache.coalesced)
+        CACHE_HIT_RATIO.labels(name).set(
+            cache.hits / lookups if lookups else 0
+        )
+
+    EVENT_SUBSCRIBERS.set(len(broker.subscribers))
+    EVENT_DROPPED_SUBSCRIBERS.set(broker.dropped)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware measuring every HTTP request.
+
+    Requests are labelled by the path template of the matched route,
+    e.g. /api/users/{id}, so that the number of series stays bounded.
+    A live event stream is measured until its response starts: it stays
+    open for as long as the client listens and is counted by
+    events_subscribers instead.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        duration = None
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code, duration
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                content_type = Headers(raw=message["headers"]).get(
+                    "content-type", ""
+                )
+                if content_type.startswith("text/event-stream"):
+                    duration = time.perf_counter() - start
+                    REQUESTS_IN_FLIGHT.dec()
+            await send(message)
+
+        start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if duration is None:
+                REQUESTS_IN_FLIGHT.dec()
+                duration = time.perf_counter() - start
+            # the router puts the matched route into the scope
+            route = scope.get("route")
+            path = getattr(route, "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            REQUESTS.labels(method, path, status_code).inc()
+            REQUEST_DURATION.labels(method, path).observe(duration)
+            # counted by QueryStatsMiddleware wrapping this one
+            stats = query_stats.get_current()
+            if stats is not None:
+                REQUEST_QUERIES.labels(method, path).observe(stats.count)
+            if (
+                time.monotonic() - _gauges_refreshed_at
+                > GAUGES_REFRESH_INTERVAL
+            ):
+                refresh_gauges()
+
+
+async def get_metrics(request: Request) -> Response:
+    refresh_gauges()
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,139 @@
+"""
+Versioned migrations of the database schema.
+
+Migrations are kept in app/migrations and applied on startup.
+Databases created by create_all before migrations existed are stamped
+with the baseline revision and upgraded from it.
+
+Usage:
+    python -m app.migrate upgrade
+    python -m app.migrate check
+"""
+
+import asyncio
+import os
+import sys
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import models  # noqa: F401 tables are registered on import
+from .database import Base, engine
+
+target_metadata = Base.metadata
+
+# revision of the schema made by create_all before migrations existed
+BASELINE_REVISION = "0001"
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+
+def make_config(connection: Connection | None = None) -> Config:
+    """
+    Create alembic config running migrations on the connection.
+
+    Args:
+        connection (Connection | None): connection to run on, a new one
+            to DATABASE_URL is opened if None.
+
+    Returns:
+        Config: alembic config.
+    """
+    config = Config()
+    config.set_main_option("script_location", MIGRATIONS_DIR)
+    config.attributes["target_metadata"] = target_metadata
+    config.attributes["connection"] = connection
+    return config
+
+
+def upgrade(connection: Connection, revision: str = "head") -> None:
+    """
+    Apply migrations up to the revision, stamping a legacy database first.
+
+    Args:
+        connection (Connection): connection to the database.
+        revision (str): target revision.
+    """
+    config = make_config(connection)
+    inspector = inspect(connection)
+    legacy = inspector.has_table("users") and not inspector.has_table(
+        "alembic_version"
+    )
+    # alembic has to begin transactions itself to leave them for
+    # CREATE INDEX CONCURRENTLY
+    connection.commit()
+    if legacy:
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, revision)
+
+
+def check(connection: Connection) -> list[str]:
+    """
+    Compare the live schema with the migrations and the models.
+
+    Args:
+        connection (Connection): connection to the database.
+
+    Returns:
+        list[str]: found differences, empty if the schema is up to date.
+    """
+    context = MigrationContext.configure(connection)
+    head = ScriptDirectory.from_config(make_config()).get_current_head()
+    current = context.get_current_revision()
+    problems = []
+    if current != head:
+        problems.append(f"revision {current} is applied, head is {head}")
+    problems.extend(
+        str(diff) for diff in compare_metadata(context, target_metadata)
+    )
+    return problems
+
+
+async def upgrade_database(db_engine: AsyncEngine = engine) -> None:
+    """
+    Apply all pending migrations.
+
+    Args:
+        db_engine (AsyncEngine): engine of the database.
+    """
+    async with db_engine.connect() as connection:
+        await connection.run_sync(upgrade)
+        await connection.commit()
+
+
+async def check_database(db_engine: AsyncEngine = engine) -> list[str]:
+    """
+    Compare the live schema with the migrations and the models.
+
+    Args:
+        db_engine (AsyncEngine): engine of the database.
+
+    Returns:
+        list[str]: found differences, empty if the schema is up to date.
+    """
+    async with db_engine.connect() as connection:
+        return await connection.run_sync(check)
+
+
+async def main(action: str) -> int:
+    if action == "upgrade":
+        await upgrade_database()
+        return 0
+
+    problems = await check_database()
+    for problem in problems:
+        print(problem)
+    if not problems:
+        print("Schema matches the models")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] not in (["upgrade"], ["check"]):
+        sys.exit(__doc__)
+    sys.exit(asyncio.run(main(sys.argv[1])))
@@ -0,0 +1,76 @@
+"""Baseline schema created by create_all before migrations
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+SEQUENCES = ("user_id_seq", "media_id_seq", "tweet_id_seq")
+
+
+def upgrade() -> None:
+    for name in SEQUENCES:
+        op.execute(sa.schema.CreateSequence(sa.Sequence(name)))
+
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("api_key", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("api_key"),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_table(
+        "associated_followers",
+        sa.Column("follower_id", sa.Integer(), nullable=False),
+        sa.Column("following_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["follower_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["following_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("follower_id", "following_id"),
+    )
+    op.create_table(
+        "tweets",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("content", sa.TEXT(), nullable=False),
+        sa.Column("attachments", sa.ARRAY(sa.String()), nullable=False),
+        sa.Column("author_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["author_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tweets_id", "tweets", ["id"])
+    op.create_table(
+        "associated_likes",
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("tweet_id", "user_id"),
+    )
+    op.create_table(
+        "medias",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_medias_id", "medias", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("medias")
+    op.drop_table("associated_likes")
+    op.drop_table("tweets")
+    op.drop_table("associated_followers")
+    op.drop_table("users")
+    for name in SEQUENCES:
+        op.execute(sa.schema.DropSequence(sa.Sequence(name)))
@@ -0,0 +1,150 @@
+"""Denormalized counters, timeline inbox, media metadata and FK cascades
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# (table, column, referred table, ON DELETE action)
+FOREIGN_KEYS = (
+    ("associated_followers", "follower_id", "users", "CASCADE"),
+    ("associated_followers", "following_id", "users", "CASCADE"),
+    ("associated_likes", "tweet_id", "tweets", "CASCADE"),
+    ("associated_likes", "user_id", "users", "CASCADE"),
+    ("medias", "tweet_id", "tweets", "SET NULL"),
+)
+
+
+def replace_foreign_keys(on_delete: bool) -> None:
+    # the new keys are added NOT VALID, so only the catalog is changed
+    # under the lock; they are checked by VALIDATE after the commit,
+    # which does not block writes
+    for table, column, referred, action in FOREIGN_KEYS:
+        name = f"{table}_{column}_fkey"
+        action = f" ON DELETE {action}" if on_delete else ""
+        op.drop_constraint(name, table, type_="foreignkey")
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} "
+            f"FOREIGN KEY ({column}) REFERENCES {referred} (id){action} "
+            "NOT VALID"
+        )
+    with op.get_context().autocommit_block():
+        for table, column, _, _ in FOREIGN_KEYS:
+            op.execute(
+                f"ALTER TABLE {table} "
+                f"VALIDATE CONSTRAINT {table}_{column}_fkey"
+            )
+
+
+def upgrade() -> None:
+    # columns with constant defaults are added without rewriting tables
+    op.add_column(
+        "users",
+        sa.Column(
+            "follower_count", sa.Integer(), server_default="0", nullable=False
+        ),
+    )
+    op.add_column(
+        "users",
+        sa.Column(
+            "following_count", sa.Integer(), server_default="0", nullable=False
+        ),
+    )
+    op.add_column(
+        "tweets",
+        sa.Column(
+            "like_count", sa.Integer(), server_default="0", nullable=False
+        ),
+    )
+    op.add_column("medias", sa.Column("checksum", sa.String(64)))
+    op.add_column("medias", sa.Column("size", sa.Integer()))
+    op.add_column(
+        "medias",
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+    )
+    op.add_column(
+        "medias",
+        sa.Column(
+            "status", sa.String(16), server_default="pending", nullable=False
+        ),
+    )
+    op.add_column("medias", sa.Column("mime_type", sa.String(64)))
+    op.add_column("medias", sa.Column("width", sa.Integer()))
+    op.add_column("medias", sa.Column("height", sa.Integer()))
+    op.add_column("medias", sa.Column("variants", postgresql.JSONB()))
+
+    op.create_table(
+        "timeline_inbox",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(
+            ["tweet_id"], ["tweets.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("user_id", "tweet_id"),
+    )
+
+    # counters of existing rows, app.counters does the same in batches
+    op.execute(
+        "UPDATE tweets SET like_count = (SELECT count(*) FROM associated_likes"
+        " WHERE associated_likes.tweet_id = tweets.id)"
+        " WHERE EXISTS (SELECT 1 FROM associated_likes"
+        " WHERE associated_likes.tweet_id = tweets.id)"
+    )
+    op.execute(
+        "UPDATE users SET"
+        " follower_count = (SELECT count(*) FROM associated_followers"
+        " WHERE associated_followers.following_id = users.id),"
+        " following_count = (SELECT count(*) FROM associated_followers"
+        " WHERE associated_followers.follower_id = users.id)"
+        " WHERE EXISTS (SELECT 1 FROM associated_followers"
+        " WHERE users.id IN (follower_id, following_id))"
+    )
+    # recent tweets of followed authors, as backfill_inbox does on a follow;
+    # the limits are the values of FANOUT_FOLLOWERS_LIMIT and
+    # INBOX_BACKFILL_SIZE at the time of the migration
+    op.execute(
+        "INSERT INTO timeline_inbox (user_id, tweet_id)"
+        " SELECT associated_followers.follower_id, recent.id"
+        " FROM associated_followers"
+        " JOIN users ON users.id = associated_followers.following_id"
+        " CROSS JOIN LATERAL (SELECT tweets.id FROM tweets"
+        " WHERE tweets.author_id = associated_followers.following_id"
+        " ORDER BY tweets.id DESC LIMIT 50) AS recent"
+        " WHERE users.follower_count < 1000"
+    )
+
+    replace_foreign_keys(on_delete=True)
+
+
+def downgrade() -> None:
+    replace_foreign_keys(on_delete=False)
+    op.drop_table("timeline_inbox")
+    for column in (
+        "variants",
+        "height",
+        "width",
+        "mime_type",
+        "status",
+        "created_at",
+        "size",
+        "checksum",
+    ):
+        op.drop_column("medias", column)
+    op.drop_column("tweets", "like_count")
+    op.drop_column("users", "following_count")
+    op.drop_column("users", "follower_count")
@@ -0,0 +1,70 @@
+"""Indexes of hot access paths built concurrently
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# name, table, columns and options of create_index
+INDEXES = (
+    # tweets of an author, also used by their tweets.author_id lookups
+    ("ix_tweets_author_id_id", "tweets", ["author_id", "id"], {}),
+    ("ix_medias_tweet_id", "medias", ["tweet_id"], {}),
+    ("ix_medias_checksum", "medias", ["checksum"], {}),
+    (
+        "ix_medias_orphaned_created_at",
+        "medias",
+        ["created_at"],
+        {"postgresql_where": sa.text("tweet_id IS NULL")},
+    ),
+    ("ix_associated_likes_user_id", "associated_likes", ["user_id"], {}),
+    (
+        "ix_associated_followers_following_id",
+        "associated_followers",
+        ["following_id"],
+        {},
+    ),
+    ("ix_timeline_inbox_tweet_id", "timeline_inbox", ["tweet_id"], {}),
+)
+
+
+def index_state(name: str) -> bool | None:
+    """Return True for a valid index, False for a broken one, else None."""
+    return op.get_bind().scalar(
+        sa.text(
+            "SELECT indisvalid FROM pg_index"
+            " WHERE indexrelid = to_regclass(:name)"
+        ),
+        {"name": name},
+    )
+
+
+def upgrade() -> None:
+    # CONCURRENTLY does not block writes but can't run in a transaction;
+    # a build interrupted before leaves an invalid index, it is rebuilt
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            state = index_state(name)
+            if state:
+                continue
+            if state is False:
+                op.drop_index(name, table, postgresql_concurrently=True)
+            op.create_index(
+                name, table, columns, postgresql_concurrently=True, **options
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in INDEXES:
+            op.drop_index(
+                name, table, postgresql_concurrently=True, if_exists=True
+            )
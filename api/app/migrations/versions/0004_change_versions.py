@@ -0,0 +1,80 @@
+"""Change versions of tweets, tombstones of deleted tweets
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 12:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+CURRENT_CHANGE_VERSION = sa.text("pg_current_xact_id()::text::bigint")
+
+
+def upgrade() -> None:
+    # existing tweets get version 0 without evaluating the default per row,
+    # which would rewrite the table
+    for column in ("created_version", "version"):
+        op.add_column(
+            "tweets",
+            sa.Column(
+                column, sa.BigInteger(), nullable=False, server_default="0"
+            ),
+        )
+        op.alter_column(
+            "tweets", column, server_default=CURRENT_CHANGE_VERSION
+        )
+    op.create_table(
+        "tweet_tombstones",
+        sa.Column("tweet_id", sa.Integer(), autoincrement=False),
+        sa.Column(
+            "version",
+            sa.BigInteger(),
+            nullable=False,
+            server_default=CURRENT_CHANGE_VERSION,
+        ),
+        sa.Column(
+            "deleted_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+        sa.PrimaryKeyConstraint("tweet_id"),
+    )
+    op.create_index(
+        "ix_tweet_tombstones_version", "tweet_tombstones", ["version"]
+    )
+    op.create_table(
+        "change_horizon",
+        sa.Column("id", sa.Integer(), autoincrement=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # the index of a big table is built without blocking writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tweets_version",
+            "tweets",
+            ["version"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_tweets_version",
+            "tweets",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_table("change_horizon")
+    op.drop_index("ix_tweet_tombstones_version", "tweet_tombstones")
+    op.drop_table("tweet_tombstones")
+    op.drop_column("tweets", "version")
+    op.drop_column("tweets", "created_version")
@@ -0,0 +1,31 @@
+"""Change versions of users
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 15:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+CURRENT_CHANGE_VERSION = sa.text("pg_current_xact_id()::text::bigint")
+
+
+def upgrade() -> None:
+    # existing users get version 0 without rewriting the table
+    op.add_column(
+        "users",
+        sa.Column(
+            "version", sa.BigInteger(), nullable=False, server_default="0"
+        ),
+    )
+    op.alter_column("users", "version", server_default=CURRENT_CHANGE_VERSION)
+
+
+def downgrade() -> None:
+    op.drop_column("users", "version")
@@ -0,0 +1,59 @@
+"""Fan-out mode recorded on tweets
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 18:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+# FANOUT_FOLLOWERS_LIMIT at the time of the migration
+FANOUT_FOLLOWERS_LIMIT = 1000
+
+
+def upgrade() -> None:
+    # existing tweets of most authors are in the inboxes already: they
+    # get true without rewriting the table, only tweets of authors over
+    # the limit are updated
+    op.add_column(
+        "tweets",
+        sa.Column(
+            "fanned_out",
+            sa.Boolean(),
+            nullable=False,
+            server_default=sa.true(),
+        ),
+    )
+    op.alter_column("tweets", "fanned_out", server_default=sa.false())
+    op.execute(
+        sa.text(
+            "UPDATE tweets SET fanned_out = false FROM users"
+            " WHERE users.id = tweets.author_id"
+            " AND users.follower_count >= :limit"
+        ).bindparams(limit=FANOUT_FOLLOWERS_LIMIT)
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tweets_pulled",
+            "tweets",
+            ["author_id", "id"],
+            postgresql_where=sa.text("NOT fanned_out"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_tweets_pulled",
+            "tweets",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column("tweets", "fanned_out")
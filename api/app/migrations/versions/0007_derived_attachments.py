@@ -0,0 +1,37 @@
+"""Attachments of tweets derived from their media
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 20:00:00
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # paths are listed from the published media of a tweet at read time
+    op.drop_column("tweets", "attachments")
+
+
+def downgrade() -> None:
+    op.add_column(
+        "tweets",
+        sa.Column(
+            "attachments",
+            sa.ARRAY(sa.String()),
+            nullable=False,
+            server_default="{}",
+        ),
+    )
+    op.execute(
+        "UPDATE tweets SET attachments = paths.list FROM ("
+        " SELECT tweet_id, array_agg(path ORDER BY id) AS list FROM medias"
+        " WHERE tweet_id IS NOT NULL AND status <> 'rejected'"
+        " GROUP BY tweet_id) AS paths WHERE paths.tweet_id = tweets.id"
+    )
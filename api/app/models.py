@@ -1,23 +1,48 @@
 from sqlalchemy import (
-    ARRAY,
     TEXT,
+    BigInteger,
     Column,
+    DateTime,
     ForeignKey,
+    Index,
     Integer,
     Sequence,
     String,
     Table,
+    and_,
+    func,
+    literal_column,
+    or_,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
 
-# Рассмотреть необходимость миграции моделей
+# version of changes made by the current transaction: its 64-bit ID,
+# compared with snapshots to find changes committed since a client synced
+CURRENT_CHANGE_VERSION = "pg_current_xact_id()::text::bigint"
+CHANGE_VERSION = literal_column(CURRENT_CHANGE_VERSION, BigInteger)
+
 associated_followers = Table(
     "associated_followers",
     Base.metadata,
-    Column("follower_id", Integer, ForeignKey("users.id"), primary_key=True),
-    Column("following_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column(
+        "follower_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "following_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    # followers of a user, the primary key covers the followed users
+    Index("ix_associated_followers_following_id", "following_id"),
 )
 
 
@@ -29,12 +54,19 @@ class User(Base):
     )
     name: Mapped[str] = mapped_column(nullable=False)
     api_key: Mapped[str] = mapped_column(nullable=False, unique=True)
+    follower_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    following_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    # version of the last change of the profile, e.g. of a follow
+    version: Mapped[int] = mapped_column(
+        BigInteger, server_default=text(CURRENT_CHANGE_VERSION)
+    )
     followers = relationship(
         "User",
         secondary=associated_followers,
         primaryjoin="User.id==associated_followers.c.following_id",
         secondaryjoin="User.id==associated_followers.c.follower_id",
         back_populates="following",
+        passive_deletes=True,
     )
     following = relationship(
         "User",
@@ -42,6 +74,7 @@ class User(Base):
         primaryjoin="User.id==associated_followers.c.follower_id",
         secondaryjoin="User.id==associated_followers.c.following_id",
         back_populates="followers",
+        passive_deletes=True,
     )
 
     def __repr__(self):
@@ -51,19 +84,137 @@ class User(Base):
 associated_likes = Table(
     "associated_likes",
     Base.metadata,
-    Column("tweet_id", Integer, ForeignKey("tweets.id"), primary_key=True),
-    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column(
+        "tweet_id",
+        Integer,
+        ForeignKey("tweets.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "user_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    # tweets liked by a user and cascades on deletion of users
+    Index("ix_associated_likes_user_id", "user_id"),
+)
+
+
+# Входящие ленты: id твитов, разосланных подписчикам при публикации
+timeline_inbox = Table(
+    "timeline_inbox",
+    Base.metadata,
+    Column(
+        "user_id",
+        Integer,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "tweet_id",
+        Integer,
+        ForeignKey("tweets.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    # cascades on deletion of tweets
+    Index("ix_timeline_inbox_tweet_id", "tweet_id"),
+)
+
+
+# Удаленные твиты: клиенты удаляют их из ленты при синхронизации
+tweet_tombstones = Table(
+    "tweet_tombstones",
+    Base.metadata,
+    Column("tweet_id", Integer, primary_key=True, autoincrement=False),
+    Column(
+        "version",
+        BigInteger,
+        nullable=False,
+        server_default=text(CURRENT_CHANGE_VERSION),
+        index=True,
+    ),
+    Column(
+        "deleted_at",
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+    ),
+)
+
+
+# Версия, до которой удалены старые записи tweet_tombstones;
+# клиенты, синхронизированные раньше, загружают ленту заново
+change_horizon = Table(
+    "change_horizon",
+    Base.metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("version", BigInteger, nullable=False),
 )
 
 
 class Media(Base):
     __tablename__ = "medias"
+    __table_args__ = (
+        # unattached media checked by the garbage collector
+        Index(
+            "ix_medias_orphaned_created_at",
+            "created_at",
+            postgresql_where=text("tweet_id IS NULL"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(
         Sequence("media_id_seq"), primary_key=True, index=True
     )
     path: Mapped[str] = mapped_column(nullable=False)
-    tweet_id = Column(Integer, ForeignKey("tweets.id"))
+    # SHA-256 of the content, the file is stored under this name
+    checksum: Mapped[str | None] = mapped_column(String(64), index=True)
+    size: Mapped[int | None]
+    # media of a deleted tweet stay for the garbage collector
+    tweet_id = Column(
+        Integer, ForeignKey("tweets.id", ondelete="SET NULL"), index=True
+    )
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    # set by the background processing: pending, ready, rejected or
+    # failed if the processing broke, the next upload retries it
+    status: Mapped[str] = mapped_column(
+        String(16), default="pending", server_default="pending"
+    )
+    mime_type: Mapped[str | None] = mapped_column(String(64))
+    width: Mapped[int | None]
+    height: Mapped[int | None]
+    # paths of copies without metadata by variant name: the full-size
+    # original and downscaled ones
+    variants: Mapped[dict[str, str] | None] = mapped_column(JSONB)
+
+    @hybrid_property
+    def published(self) -> bool:
+        # uploads are shown once stripped of metadata; media uploaded
+        # before processing existed (without a checksum) are shown as is
+        return self.status == "ready" or (
+            self.status == "pending" and self.checksum is None
+        )
+
+    @published.inplace.expression
+    @classmethod
+    def _published_expression(cls):
+        return or_(
+            cls.status == "ready",
+            and_(cls.status == "pending", cls.checksum.is_(None)),
+        )
+
+    @property
+    def variant_paths(self) -> dict[str, str]:
+        variants = self.variants or {}
+        original = variants.get("original", self.path)
+        return {
+            "original": original,
+            "thumbnail": variants.get("thumbnail", original),
+            "preview": variants.get("preview", original),
+        }
 
     def __repr__(self):
         return f"Media {self.path}"
@@ -71,21 +222,55 @@ class Media(Base):
 
 class Tweet(Base):
     __tablename__ = "tweets"
+    __table_args__ = (
+        Index("ix_tweets_author_id_id", "author_id", "id"),
+        # tweets merged into home feeds at read time
+        Index(
+            "ix_tweets_pulled",
+            "author_id",
+            "id",
+            postgresql_where=text("NOT fanned_out"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(
         Sequence("tweet_id_seq"), primary_key=True, index=True
     )
     content: Mapped[str] = mapped_column(TEXT, nullable=False)
 
-    medias = relationship("Media", backref="tweets")
-    attachments: Mapped[list[str]] = mapped_column(ARRAY(String), default=[])
+    # rows of deleted tweets are handled by foreign keys in the database
+    medias = relationship("Media", backref="tweets", passive_deletes=True)
     author_id = Column(Integer, ForeignKey("users.id"))
     author = relationship("User", backref="tweets")
     likes = relationship(
         "User",
         secondary=associated_likes,
         backref="likes",
+        order_by="User.id",
+        passive_deletes=True,
+    )
+    like_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    # copied into the inboxes of followers on creation, otherwise merged
+    # into home feeds at read time for good
+    fanned_out: Mapped[bool] = mapped_column(
+        default=False, server_default=text("false")
+    )
+    # versions of the creation and of the last change, e.g. of like_count
+    created_version: Mapped[int] = mapped_column(
+        BigInteger, server_default=text(CURRENT_CHANGE_VERSION)
     )
+    version: Mapped[int] = mapped_column(
+        BigInteger, server_default=text(CURRENT_CHANGE_VERSION), index=True
+    )
+
+    @property
+    def attachment_variants(self) -> list[dict[str, str]]:
+        medias = sorted(self.medias, key=lambda media: media.id)
+        return [media.variant_paths for media in medias if media.published]
+
+    @property
+    def attachments(self) -> list[str]:
+        return [variants["original"] for variants in self.attachment_variants]
 
     def __repr__(self):
         return f"Tweet {self.id}"
@@ -0,0 +1,193 @@
+"""
+Cache of serialized user profiles.
+
+Profiles change only on follow and unfollow, so the responses of
+/api/users/{id} are kept in an in-process LRU in front of an optional
+shared backend. A cached profile is served only if its ETag equals the
+one made from the version of the user just read by the request, so
+a profile loaded from a lagging replica is never served to a reader
+of a newer version. A write drops both users from the cache of its
+worker and from the backend, and notifies the other workers by
+PostgreSQL NOTIFY to drop them from their in-process caches.
+"""
+
+import functools
+import time
+from typing import Awaitable, Callable
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import SingleFlightCache
+from .settings import settings
+
+CHANNEL = "profile_changes"
+
+# ETag and JSON of a profile
+Profile = tuple[str, bytes]
+
+
+async def publish_invalidation(db: AsyncSession, *user_ids: int) -> None:
+    """
+    Tell all workers to drop the profiles when the transaction commits.
+
+    Args:
+        db (AsyncSession): session of the writing transaction.
+        user_ids (int): IDs of the changed users.
+    """
+    payload = ",".join(str(user_id) for user_id in user_ids)
+    await db.execute(select(func.pg_notify(CHANNEL, payload)))
+
+
+class MemoryBackend:
+    """
+    Shared backend kept in memory of the process, a fake for tests.
+
+    A real shared store, e.g. Redis, is plugged in by an object with
+    the same coroutine methods.
+    """
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[float, bytes]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+
+class ProfileCache:
+    """
+    Two-tier cache of profiles: in-process LRU and a shared backend.
+
+    An entry stored in the backend by a load racing with a write in
+    another worker lives there at most ttl seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, backend=None) -> None:
+        """
+        Create an empty cache.
+
+        Args:
+            maxsize (int): maximum number of profiles in the process.
+            ttl (float): time to live of a profile in seconds.
+            backend: shared backend like MemoryBackend, None to keep
+                profiles in the process only.
+        """
+        self.local = SingleFlightCache("profiles", maxsize=maxsize, ttl=ttl)
+        self.backend = backend
+        self.ttl = ttl
+        # bumped by invalidations so that running loads aren't shared
+        self._generation = 0
+
+    async def get_or_load(
+        self,
+        user_id: int,
+        etag: str,
+        load: Callable[[], Awaitable[Profile | None]],
+    ) -> Profile | None:
+        """
+        Return a cached profile or load it once for concurrent callers.
+
+        A profile cached with another ETag is dropped and loaded again.
+
+        Args:
+            user_id (int): ID of the user.
+            etag (str): current ETag of the profile.
+            load (Callable[[], Awaitable[Profile | None]]): coroutine
+                function loading the profile from the database.
+
+        Returns:
+            Profile | None: ETag and JSON of the profile or None if there
+                is no such user.
+        """
+        load_shared = functools.partial(self._load_shared, user_id, etag, load)
+        profile = await self.local.get_or_load(user_id, load_shared)
+        if profile is not None and profile[0] != etag:
+            # a load of another version, this one is not cached
+            self.local.invalidate(user_id)
+            profile = await load_shared()
+        return profile
+
+    async def _load_shared(
+        self,
+        user_id: int,
+        etag: str,
+        load: Callable[[], Awaitable[Profile | None]],
+    ) -> Profile | None:
+        if self.backend is not None:
+            packed = await self.backend.get(get_key(user_id))
+            if packed is not None:
+                cached_etag, content = packed.split(b"\n", 1)
+                if cached_etag.decode() == etag:
+                    return etag, content
+
+        generation = self._generation
+        profile = await load()
+        if (
+            profile is not None
+            and self.backend is not None
+            and generation == self._generation
+        ):
+            etag, content = profile
+            await self.backend.set(
+                get_key(user_id), etag.encode() + b"\n" + content, self.ttl
+            )
+        return profile
+
+    async def invalidate(self, *user_ids: int) -> None:
+        """
+        Drop the profiles from the process and from the shared backend.
+
+        Args:
+            user_ids (int): IDs of the changed users.
+        """
+        self.invalidate_local(*user_ids)
+        if self.backend is not None:
+            await self.backend.delete(*map(get_key, user_ids))
+
+    def invalidate_local(self, *user_ids: int) -> None:
+        """
+        Drop the profiles from the process only.
+
+        Args:
+            user_ids (int): IDs of the changed users.
+        """
+        self._generation += 1
+        for user_id in user_ids:
+            self.local.invalidate(user_id)
+
+    def clear(self) -> None:
+        """Drop all profiles of the process."""
+        self._generation += 1
+        self.local.clear()
+
+    def on_notification(self, payload: str | None) -> None:
+        """
+        Drop the profiles changed by another worker.
+
+        Args:
+            payload (str | None): comma-separated IDs of the users, None
+                if notifications may have been lost.
+        """
+        if payload is None:
+            self.clear()
+        else:
+            self.invalidate_local(*map(int, payload.split(",")))
+
+
+def get_key(user_id: int) -> str:
+    return f"profile:{user_id}"
+
+
+profile_cache = ProfileCache(
+    maxsize=settings.profile_cache_size, ttl=settings.profile_cache_ttl
+)
@@ -0,0 +1,145 @@
+"""
+Counting of SQL statements executed while handling a request.
+
+QueryStatsMiddleware reports the number of statements and the time spent
+in the database in the Server-Timing header and in the log.
+"""
+
+import dataclasses
+import logging
+import time
+from contextvars import ContextVar, Token
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class QueryStats:
+    """Statements executed in one request."""
+
+    count: int = 0
+    duration: float = 0
+
+    def server_timing(self) -> str:
+        """
+        Format the statistics as an entry of Server-Timing header.
+
+        Returns:
+            str: entry with the number of statements and time in ms.
+        """
+        return f'db;desc="{self.count} queries";dur={self.duration * 1000:.2f}'
+
+
+_current: ContextVar[QueryStats | None] = ContextVar(
+    "query_stats", default=None
+)
+
+
+def start_request() -> tuple[QueryStats, Token]:
+    """
+    Start counting statements of the current request.
+
+    The counter is kept in a context variable, so it is seen by the code
+    of the request only, including sessions and engines it uses.
+
+    Returns:
+        tuple[QueryStats, Token]: counter and token for finish_request.
+    """
+    stats = QueryStats()
+    return stats, _current.set(stats)
+
+
+def finish_request(token: Token) -> None:
+    """
+    Stop counting statements of the current request.
+
+    Args:
+        token (Token): token returned by start_request.
+    """
+    _current.reset(token)
+
+
+def get_current() -> QueryStats | None:
+    """
+    Return the counter of the current request.
+
+    Returns:
+        QueryStats | None: counter or None outside of a request.
+    """
+    return _current.get()
+
+
+# listen to every engine, including the sync engines of async ones
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement(conn, cursor, statement, parameters, context, many):
+    if _current.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def finish_statement(conn, cursor, statement, parameters, context, many):
+    stats = _current.get()
+    starts = conn.info.get("query_start")
+    if stats is None or not starts:
+        return
+    stats.count += 1
+    stats.duration += time.perf_counter() - starts.pop()
+
+
+@event.listens_for(Engine, "handle_error")
+def drop_failed_statement(context):
+    # after_cursor_execute is not called for a failed statement
+    connection = context.connection
+    if connection is not None and connection.info.get("query_start"):
+        connection.info["query_start"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.count += 1
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware counting SQL statements of every HTTP request.
+
+    Statements executed before the response starts are reported in
+    the Server-Timing header; all of them are logged at the end.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats, token = start_request()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("server-timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            finish_request(token)
+            level = logging.DEBUG
+            if stats.count > settings.request_query_budget:
+                level = logging.WARNING
+            logger.log(
+                level,
+                "%s %s: %d queries in %.2f ms",
+                scope["method"],
+                scope["path"],
+                stats.count,
+                stats.duration * 1000,
+            )
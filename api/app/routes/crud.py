@@ -1,47 +1,243 @@
-from sqlalchemy import select
+from sqlalchemy import (
+    CTE,
+    BigInteger,
+    Select,
+    Text,
+    Update,
+    case,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    literal_column,
+    select,
+    true,
+    union,
+    update,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from .. import schemas
-from ..models import Media, Tweet, User
+from ..dependencies import timeline_cache
+from ..events import publish
+from ..models import (
+    CHANGE_VERSION,
+    Media,
+    Tweet,
+    User,
+    associated_followers,
+    associated_likes,
+    change_horizon,
+    timeline_inbox,
+    tweet_tombstones,
+)
+from ..profiles import profile_cache, publish_invalidation
+
+# tweets of authors with more followers are not fanned out on write,
+# they are merged into home feeds at read time
+FANOUT_FOLLOWERS_LIMIT = 1000
+# number of recent tweets copied into the inbox on a new follow
+INBOX_BACKFILL_SIZE = 50
+
+# number of likes, followers and followings shown along with their counts
+PREVIEW_SIZE = 100
+
+# changes of tweets returned at once, a client that missed more resyncs
+CHANGES_LIMIT = 500
+
+EMPTY_JSON_ARRAY = literal_column("'[]'::json")
+
+
+def select_follower_count(user_id: int):
+    return (
+        select(User.follower_count).where(User.id == user_id).scalar_subquery()
+    )
 
 
-async def get_user_by_id(
-    db: AsyncSession,
-    user_id: int,
-) -> User | None:
-    query = (
-        select(User)
-        .where(User.id == user_id)
-        .options(selectinload(User.followers), selectinload(User.following))
+async def fan_out_tweet(db: AsyncSession, author_id: int, tweet_id: int):
+    followers = select(
+        associated_followers.c.follower_id, literal(tweet_id)
+    ).where(
+        associated_followers.c.following_id == author_id,
+        select(Tweet.fanned_out).where(Tweet.id == tweet_id).scalar_subquery(),
+    )
+    await db.execute(
+        insert(timeline_inbox).from_select(["user_id", "tweet_id"], followers)
     )
-    result = await db.execute(query)
-    return result.scalar()
+
+
+async def backfill_inbox(db: AsyncSession, user_id: int, author_id: int):
+    recent_tweets = (
+        select(literal(user_id), Tweet.id)
+        .where(Tweet.author_id == author_id, Tweet.fanned_out)
+        .order_by(Tweet.id.desc())
+        .limit(INBOX_BACKFILL_SIZE)
+    )
+    await db.execute(
+        insert(timeline_inbox).from_select(
+            ["user_id", "tweet_id"], recent_tweets
+        )
+    )
+
+
+async def purge_inbox(db: AsyncSession, user_id: int, author_id: int):
+    await db.execute(
+        delete(timeline_inbox).where(
+            timeline_inbox.c.user_id == user_id,
+            timeline_inbox.c.tweet_id.in_(
+                select(Tweet.id).where(Tweet.author_id == author_id)
+            ),
+        )
+    )
+
+
+async def rebuild_inbox(db: AsyncSession):
+    # every follow backfilled at once, e.g. after bulk loading of data
+    recent_tweets = (
+        select(Tweet.id)
+        .where(
+            Tweet.author_id == associated_followers.c.following_id,
+            Tweet.fanned_out,
+        )
+        .order_by(Tweet.id.desc())
+        .limit(INBOX_BACKFILL_SIZE)
+        .lateral("recent_tweets")
+    )
+    inbox = select(
+        associated_followers.c.follower_id, recent_tweets.c.id
+    ).join(recent_tweets, true())
+    await db.execute(delete(timeline_inbox))
+    await db.execute(
+        insert(timeline_inbox).from_select(["user_id", "tweet_id"], inbox)
+    )
+
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> User | None:
+    return await db.get(User, user_id)
+
+
+async def load_user_preview(db: AsyncSession, user: User) -> User:
+    user_id = user.id
+    # only the first entries of the lists are shown, the counters hold totals
+    for attribute, own_column, other_column in (
+        (
+            "followers",
+            associated_followers.c.following_id,
+            associated_followers.c.follower_id,
+        ),
+        (
+            "following",
+            associated_followers.c.follower_id,
+            associated_followers.c.following_id,
+        ),
+    ):
+        query = (
+            select(User)
+            .join(associated_followers, other_column == User.id)
+            .where(own_column == user_id)
+            .order_by(User.id)
+            .limit(PREVIEW_SIZE)
+        )
+        result = await db.execute(query)
+        set_committed_value(user, attribute, result.scalars().all())
+
+    return user
+
+
+def select_follow_counters(
+    follower_id: int, following_id: int, changed: CTE, delta: int
+) -> Update:
+    # both counters of the pair are changed only if the edge was changed
+    return (
+        update(User)
+        .where(
+            User.id.in_((follower_id, following_id)),
+            select(changed).exists(),
+        )
+        .values(
+            follower_count=User.follower_count
+            + case((User.id == following_id, delta), else_=0),
+            following_count=User.following_count
+            + case((User.id == follower_id, delta), else_=0),
+            version=CHANGE_VERSION,
+        )
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def user_exists(db: AsyncSession, user_id: int) -> bool:
+    query = select(User.id).where(User.id == user_id)
+    return await db.scalar(query) is not None
 
 
 async def create_follow_by_user(
-    db: AsyncSession, current_user: User, follower_id: int
+    db: AsyncSession, current_user: schemas.BaseUser, follower_id: int
 ) -> int | None:
-    follower: User | None = await get_user_by_id(db=db, user_id=follower_id)
-    if follower is None:
-        return None
-    if current_user in await follower.awaitable_attrs.followers:
-        return 0
-    follower.followers.append(current_user)
+    inserted = (
+        pg_insert(associated_followers)
+        .from_select(
+            ["follower_id", "following_id"],
+            select(literal(current_user.id), User.id).where(
+                User.id == follower_id
+            ),
+        )
+        .on_conflict_do_nothing()
+        .returning(associated_followers.c.following_id)
+        .cte("inserted_follow")
+    )
+    result = await db.execute(
+        select_follow_counters(
+            follower_id=current_user.id,
+            following_id=follower_id,
+            changed=inserted,
+            delta=1,
+        )
+    )
+    if not result.all():
+        # nothing inserted: no such user or already followed
+        return 0 if await user_exists(db, follower_id) else None
+
+    await backfill_inbox(db, user_id=current_user.id, author_id=follower_id)
+    await publish_invalidation(db, current_user.id, follower_id)
     await db.commit()
+    await profile_cache.invalidate(current_user.id, follower_id)
     return follower_id
 
 
 async def delete_follow_by_user(
-    db: AsyncSession, current_user: User, follower_id: int
+    db: AsyncSession, current_user: schemas.BaseUser, follower_id: int
 ) -> int | None:
-    follower: User | None = await get_user_by_id(db=db, user_id=follower_id)
-    if follower is None:
-        return None
-    if current_user not in await follower.awaitable_attrs.followers:
-        return 0
-    follower.followers.remove(current_user)
+    deleted = (
+        delete(associated_followers)
+        .where(
+            associated_followers.c.follower_id == current_user.id,
+            associated_followers.c.following_id == follower_id,
+        )
+        .returning(associated_followers.c.following_id)
+        .cte("deleted_follow")
+    )
+    result = await db.execute(
+        select_follow_counters(
+            follower_id=current_user.id,
+            following_id=follower_id,
+            changed=deleted,
+            delta=-1,
+        )
+    )
+    if not result.all():
+        # nothing deleted: no such user or not followed
+        return 0 if await user_exists(db, follower_id) else None
+
+    await purge_inbox(db, user_id=current_user.id, author_id=follower_id)
+    await publish_invalidation(db, current_user.id, follower_id)
     await db.commit()
+    await profile_cache.invalidate(current_user.id, follower_id)
     return follower_id
 
 
@@ -51,88 +247,522 @@ async def get_tweet_by_id(db: AsyncSession, tweet_id: int) -> Tweet | None:
     return result.scalar()
 
 
-async def get_tweets(db: AsyncSession) -> list[Tweet]:
-    query = select(Tweet).options(
-        selectinload(Tweet.likes),
-        selectinload(Tweet.author),
-        selectinload(Tweet.medias),
+def select_timeline_page(limit: int, before_id: int | None = None) -> Select:
+    # keyset pagination: newest tweets first, walking the primary key index
+    query = select(Tweet.id).order_by(Tweet.id.desc()).limit(limit)
+    if before_id is not None:
+        query = query.where(Tweet.id < before_id)
+    return query
+
+
+def select_home_feed_page(
+    user_id: int, limit: int, before_id: int | None = None
+) -> Select:
+    # tweets fanned out on write into the user's inbox
+    pushed = (
+        select(timeline_inbox.c.tweet_id.label("id"))
+        .where(timeline_inbox.c.user_id == user_id)
+        .order_by(timeline_inbox.c.tweet_id.desc())
+        .limit(limit)
+    )
+    # tweets of followed authors which were not fanned out, whatever
+    # the number of followers of the author is now; every author gives
+    # at most a page by ix_tweets_pulled, so the read doesn't grow with
+    # the history of the authors
+    followed = (
+        select(associated_followers.c.following_id)
+        .where(associated_followers.c.follower_id == user_id)
+        .subquery("followed")
+    )
+    latest = (
+        select(Tweet.id)
+        .where(
+            Tweet.author_id == followed.c.following_id,
+            ~Tweet.fanned_out,
+        )
+        .order_by(Tweet.id.desc())
+        .limit(limit)
+    )
+    if before_id is not None:
+        pushed = pushed.where(timeline_inbox.c.tweet_id < before_id)
+        latest = latest.where(Tweet.id < before_id)
+    latest = latest.lateral("latest")
+    pulled = select(latest.c.id).select_from(followed.join(latest, true()))
+    feed_ids = union(pushed, pulled).subquery()
+
+    return select(feed_ids.c.id).order_by(feed_ids.c.id.desc()).limit(limit)
+
+
+async def load_tweets(db: AsyncSession, page: Select) -> list[Tweet]:
+    query = (
+        select(Tweet)
+        .where(Tweet.id.in_(page.scalar_subquery()))
+        .order_by(Tweet.id.desc())
+        .options(
+            selectinload(Tweet.likes),
+            selectinload(Tweet.author),
+            selectinload(Tweet.medias),
+        )
     )
     result = await db.execute(query)
 
     return result.scalars().unique().all()
 
 
+async def get_tweets(
+    db: AsyncSession,
+    limit: int,
+    before_id: int | None = None,
+) -> list[Tweet]:
+    return await load_tweets(db, select_timeline_page(limit, before_id))
+
+
+def tweet_json_object():
+    # the same shape as schemas.Tweet, keys are kept in the schema order
+    likers = (
+        select(User.id, User.name)
+        .join(associated_likes, associated_likes.c.user_id == User.id)
+        .where(associated_likes.c.tweet_id == Tweet.id)
+        .order_by(User.id)
+        .limit(PREVIEW_SIZE)
+        .correlate(Tweet)
+        .subquery()
+    )
+    likes = select(
+        func.coalesce(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object(
+                        "user_id", likers.c.id, "name", likers.c.name
+                    ),
+                    likers.c.id,
+                )
+            ),
+            EMPTY_JSON_ARRAY,
+        )
+    ).scalar_subquery()
+    original = func.coalesce(Media.variants["original"].astext, Media.path)
+    medias = (
+        select(
+            Media.id,
+            original.label("original"),
+            func.coalesce(Media.variants["thumbnail"].astext, original).label(
+                "thumbnail"
+            ),
+            func.coalesce(Media.variants["preview"].astext, original).label(
+                "preview"
+            ),
+        )
+        .where(Media.tweet_id == Tweet.id, Media.published)
+        .correlate(Tweet)
+        .subquery()
+    )
+    attachments = select(
+        func.coalesce(
+            func.json_agg(aggregate_order_by(medias.c.original, medias.c.id)),
+            EMPTY_JSON_ARRAY,
+        )
+    ).scalar_subquery()
+    attachment_variants = select(
+        func.coalesce(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object(
+                        "original",
+                        medias.c.original,
+                        "thumbnail",
+                        medias.c.thumbnail,
+                        "preview",
+                        medias.c.preview,
+                    ),
+                    medias.c.id,
+                )
+            ),
+            EMPTY_JSON_ARRAY,
+        )
+    ).scalar_subquery()
+    author = (
+        select(func.json_build_object("id", User.id, "name", User.name))
+        .where(User.id == Tweet.author_id)
+        .scalar_subquery()
+    )
+    return func.json_build_object(
+        "id",
+        Tweet.id,
+        "content",
+        Tweet.content,
+        "attachments",
+        attachments,
+        "attachment_variants",
+        attachment_variants,
+        "author",
+        author,
+        "likes",
+        likes,
+        "like_count",
+        Tweet.like_count,
+    )
+
+
+async def load_tweets_json(
+    db: AsyncSession, page: Select, limit: int
+) -> tuple[str, int | None]:
+    """
+    Serialize a page of tweets into JSON in a single statement.
+
+    Args:
+        db (AsyncSession): async session instance.
+        page (Select): query of tweet IDs fetching up to limit + 1 rows.
+        limit (int): number of tweets on the page.
+
+    Returns:
+        tuple[str, int | None]: JSON array of tweets and ID of the last
+        tweet on the page if there is a next page, otherwise None.
+    """
+    page_ids = page.subquery()
+    rows = (
+        select(
+            Tweet.id,
+            func.row_number().over(order_by=Tweet.id.desc()).label("rank"),
+            tweet_json_object().label("tweet"),
+        )
+        .join(page_ids, page_ids.c.id == Tweet.id)
+        .subquery()
+    )
+    on_page = rows.c.rank <= limit
+    query = select(
+        cast(
+            func.coalesce(
+                func.json_agg(
+                    aggregate_order_by(rows.c.tweet, rows.c.id.desc())
+                ).filter(on_page),
+                EMPTY_JSON_ARRAY,
+            ),
+            Text,
+        ),
+        func.min(rows.c.id).filter(on_page),
+        func.count(),
+    )
+    tweets_json, last_id, fetched = (await db.execute(query)).one()
+
+    return tweets_json, last_id if fetched > limit else None
+
+
+async def get_page_etag(db: AsyncSession, page: Select, limit: int) -> str:
+    """
+    Make ETag of a page of tweets from the versions of its tweets.
+
+    The versions change on every change of a tweet that is shown,
+    so the ETag is found without building the page.
+
+    Args:
+        db (AsyncSession): async session instance.
+        page (Select): query of tweet IDs fetching up to limit + 1 rows.
+        limit (int): number of tweets on the page.
+
+    Returns:
+        str: quoted ETag.
+    """
+    page_ids = page.subquery()
+    rows = (
+        select(Tweet.id, Tweet.version)
+        .join(page_ids, page_ids.c.id == Tweet.id)
+        .subquery()
+    )
+    versions = func.string_agg(
+        cast(rows.c.id, Text) + ":" + cast(rows.c.version, Text),
+        aggregate_order_by(literal_column("','"), rows.c.id.desc()),
+    )
+    digest = await db.scalar(
+        select(func.md5(func.coalesce(versions, ""))).select_from(rows)
+    )
+    return f'"{limit}-{digest}"'
+
+
+async def get_tweets_etag(
+    db: AsyncSession,
+    limit: int,
+    before_id: int | None = None,
+) -> str:
+    return await get_page_etag(
+        db, select_timeline_page(limit + 1, before_id), limit
+    )
+
+
+async def get_home_feed_etag(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    before_id: int | None = None,
+) -> str:
+    return await get_page_etag(
+        db, select_home_feed_page(user_id, limit + 1, before_id), limit
+    )
+
+
+async def get_tweets_json(
+    db: AsyncSession,
+    limit: int,
+    before_id: int | None = None,
+) -> tuple[str, int | None]:
+    return await load_tweets_json(
+        db, select_timeline_page(limit + 1, before_id), limit
+    )
+
+
+async def get_home_feed_json(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    before_id: int | None = None,
+) -> tuple[str, int | None]:
+    return await load_tweets_json(
+        db, select_home_feed_page(user_id, limit + 1, before_id), limit
+    )
+
+
+def select_like_counter(changed: CTE, delta: int) -> Update:
+    return (
+        update(Tweet)
+        .where(Tweet.id.in_(select(changed.c.tweet_id)))
+        .values(like_count=Tweet.like_count + delta, version=CHANGE_VERSION)
+        .execution_options(synchronize_session=False)
+    )
+
+
 async def create_like(
-    db: AsyncSession, current_user: User, tweet_id: int
+    db: AsyncSession, current_user: schemas.BaseUser, tweet_id: int
 ) -> int | None:
-    tweet: Tweet | None = await get_tweet_by_id(db=db, tweet_id=tweet_id)
-    if tweet is None:
-        return None
-
-    likes = await tweet.awaitable_attrs.likes
-    # if current user is not tweet author and not in like list, add him there
-    if tweet.author_id != current_user.id and current_user not in likes:
-        likes.append(current_user)
+    # own tweets can't be liked, a repeated like is a no-op
+    inserted = (
+        pg_insert(associated_likes)
+        .from_select(
+            ["tweet_id", "user_id"],
+            select(Tweet.id, literal(current_user.id)).where(
+                Tweet.id == tweet_id, Tweet.author_id != current_user.id
+            ),
+        )
+        .on_conflict_do_nothing()
+        .returning(associated_likes.c.tweet_id)
+        .cte("inserted_like")
+    )
+    result = await db.execute(
+        select_like_counter(inserted, delta=1).returning(
+            Tweet.author_id, Tweet.like_count
+        )
+    )
+    liked = result.first()
+    if liked is not None:
+        await publish(
+            db, "like_count", tweet_id=tweet_id, like_count=liked.like_count
+        )
         await db.commit()
+        timeline_cache.clear()
+        return liked.author_id
 
-    return tweet.author_id
+    query = select(Tweet.author_id).where(Tweet.id == tweet_id)
+    return await db.scalar(query)
 
 
 async def delete_like(
-    db: AsyncSession, current_user: User, tweet_id: int
+    db: AsyncSession, current_user: schemas.BaseUser, tweet_id: int
 ) -> int | None:
-    tweet: Tweet | None = await get_tweet_by_id(db=db, tweet_id=tweet_id)
-    if tweet is None:
-        return None
-    likes = await tweet.awaitable_attrs.likes
-    if current_user not in likes:
-        return 0
-    likes.remove(current_user)
+    deleted = (
+        delete(associated_likes)
+        .where(
+            associated_likes.c.tweet_id == tweet_id,
+            associated_likes.c.user_id == current_user.id,
+        )
+        .returning(associated_likes.c.tweet_id)
+        .cte("deleted_like")
+    )
+    result = await db.execute(
+        select_like_counter(deleted, delta=-1).returning(Tweet.like_count)
+    )
+    like_count = result.scalar()
+    if like_count is None:
+        # nothing deleted: no such tweet or not liked
+        tweet = await get_tweet_by_id(db=db, tweet_id=tweet_id)
+        return None if tweet is None else 0
+
+    await publish(db, "like_count", tweet_id=tweet_id, like_count=like_count)
     await db.commit()
+    timeline_cache.clear()
     return tweet_id
 
 
 async def create_tweet(
     db: AsyncSession,
-    current_user: User,
+    current_user: schemas.BaseUser,
     content: schemas.BaseTweet,
 ) -> int:
     # create a Tweet instance
     tweet = Tweet(
         content=content.tweet_data,
-        author=current_user,
+        author_id=current_user.id,
+        fanned_out=select_follower_count(current_user.id)
+        < FANOUT_FOLLOWERS_LIMIT,
     )
 
     # if list of media exists, append it
     if content.tweet_media_ids:
         media_list = await get_attachments(db, content.tweet_media_ids)
         tweet.medias = media_list
-        tweet.attachments = [media.path for media in media_list]
 
     db.add(tweet)
+    await db.flush()
+    await fan_out_tweet(db, author_id=current_user.id, tweet_id=tweet.id)
+    await publish(
+        db, "tweet_created", tweet_id=tweet.id, author_id=current_user.id
+    )
     await db.commit()
+    timeline_cache.clear()
 
-    return await tweet.awaitable_attrs.id
+    return tweet.id
 
 
 async def delete_tweet(
-    db: AsyncSession, current_user: User, tweet_id: int
+    db: AsyncSession, current_user: schemas.BaseUser, tweet_id: int
 ) -> int | None:
-    tweet: Tweet | None = await get_tweet_by_id(db=db, tweet_id=tweet_id)
-    if tweet is None:
-        return None
-    if tweet.author_id != current_user.id:
-        return tweet.author_id
-    await db.delete(tweet)
-    await db.commit()
-    return tweet.author_id
+    # likes, inbox entries and links to media go by foreign key cascades,
+    # the tombstone tells syncing clients about the deletion
+    deleted = (
+        delete(Tweet)
+        .where(Tweet.id == tweet_id, Tweet.author_id == current_user.id)
+        .returning(Tweet.id, Tweet.author_id)
+        .cte("deleted_tweet")
+    )
+    tombstone = pg_insert(tweet_tombstones).from_select(
+        ["tweet_id"], select(deleted.c.id)
+    )
+    # the ID may be reused after the tables are truncated
+    tombstone = tombstone.on_conflict_do_update(
+        index_elements=[tweet_tombstones.c.tweet_id],
+        set_={
+            "version": tombstone.excluded.version,
+            "deleted_at": tombstone.excluded.deleted_at,
+        },
+    ).cte("tombstone")
+    result = await db.execute(
+        select(deleted.c.author_id)
+        .add_cte(tombstone)
+        .execution_options(synchronize_session=False)
+    )
+    author_id = result.scalar()
+    if author_id is not None:
+        await publish(db, "tweet_deleted", tweet_id=tweet_id)
+        await db.commit()
+        timeline_cache.clear()
+        return author_id
+
+    # nothing deleted: no such tweet or it is not own
+    query = select(Tweet.author_id).where(Tweet.id == tweet_id)
+    return await db.scalar(query)
+
+
+def select_sync_version():
+    # transactions from the oldest one running are not seen as committed,
+    # their changes have versions not less than it
+    snapshot = func.pg_current_snapshot()
+    return select(
+        cast(cast(func.pg_snapshot_xmin(snapshot), Text), BigInteger),
+        cast(cast(func.pg_snapshot_xmax(snapshot), Text), BigInteger),
+        select(change_horizon.c.version).scalar_subquery(),
+    )
+
+
+async def get_changes(
+    db: AsyncSession, since: int, limit: int = CHANGES_LIMIT
+) -> tuple[int, tuple[str, list[int], list[dict]] | None]:
+    """
+    Find changes of tweets committed since the version.
+
+    The returned version is taken before the changes are read, so a
+    change may be returned twice, but it is never missed.
+
+    Args:
+        db (AsyncSession): async session instance.
+        since (int): version returned by the previous call.
+        limit (int): maximum number of changes of each kind.
+
+    Returns:
+        tuple[int, tuple[str, list[int], list[dict]] | None]: version
+        for the next call and JSON array of created tweets, IDs of
+        deleted tweets and changed like counts, or None if the client
+        has to reload the timeline.
+    """
+    version, next_version, horizon = (
+        await db.execute(select_sync_version())
+    ).one()
+    if since > next_version or (horizon is not None and since <= horizon):
+        return version, None
+
+    created = (
+        select(Tweet.id)
+        .where(Tweet.version >= since, Tweet.created_version >= since)
+        .order_by(Tweet.id.desc())
+        .limit(limit + 1)
+    )
+    created_json, last_id = await load_tweets_json(db, created, limit)
+    if last_id is not None:
+        return version, None
+
+    result = await db.execute(
+        select(Tweet.id, Tweet.like_count)
+        .where(Tweet.version >= since, Tweet.created_version < since)
+        .order_by(Tweet.id)
+        .limit(limit + 1)
+    )
+    likes = [row._asdict() for row in result]
+    result = await db.execute(
+        select(tweet_tombstones.c.tweet_id)
+        .where(tweet_tombstones.c.version >= since)
+        .order_by(tweet_tombstones.c.tweet_id)
+        .limit(limit + 1)
+    )
+    deleted = list(result.scalars())
+    if len(likes) > limit or len(deleted) > limit:
+        return version, None
+
+    return version, (created_json, deleted, likes)
 
 
 async def create_media(
     db: AsyncSession,
     path: str,
+    checksum: str | None = None,
+    size: int | None = None,
 ) -> int:
-    media = Media(path=path)
+    # waits for the garbage collector removing the file of the path
+    await db.execute(select(func.pg_advisory_xact_lock(func.hashtext(path))))
+    if checksum is not None:
+        # the same content uploaded but not attached yet is reused,
+        # its age is reset so that the garbage collector keeps it;
+        # a row being collected is locked and skipped
+        unattached = (
+            select(Media.id)
+            .where(
+                Media.checksum == checksum,
+                # not a row of a file named by an older scheme
+                Media.path == path,
+                Media.tweet_id.is_(None),
+            )
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        media_id = await db.scalar(
+            update(Media)
+            .where(Media.id == unattached, Media.tweet_id.is_(None))
+            .values(created_at=func.now())
+            .returning(Media.id)
+            .execution_options(synchronize_session=False)
+        )
+        if media_id is not None:
+            await db.commit()
+            return media_id
+
+    media = Media(path=path, checksum=checksum, size=size)
     db.add(media)
     await db.commit()
     return media.id
@@ -153,6 +783,10 @@ async def get_media_by_id(db: AsyncSession, media_id: int) -> Media | None:
 
 
 async def get_attachments(db: AsyncSession, media_ids: list[int]):
-    query = select(Media).where(Media.id.in_(media_ids))
+    query = (
+        select(Media)
+        .where(Media.id.in_(media_ids), Media.status != "rejected")
+        .order_by(Media.id)
+    )
     result = await db.execute(query)
     return result.scalars().unique().all()
@@ -0,0 +1,76 @@
+import asyncio
+from typing import Annotated, Literal
+
+from fastapi import APIRouter, Query, Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import exc
+
+from .. import schemas
+from ..database import engine, get_pool_stats, read_engine
+from .utils import FORMATTED_RESPONSES
+
+# seconds to wait for the database answering the readiness probe
+READY_TIMEOUT = 2
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+NOT_READY_RESPONSE = {
+    status.HTTP_503_SERVICE_UNAVAILABLE: {
+        "model": schemas.ResponseMessage,
+        "description": "Приложение не готово принимать запросы",
+    }
+}
+
+
+async def ping_database() -> None:
+    async with engine.connect() as connection:
+        await connection.exec_driver_sql("SELECT 1")
+
+
+@router.get(
+    "/live",
+    response_model=schemas.OperationStatus,
+    status_code=status.HTTP_200_OK,
+    responses={
+        **FORMATTED_RESPONSES[200],
+    },
+)
+async def get_liveness():
+    # the event loop of the worker is able to answer
+    return schemas.OperationStatus()
+
+
+@router.get(
+    "/ready",
+    response_model=schemas.OperationStatus,
+    status_code=status.HTTP_200_OK,
+    responses={
+        **FORMATTED_RESPONSES[200],
+        **NOT_READY_RESPONSE,
+    },
+)
+async def get_readiness(request: Request):
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"message": "Приложение запускается"},
+        )
+    try:
+        await asyncio.wait_for(ping_database(), timeout=READY_TIMEOUT)
+    except (asyncio.TimeoutError, OSError, exc.SQLAlchemyError):
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"message": "База данных недоступна"},
+        )
+    return schemas.OperationStatus()
+
+
+# mounted outside of /api next to /metrics, so that it is not published
+async def get_pool_status(
+    pool: Annotated[
+        Literal["primary", "replica"],
+        Query(description="Пул основной базы данных или реплики"),
+    ] = "primary",
+):
+    pool_engine = engine if pool == "primary" else read_engine
+    return schemas.PoolStatus(**get_pool_stats(pool_engine))
@@ -1,12 +1,33 @@
-from typing import Annotated
+import mimetypes
+import os
+from typing import Annotated, Literal
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends, File, UploadFile, status
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Path,
+    Query,
+    Request,
+    status,
+)
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from .. import schemas
-from ..dependencies import get_api_key, get_db_session
+from ..dependencies import (
+    get_api_key,
+    get_read_db_session,
+    get_session_maker,
+    get_write_db_session,
+)
+from ..downloads import MediaFileResponse, etag_matches
+from ..media_processing import process_media
+from ..settings import settings
+from ..uploads import discard_file, save_upload, store_file
 from . import utils
-from .crud import create_media
+from .crud import create_media, get_media_by_id
 
 router = APIRouter(prefix="/medias", tags=["Media"])
 
@@ -18,13 +39,142 @@ router = APIRouter(prefix="/medias", tags=["Media"])
     response_model=schemas.MediaResponse,
     responses={
         **utils.FORMATTED_RESPONSES[201],
+        **utils.FORMATTED_RESPONSES[413],
+        **utils.FORMATTED_RESPONSES[422],
+    },
+    # the body is parsed by save_upload, so it is described here
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {
+                            "file": {
+                                "type": "string",
+                                "format": "binary",
+                                "description": "Загружаемый файл",
+                            }
+                        },
+                    }
+                }
+            },
+        }
     },
 )
 async def upload_media(
-    db: Annotated[AsyncSession, Depends(get_db_session)],
-    file: Annotated[UploadFile, File(description="Загружаемый файл")],
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Annotated[AsyncSession, Depends(get_write_db_session)],
+    session_maker: Annotated[async_sessionmaker, Depends(get_session_maker)],
 ):
-    filename = await utils.save_file(file, chunk_size=1024 * 1024)
+    saved_file = await save_upload(
+        request,
+        field_name="file",
+        directory=settings.media_dir,
+        max_size=settings.media_max_size,
+        chunk_size=1024 * 1024,
+    )
 
-    media_id = await create_media(db, filename)
+    try:
+        media_id = await create_media(
+            db,
+            saved_file.path,
+            checksum=saved_file.checksum,
+            size=saved_file.size,
+        )
+    except BaseException:
+        discard_file(saved_file)
+        raise
+    # the file is put in place after its row is committed: the garbage
+    # collector keeps files referred to by rows and removes them under
+    # the lock taken by create_media, so a file removed before that is
+    # written again here
+    store_file(saved_file)
+    # type check and variants are made after the response is sent
+    background_tasks.add_task(
+        process_media, session_maker, media_id, saved_file.path
+    )
     return schemas.MediaResponse(media_id=media_id)
+
+
+@router.get(
+    "/{media_id}",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(get_api_key)],
+    response_class=Response,
+    responses={
+        status.HTTP_200_OK: {
+            "content": {"application/octet-stream": {}},
+            "description": "Содержимое файла",
+        },
+        status.HTTP_206_PARTIAL_CONTENT: {
+            "description": "Запрошенный диапазон байтов файла"
+        },
+        status.HTTP_304_NOT_MODIFIED: {
+            "description": "Файл не изменился с указанной версии ETag"
+        },
+        **utils.FORMATTED_RESPONSES[404],
+        **utils.FORMATTED_RESPONSES[416],
+    },
+)
+async def download_media(
+    request: Request,
+    media_id: Annotated[int, Path(description="ID медиа в базе данных")],
+    db: Annotated[AsyncSession, Depends(get_read_db_session)],
+    variant: Annotated[
+        Literal["original", "thumbnail", "preview"],
+        Query(description="Исходный файл или его уменьшенная копия"),
+    ] = "original",
+):
+    media = await get_media_by_id(db, media_id)
+    if media is None or not media.published:
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": f"Медиа с id# {media_id} не найдено"},
+        )
+
+    path = media.variant_paths[variant]
+    if not os.path.isfile(path):
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"message": f"Файл медиа с id# {media_id} не найден"},
+        )
+    if media.checksum is not None:
+        # files are named by the hash of their content and never change
+        etag = f'"{os.path.basename(path)}"'
+        cache_control = "private, max-age=31536000, immutable"
+    else:
+        stat = os.stat(path)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        cache_control = "private, no-cache"
+    headers = {"cache-control": cache_control}
+    # the sniffed type is known for the upload only
+    media_type = mimetypes.guess_type(path)[0]
+    if path == media.path and media.mime_type is not None:
+        media_type = media.mime_type
+
+    if settings.media_accel_redirect:
+        # nginx sends the file and handles Range by itself
+        if etag_matches(etag, request.headers.get("if-none-match")):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers={"etag": etag, **headers},
+            )
+        # older files are named by the client, so the name is quoted
+        location = quote(os.path.relpath(path, settings.media_dir))
+        headers["x-accel-redirect"] = (
+            settings.media_accel_redirect.rstrip("/") + "/" + location
+        )
+        headers["etag"] = etag
+        return Response(media_type=media_type, headers=headers)
+
+    return MediaFileResponse(
+        path,
+        request.headers,
+        etag=etag,
+        media_type=media_type,
+        headers=headers,
+    )
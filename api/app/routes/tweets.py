@@ -1,20 +1,42 @@
+import functools
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Path, status
+from fastapi import APIRouter, Depends, Path, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, StreamingResponse
 
 from .. import schemas
-from ..dependencies import get_api_key, get_db_session
-from ..models import User
+from ..dependencies import (
+    get_api_key,
+    get_db_session,
+    get_read_db_session,
+    get_write_db_session,
+    timeline_cache,
+)
+from ..events import broker, stream_events
+from ..settings import settings
 from .crud import (
     create_like,
     create_tweet,
     delete_like,
     delete_tweet,
-    get_tweets,
+    get_changes,
+    get_home_feed_etag,
+    get_home_feed_json,
+    get_tweets_etag,
+    get_tweets_json,
+)
+from .utils import (
+    FORMATTED_RESPONSES,
+    decode_cursor,
+    get_formatted_changes_json,
+    get_formatted_tweets_json,
+    get_not_modified,
+    get_validation_headers,
 )
-from .utils import FORMATTED_RESPONSES
+
+TWEETS_PAGE_SIZE = 50
+TWEETS_PAGE_MAX_SIZE = 100
 
 router = APIRouter(
     prefix="/tweets",
@@ -29,15 +51,177 @@ router = APIRouter(
     dependencies=[Depends(get_api_key)],
     responses={
         **FORMATTED_RESPONSES[200],
+        **FORMATTED_RESPONSES[304],
+        **FORMATTED_RESPONSES[400],
     },
 )
 async def get_tweets_list(
-    db: Annotated[AsyncSession, Depends(get_db_session)]
+    request: Request,
+    db: Annotated[AsyncSession, Depends(get_read_db_session)],
+    limit: Annotated[
+        int,
+        Query(
+            ge=1,
+            le=TWEETS_PAGE_MAX_SIZE,
+            description="Количество твитов на странице",
+        ),
+    ] = TWEETS_PAGE_SIZE,
+    cursor: Annotated[
+        str | None,
+        Query(description="Курсор, полученный с предыдущей страницей"),
+    ] = None,
 ):
-    tweets_orm = await get_tweets(db)
-    tweets = [schemas.Tweet.model_validate(tweet) for tweet in tweets_orm]
+    before_id = None
+    if cursor is not None:
+        before_id = decode_cursor(cursor)
+        if before_id is None:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"message": "Некорректный курсор"},
+            )
+
+    etag = await get_tweets_etag(db, limit=limit, before_id=before_id)
+    not_modified = get_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    # the page is cached by its ETag found in the session of the request,
+    # so a reader of the primary never gets a page loaded from a lagging
+    # replica; concurrent requests of the same page share one load
+    content = await timeline_cache.get_or_load(
+        (limit, before_id, etag),
+        functools.partial(load_tweets_page, db, limit, before_id),
+    )
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers=get_validation_headers(etag),
+    )
+
 
-    return schemas.TweetsList(tweets=tweets)
+async def load_tweets_page(
+    db: AsyncSession, limit: int, before_id: int | None
+) -> bytes:
+    # the payload is serialized by the database and sent as is
+    tweets_json, last_id = await get_tweets_json(
+        db, limit=limit, before_id=before_id
+    )
+    return get_formatted_tweets_json(tweets_json, last_id)
+
+
+@router.get(
+    "/feed",
+    response_model=schemas.TweetsList,
+    status_code=status.HTTP_200_OK,
+    responses={
+        **FORMATTED_RESPONSES[200],
+        **FORMATTED_RESPONSES[304],
+        **FORMATTED_RESPONSES[400],
+    },
+)
+async def get_home_feed_list(
+    request: Request,
+    db: Annotated[AsyncSession, Depends(get_read_db_session)],
+    user: Annotated[schemas.BaseUser, Depends(get_api_key)],
+    limit: Annotated[
+        int,
+        Query(
+            ge=1,
+            le=TWEETS_PAGE_MAX_SIZE,
+            description="Количество твитов на странице",
+        ),
+    ] = TWEETS_PAGE_SIZE,
+    cursor: Annotated[
+        str | None,
+        Query(description="Курсор, полученный с предыдущей страницей"),
+    ] = None,
+):
+    before_id = None
+    if cursor is not None:
+        before_id = decode_cursor(cursor)
+        if before_id is None:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"message": "Некорректный курсор"},
+            )
+
+    etag = await get_home_feed_etag(
+        db, user_id=user.id, limit=limit, before_id=before_id
+    )
+    not_modified = get_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    tweets_json, last_id = await get_home_feed_json(
+        db, user_id=user.id, limit=limit, before_id=before_id
+    )
+
+    return Response(
+        content=get_formatted_tweets_json(tweets_json, last_id),
+        media_type="application/json",
+        headers=get_validation_headers(etag),
+    )
+
+
+@router.get(
+    "/changes",
+    response_model=schemas.TweetsChanges,
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(get_api_key)],
+    responses={
+        **FORMATTED_RESPONSES[200],
+        **FORMATTED_RESPONSES[422],
+    },
+)
+async def get_tweets_changes(
+    db: Annotated[AsyncSession, Depends(get_read_db_session)],
+    since: Annotated[
+        int,
+        Query(
+            ge=0,
+            description="Версия из предыдущего ответа, 0 для первого запроса",
+        ),
+    ],
+):
+    version, changes = await get_changes(db, since=since)
+
+    return Response(
+        content=get_formatted_changes_json(version, changes),
+        media_type="application/json",
+    )
+
+
+@router.get(
+    "/stream",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(get_api_key)],
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "content": {"text/event-stream": {}},
+            "description": "Поток событий: tweet_created, tweet_deleted, "
+            "like_count; по событию resync ленту нужно загрузить заново",
+        },
+        **FORMATTED_RESPONSES[503],
+    },
+)
+async def get_events_stream(
+    db: Annotated[AsyncSession, Depends(get_db_session)],
+):
+    if not broker.listening:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"message": "Поток событий недоступен"},
+        )
+    # the session of the authorization is not kept for the stream
+    await db.close()
+
+    return StreamingResponse(
+        stream_events(broker, broker.subscribe(), settings.events_heartbeat),
+        media_type="text/event-stream",
+        # nginx must not buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post(
@@ -49,8 +233,8 @@ async def get_tweets_list(
     },
 )
 async def create_new_tweet(
-    db: Annotated[AsyncSession, Depends(get_db_session)],
-    user: Annotated[User, Depends(get_api_key)],
+    db: Annotated[AsyncSession, Depends(get_write_db_session)],
+    user: Annotated[schemas.BaseUser, Depends(get_api_key)],
     tweet: schemas.BaseTweet,
 ):
     tweet_id = await create_tweet(db, current_user=user, content=tweet)
@@ -69,8 +253,8 @@ async def create_new_tweet(
     },
 )
 async def delete_own_tweet(
-    db: Annotated[AsyncSession, Depends(get_db_session)],
-    user: Annotated[User, Depends(get_api_key)],
+    db: Annotated[AsyncSession, Depends(get_write_db_session)],
+    user: Annotated[schemas.BaseUser, Depends(get_api_key)],
     id: Annotated[int, Path(description="ID твита")],
 ):
     response = await delete_tweet(db, current_user=user, tweet_id=id)
@@ -99,9 +283,9 @@ async def delete_own_tweet(
     },
 )
 async def make_a_like(
-    db: Annotated[AsyncSession, Depends(get_db_session)],
+    db: Annotated[AsyncSession, Depends(get_write_db_session)],
     id: Annotated[int, Path(description="ID твита")],
-    user: Annotated[User, Depends(get_api_key)],
+    user: Annotated[schemas.BaseUser, Depends(get_api_key)],
 ):
     tweet_author = await create_like(db, tweet_id=id, current_user=user)
     if tweet_author is None:
@@ -128,9 +312,9 @@ async def make_a_like(
     },
 )
 async def delete_likes(
-    db: Annotated[AsyncSession, Depends(get_db_session)],
+    db: Annotated[AsyncSession, Depends(get_write_db_session)],
     id: Annotated[int, Path(description="ID твита")],
-    user: Annotated[User, Depends(get_api_key)],
+    user: Annotated[schemas.BaseUser, Depends(get_api_key)],
 ):
     tweet_id = await delete_like(db, tweet_id=id, current_user=user)
     if tweet_id is None:
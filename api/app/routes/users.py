@@ -1,33 +1,83 @@
+import functools
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Path, status
+from fastapi import APIRouter, Depends, Path, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.responses import JSONResponse
 
 from .. import schemas
-from ..dependencies import get_api_key, get_db_session
+from ..dependencies import (
+    get_api_key,
+    get_read_db_session,
+    get_write_db_session,
+)
 from ..models import User
-from .crud import create_follow_by_user, delete_follow_by_user, get_user_by_id
-from .utils import FORMATTED_RESPONSES, get_formatted_user
+from ..profiles import Profile, profile_cache
+from .crud import (
+    create_follow_by_user,
+    delete_follow_by_user,
+    get_user_by_id,
+    load_user_preview,
+)
+from .utils import (
+    FORMATTED_RESPONSES,
+    get_formatted_user,
+    get_not_modified,
+    get_validation_headers,
+)
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
 
+def get_user_etag(user_orm: User) -> str:
+    # the version is bumped by every follow and unfollow of the user
+    return f'"{user_orm.id}-{user_orm.version}"'
+
+
+async def load_profile(db: AsyncSession, user_orm: User) -> Profile:
+    user_response = await get_formatted_user(
+        await load_user_preview(db, user_orm)
+    )
+    return get_user_etag(user_orm), user_response.model_dump_json().encode()
+
+
+async def get_profile_response(
+    request: Request, db: AsyncSession, user_orm: User
+) -> Response:
+    # the version is read first: a revalidated profile costs one query
+    # and a cached one is served only if it is of the same version
+    etag = get_user_etag(user_orm)
+    not_modified = get_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    _, content = await profile_cache.get_or_load(
+        user_orm.id, etag, functools.partial(load_profile, db, user_orm)
+    )
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers=get_validation_headers(etag),
+    )
+
+
 @router.get(
     "/me",
     response_model=schemas.UserResponse,
     status_code=status.HTTP_200_OK,
     responses={
         **FORMATTED_RESPONSES[200],
+        **FORMATTED_RESPONSES[304],
     },
 )
 async def get_current_user(
-    db: Annotated[AsyncSession, Depends(get_db_session)],
-    user: Annotated[User, Depends(get_api_key)],
+    request: Request,
+    db: Annotated[AsyncSession, Depends(get_read_db_session)],
+    user: Annotated[schemas.BaseUser, Depends(get_api_key)],
 ):
     user_orm: User = await get_user_by_id(db=db, user_id=user.id)
 
-    return await get_formatted_user(user_orm)
+    return await get_profile_response(request, db, user_orm)
 
 
 @router.get(
@@ -37,12 +87,14 @@ async def get_current_user(
     dependencies=[Depends(get_api_key)],
     responses={
         **FORMATTED_RESPONSES[200],
+        **FORMATTED_RESPONSES[304],
         **FORMATTED_RESPONSES[404],
     },
 )
 async def get_user_profile(
+    request: Request,
     id: Annotated[int, Path(description="ID пользователя в базе данных")],
-    db: Annotated[AsyncSession, Depends(get_db_session)],
+    db: Annotated[AsyncSession, Depends(get_read_db_session)],
 ):
     user_orm: User | None = await get_user_by_id(db=db, user_id=id)
     if user_orm is None:
@@ -51,7 +103,7 @@ async def get_user_profile(
             content={"message": f"Пользователь с id# {id} не найден"},
         )
 
-    return await get_formatted_user(user_orm)
+    return await get_profile_response(request, db, user_orm)
 
 
 @router.post(
@@ -66,8 +118,8 @@ async def get_user_profile(
 )
 async def follow_by_user(
     id: Annotated[int, Path(description="ID пользователя в базе данных")],
-    db: Annotated[AsyncSession, Depends(get_db_session)],
-    user: Annotated[User, Depends(get_api_key)],
+    db: Annotated[AsyncSession, Depends(get_write_db_session)],
+    user: Annotated[schemas.BaseUser, Depends(get_api_key)],
 ):
     if id == user.id:
         return JSONResponse(
@@ -105,8 +157,8 @@ async def follow_by_user(
 )
 async def unfollow(
     id: Annotated[int, Path(description="ID пользователя в базе данных")],
-    db: Annotated[AsyncSession, Depends(get_db_session)],
-    user: Annotated[User, Depends(get_api_key)],
+    db: Annotated[AsyncSession, Depends(get_write_db_session)],
+    user: Annotated[schemas.BaseUser, Depends(get_api_key)],
 ):
     result = await delete_follow_by_user(db, current_user=user, follower_id=id)
 
@@ -1,10 +1,13 @@
-import os
+import base64
+import binascii
+import json
 
-import aiofiles
-from fastapi import UploadFile, status
+from fastapi import Request, Response, status
 
 from .. import schemas
-from ..models import User
+from ..downloads import etag_matches
+from ..models import Tweet, User
+from . import crud
 
 
 async def get_formatted_user(user_orm: User) -> schemas.UserResponse:
@@ -13,21 +16,163 @@ async def get_formatted_user(user_orm: User) -> schemas.UserResponse:
     return schemas.UserResponse(user=user_out)
 
 
-async def save_file(
-    file: UploadFile,
-    chunk_size: int,
-) -> str:
-    fname = os.path.join("./images", file.filename)
-    async with aiofiles.open(fname, mode="wb") as f:
-        while content := await file.read(chunk_size):
-            await f.write(content)
-    await file.close()
+async def get_formatted_tweets(
+    tweets_orm: list[Tweet], limit: int
+) -> schemas.TweetsList:
+    # tweets_orm holds one extra row if there is a next page
+    tweets = [
+        schemas.Tweet.model_validate(tweet) for tweet in tweets_orm[:limit]
+    ]
+    for tweet in tweets:
+        del tweet.likes[crud.PREVIEW_SIZE :]
+    next_cursor = None
+    if len(tweets_orm) > limit:
+        next_cursor = encode_cursor(tweets[-1].id)
 
-    return fname
+    return schemas.TweetsList(tweets=tweets, next_cursor=next_cursor)
+
+
+def get_formatted_tweets_json(tweets_json: str, last_id: int | None) -> bytes:
+    """
+    Wrap JSON array of tweets made by the database into TweetsList body.
+
+    Args:
+        tweets_json (str): JSON array of tweets in schemas.Tweet format.
+        last_id (int | None): ID of the last tweet if there is a next page.
+
+    Returns:
+        bytes: body of the response in schemas.TweetsList format.
+    """
+    next_cursor = None if last_id is None else encode_cursor(last_id)
+    return "".join(
+        (
+            '{"result":true,"tweets":',
+            tweets_json,
+            ',"next_cursor":',
+            json.dumps(next_cursor),
+            "}",
+        )
+    ).encode()
+
+
+def get_formatted_changes_json(
+    version: int, changes: tuple[str, list[int], list[dict]] | None
+) -> bytes:
+    """
+    Wrap changes found by crud.get_changes into TweetsChanges body.
+
+    Args:
+        version (int): version for the next request of changes.
+        changes (tuple[str, list[int], list[dict]] | None): JSON array
+            of created tweets, IDs of deleted tweets and like counts,
+            None if the client has to reload the timeline.
+
+    Returns:
+        bytes: body of the response in schemas.TweetsChanges format.
+    """
+    if changes is None:
+        return json.dumps(
+            {
+                "result": True,
+                "version": version,
+                "resync": True,
+                "created": [],
+                "deleted": [],
+                "likes": [],
+            }
+        ).encode()
+
+    created_json, deleted, likes = changes
+    return "".join(
+        (
+            f'{{"result":true,"version":{version},"resync":false,"created":',
+            created_json,
+            ',"deleted":',
+            json.dumps(deleted),
+            ',"likes":',
+            json.dumps(likes),
+            "}",
+        )
+    ).encode()
+
+
+# tweets.id is a 4-byte integer, larger values fail in the database
+MAX_TWEET_ID = 2**31 - 1
+
+
+def encode_cursor(tweet_id: int) -> str:
+    """
+    Pack ID of the last tweet on a page into an opaque cursor.
+
+    Args:
+        tweet_id (int): ID of the last tweet returned to the client.
+
+    Returns:
+        str: url-safe cursor string.
+    """
+    raw = str(tweet_id).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int | None:
+    """
+    Unpack tweet ID from the cursor made by encode_cursor.
+
+    Args:
+        cursor (str): cursor passed by the client.
+
+    Returns:
+        int | None: tweet ID or None if the cursor is malformed or the ID
+            is out of range of the id column.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if not (raw.isascii() and raw.isdigit()):
+        return None
+    tweet_id = int(raw)
+    if not 1 <= tweet_id <= MAX_TWEET_ID:
+        return None
+    return tweet_id
+
+
+# clients may keep the response but must revalidate it before every use
+REVALIDATE_HEADERS = {"Cache-Control": "private, no-cache"}
+
+
+def get_validation_headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, **REVALIDATE_HEADERS}
+
+
+def get_not_modified(request: Request, etag: str) -> Response | None:
+    """
+    Answer a conditional GET if the client has the current version.
+
+    Args:
+        request (Request): incoming request.
+        etag (str): quoted ETag of the current version of the resource.
+
+    Returns:
+        Response | None: empty 304 response or None if the resource has to
+            be sent.
+    """
+    if not etag_matches(etag, request.headers.get("if-none-match")):
+        return None
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers=get_validation_headers(etag),
+    )
 
 
 FORMATTED_RESPONSES = {
     200: {status.HTTP_200_OK: {"description": "Успешный запрос"}},
+    304: {
+        status.HTTP_304_NOT_MODIFIED: {
+            "description": "Данные не изменились с прошлого запроса"
+        }
+    },
     201: {status.HTTP_201_CREATED: {"description": "Объект создан"}},
     400: {
         status.HTTP_400_BAD_REQUEST: {
@@ -41,9 +186,25 @@ FORMATTED_RESPONSES = {
             "description": "Объект не найден",
         }
     },
+    413: {
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {
+            "description": "Размер файла превышает допустимый"
+        }
+    },
+    416: {
+        status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE: {
+            "description": "Запрошенный диапазон байтов вне файла"
+        }
+    },
     422: {
         status.HTTP_422_UNPROCESSABLE_ENTITY: {
             "description": "Ошибка валидации данных запроса"
         }
     },
+    503: {
+        status.HTTP_503_SERVICE_UNAVAILABLE: {
+            "model": schemas.ResponseMessage,
+            "description": "Сервис временно недоступен",
+        }
+    },
 }
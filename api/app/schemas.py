@@ -38,6 +38,17 @@ class UserOut(BaseUser):
         на которых подписан данный пользователь",
         examples=[[{"id": 2, "name": "Barrie J.M."}]],
     )
+    follower_count: int = Field(
+        default=0,
+        description="Количество подписчиков пользователя",
+        examples=[2],
+    )
+    following_count: int = Field(
+        default=0,
+        description="Количество пользователей, \
+        на которых подписан данный пользователь",
+        examples=[1],
+    )
 
 
 class UserResponse(OperationStatus):
@@ -65,6 +76,23 @@ class BaseTweet(BaseModel):
     }
 
 
+class MediaVariants(BaseModel):
+    original: str = Field(
+        description="Путь к исходному файлу",
+        examples=["./path/Neverland.png"],
+    )
+    thumbnail: str = Field(
+        description="Путь к миниатюре без метаданных или к исходному \
+        файлу, пока она не готова",
+        examples=["./path/Neverland_thumbnail.png"],
+    )
+    preview: str = Field(
+        description="Путь к уменьшенной копии без метаданных или к \
+        исходному файлу, пока она не готова",
+        examples=["./path/Neverland_preview.png"],
+    )
+
+
 class Tweet(BaseModel):
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
 
@@ -81,6 +109,10 @@ class Tweet(BaseModel):
         description="Список имен присоединенных файлов",
         examples=[["./path/Neverland.png"]],
     )
+    attachment_variants: list[MediaVariants] = Field(
+        default=[],
+        description="Уменьшенные копии присоединенных файлов",
+    )
     author: BaseUser = Field(
         description="Автор твита",
     )
@@ -94,10 +126,45 @@ class Tweet(BaseModel):
             ]
         ],
     )
+    like_count: int = Field(
+        default=0,
+        description="Количество лайков твита",
+        examples=[2],
+    )
 
 
 class TweetsList(OperationStatus):
     tweets: list[Tweet]
+    next_cursor: str | None = Field(
+        default=None,
+        description="Курсор для получения следующей страницы ленты \
+        или null, если лента закончилась",
+        examples=["MTA"],
+    )
+
+
+class LikeCount(BaseModel):
+    id: int = Field(description="ID твита", examples=[1])
+    like_count: int = Field(description="Количество лайков", examples=[2])
+
+
+class TweetsChanges(OperationStatus):
+    version: int = Field(
+        description="Версия для следующего запроса изменений",
+        examples=[1024],
+    )
+    resync: bool = Field(
+        default=False,
+        description="Версия устарела: ленту нужно загрузить заново, \
+        остальные поля пусты",
+    )
+    created: list[Tweet] = Field(default=[], description="Новые твиты")
+    deleted: list[int] = Field(
+        default=[], description="ID удаленных твитов", examples=[[3, 5]]
+    )
+    likes: list[LikeCount] = Field(
+        default=[], description="Изменившиеся счетчики лайков"
+    )
 
 
 class TweetResponse(OperationStatus):
@@ -126,3 +193,23 @@ class ResponseMessage(OperationStatus):
     message: str = Field(
         description="Сообщение об ошибке", examples=["Что-то пошло не так :("]
     )
+
+
+class PoolStatus(BaseModel):
+    size: int = Field(description="Размер пула соединений")
+    checked_in: int = Field(description="Свободные соединения в пуле")
+    checked_out: int = Field(description="Соединения, выданные запросам")
+    overflow: int = Field(
+        description="Соединения сверх размера пула \
+        (отрицательное значение - незанятые места в пуле)"
+    )
+    checkouts: int = Field(description="Количество выдач соединений")
+    timeouts: int = Field(
+        description="Количество запросов, не дождавшихся соединения"
+    )
+    wait_seconds_total: float = Field(
+        description="Суммарное время получения соединений, с"
+    )
+    wait_seconds_max: float = Field(
+        description="Максимальное время получения соединения, с"
+    )
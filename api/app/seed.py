@@ -0,0 +1,345 @@
+"""
+Bulk loading of synthetic users, follows, tweets and likes.
+
+Rows are generated in batches and streamed into PostgreSQL by binary COPY,
+so millions of them are loaded in minutes with bounded memory. The data
+is the same for the same parameters and seed: popularity of users and
+tweets follows a power law, user N has the API key keyN. Afterwards
+the sequences, the counters and the home feeds are brought in line.
+
+Usage:
+    python -m app.seed --users 1000000 --tweets 10000000 --truncate
+"""
+
+import argparse
+import asyncio
+import collections
+import itertools
+import random
+from typing import Iterator, NamedTuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from .counters import repair_counters
+from .database import engine
+from .models import Tweet, User
+from .routes.crud import FANOUT_FOLLOWERS_LIMIT, rebuild_inbox
+
+# rows sent by one COPY
+SEED_BATCH_SIZE = 10000
+# shape of the distribution of likes per tweet, its mean is 3
+LIKES_PARETO_ALPHA = 1.5
+WORDS = (
+    "привет",
+    "новости",
+    "код",
+    "релиз",
+    "кофе",
+    "встреча",
+    "сервис",
+    "отпуск",
+    "тесты",
+    "ревью",
+)
+SEEDED_TABLES = (
+    "users",
+    "tweets",
+    "medias",
+    "associated_followers",
+    "associated_likes",
+    "timeline_inbox",
+    "tweet_tombstones",
+    "change_horizon",
+)
+SEQUENCES = {"user_id_seq": User, "tweet_id_seq": Tweet}
+
+
+class SeedStats(NamedTuple):
+    """Numbers of loaded rows."""
+
+    users: int
+    follows: int
+    tweets: int
+    likes: int
+
+
+class PowerLaw:
+    """
+    Random IDs 1..size following Zipf's law.
+
+    The most popular ID is chosen about twice as often as the second one
+    and so on; IDs are shuffled, so that popularity is not tied to age.
+    """
+
+    def __init__(self, rnd: random.Random, size: int, exponent: float):
+        self.ids = list(range(1, size + 1))
+        rnd.shuffle(self.ids)
+        self.cum_weights = list(
+            itertools.accumulate(
+                1 / rank**exponent for rank in range(1, size + 1)
+            )
+        )
+
+    def sample(self, rnd: random.Random, k: int = 1) -> list[int]:
+        """
+        Choose k IDs with repetitions.
+
+        Args:
+            rnd (random.Random): source of randomness.
+            k (int): number of IDs.
+
+        Returns:
+            list[int]: chosen IDs.
+        """
+        return rnd.choices(self.ids, cum_weights=self.cum_weights, k=k)
+
+
+def batched(rows: Iterator[tuple], size: int) -> Iterator[list[tuple]]:
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+def generate_users(count: int) -> Iterator[tuple]:
+    for user_id in range(1, count + 1):
+        yield user_id, f"user{user_id}", f"key{user_id}"
+
+
+def generate_follows(
+    rnd: random.Random,
+    users: int,
+    following: float,
+    celebrities: PowerLaw,
+) -> Iterator[tuple]:
+    for user_id in range(1, users + 1):
+        count = min(int(rnd.expovariate(1 / following)), users - 1)
+        authors = set(celebrities.sample(rnd, count))
+        authors.discard(user_id)
+        for author_id in sorted(authors):
+            yield user_id, author_id
+
+
+def generate_tweets(
+    rnd: random.Random,
+    tweets: int,
+    users: int,
+    likes_per_tweet: float,
+    posters: PowerLaw,
+    follower_counts: collections.Counter,
+) -> Iterator[tuple[tuple, list[tuple]]]:
+    for tweet_id in range(1, tweets + 1):
+        (author_id,) = posters.sample(rnd)
+        fanned_out = follower_counts[author_id] < FANOUT_FOLLOWERS_LIMIT
+        like_count = 0
+        if likes_per_tweet:
+            like_count = min(
+                round(
+                    rnd.paretovariate(LIKES_PARETO_ALPHA) * likes_per_tweet / 3
+                ),
+                users - 1,
+            )
+        content = " ".join(rnd.choices(WORDS, k=rnd.randint(3, 20)))
+        # users but the author, whose like the API does not allow
+        likers = [
+            user_id + (user_id >= author_id)
+            for user_id in rnd.sample(range(1, users), like_count)
+        ]
+        yield (
+            (tweet_id, content, author_id, like_count, fanned_out),
+            [(tweet_id, user_id) for user_id in likers],
+        )
+
+
+async def drop_foreign_keys(conn: AsyncConnection) -> list[tuple[str, ...]]:
+    """
+    Drop foreign keys of all tables in the current schema.
+
+    Args:
+        conn (AsyncConnection): connection in a transaction.
+
+    Returns:
+        list[tuple[str, ...]]: table, name and definition of every key.
+    """
+    result = await conn.execute(
+        text(
+            "SELECT conrelid::regclass::text, quote_ident(conname),"
+            " pg_get_constraintdef(oid) FROM pg_constraint"
+            " WHERE contype = 'f'"
+            " AND connamespace = current_schema()::regnamespace"
+        )
+    )
+    foreign_keys = [tuple(row) for row in result]
+    for table, name, _ in foreign_keys:
+        await conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {name}"))
+    return foreign_keys
+
+
+async def restore_foreign_keys(
+    conn: AsyncConnection,
+    foreign_keys: list[tuple[str, ...]],
+) -> None:
+    """
+    Add dropped foreign keys back, checking the rows.
+
+    Args:
+        conn (AsyncConnection): connection in a transaction.
+        foreign_keys (list[tuple[str, ...]]): keys from drop_foreign_keys.
+    """
+    for table, name, definition in foreign_keys:
+        await conn.execute(
+            text(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+        )
+
+
+async def seed_database(
+    db_engine: AsyncEngine,
+    users: int,
+    tweets: int,
+    likes: int,
+    following: float = 20,
+    exponent: float = 1.1,
+    seed: int = 0,
+    batch_size: int = SEED_BATCH_SIZE,
+) -> SeedStats:
+    """
+    Load generated data into empty tables in one transaction.
+
+    Foreign keys are dropped for the time of loading, so the tables
+    are locked until it ends.
+
+    Args:
+        db_engine (AsyncEngine): engine of the database.
+        users (int): number of users.
+        tweets (int): number of tweets.
+        likes (int): approximate number of likes.
+        following (float): mean number of authors followed by a user.
+        exponent (float): exponent of the power law of popularity.
+        seed (int): seed of the random generator.
+        batch_size (int): rows sent by one COPY.
+
+    Raises:
+        ValueError: if the tables already contain users.
+
+    Returns:
+        SeedStats: numbers of loaded rows.
+    """
+    rnd = random.Random(seed)
+    celebrities = PowerLaw(rnd, users, exponent)
+    posters = PowerLaw(rnd, users, exponent / 2)
+    likes_per_tweet = likes / tweets if tweets else 0
+    follow_count = like_count = 0
+    follower_counts = collections.Counter()
+
+    async with db_engine.connect() as conn:
+        if await conn.scalar(select(func.count()).select_from(User)):
+            raise ValueError("Users table is not empty")
+        # checking every row by triggers is several times slower
+        # than checking all of them at once when a constraint is added
+        foreign_keys = await drop_foreign_keys(conn)
+        raw_connection = await conn.get_raw_connection()
+        copy = raw_connection.driver_connection.copy_records_to_table
+
+        for batch in batched(generate_users(users), batch_size):
+            await copy(
+                "users", records=batch, columns=["id", "name", "api_key"]
+            )
+
+        follows = generate_follows(rnd, users, following, celebrities)
+        for batch in batched(follows, batch_size):
+            await copy(
+                "associated_followers",
+                records=batch,
+                columns=["follower_id", "following_id"],
+            )
+            follow_count += len(batch)
+            follower_counts.update(author_id for _, author_id in batch)
+
+        generated = generate_tweets(
+            rnd, tweets, users, likes_per_tweet, posters, follower_counts
+        )
+        for batch in batched(generated, batch_size):
+            await copy(
+                "tweets",
+                records=[tweet for tweet, _ in batch],
+                columns=[
+                    "id",
+                    "content",
+                    "author_id",
+                    "like_count",
+                    "fanned_out",
+                ],
+            )
+            tweet_likes = [like for _, likers in batch for like in likers]
+            await copy(
+                "associated_likes",
+                records=tweet_likes,
+                columns=["tweet_id", "user_id"],
+            )
+            like_count += len(tweet_likes)
+
+        # the session joins the transaction, its commits don't end it
+        async with AsyncSession(bind=conn) as session:
+            for sequence, model in SEQUENCES.items():
+                await session.execute(
+                    select(func.setval(sequence, func.max(model.id)))
+                )
+            await repair_counters(session)
+            await rebuild_inbox(session)
+
+        await restore_foreign_keys(conn, foreign_keys)
+        await conn.commit()
+
+    async with db_engine.begin() as conn:
+        # planner statistics of the new rows
+        await conn.execute(text("ANALYZE"))
+
+    return SeedStats(users, follow_count, tweets, like_count)
+
+
+async def truncate_database(db_engine: AsyncEngine) -> None:
+    """
+    Delete all users, tweets, media, their relations and tombstones.
+
+    Args:
+        db_engine (AsyncEngine): engine of the database.
+    """
+    async with db_engine.begin() as conn:
+        await conn.execute(text(f"TRUNCATE {', '.join(SEEDED_TABLES)}"))
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.truncate:
+        await truncate_database(engine)
+    stats = await seed_database(
+        engine,
+        users=args.users,
+        tweets=args.tweets,
+        likes=args.likes,
+        following=args.following,
+        exponent=args.exponent,
+        seed=args.seed,
+        batch_size=args.batch_size,
+    )
+    print(
+        f"{stats.users} users, {stats.follows} follows, "
+        f"{stats.tweets} tweets and {stats.likes} likes loaded"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--tweets", type=int, default=100000)
+    parser.add_argument("--likes", type=int, default=300000)
+    parser.add_argument(
+        "--following", type=float, default=20, help="mean follows per user"
+    )
+    parser.add_argument(
+        "--exponent", type=float, default=1.1, help="power law of popularity"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE)
+    parser.add_argument(
+        "--truncate", action="store_true", help="delete existing data first"
+    )
+    asyncio.run(main(parser.parse_args()))
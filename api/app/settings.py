@@ -0,0 +1,115 @@
+"""Application settings taken from environment variables."""
+
+import dataclasses
+import os
+
+
+@dataclasses.dataclass(frozen=True)
+class Settings:
+    """
+    Settings of the application.
+
+    Every field can be overridden by the environment variable
+    with the same name in upper case, e.g. DB_POOL_SIZE=20.
+    """
+
+    database_url: str = "postgresql+asyncpg://admin:admin@db"
+    # optional replica for GET requests, empty to read from the primary
+    read_database_url: str = ""
+    # seconds during which reads of a user who wrote go to the primary
+    read_your_writes_seconds: float = 5
+    # key signing the cookie of the last write, the same in all workers;
+    # database_url is used if it is empty
+    secret_key: str = ""
+    # log every statement, slows down the application
+    db_echo: bool = False
+    # connections kept open by the pool of every worker
+    db_pool_size: int = 5
+    # connections opened above db_pool_size under load
+    db_max_overflow: int = 10
+    # seconds to wait for a free connection before an error
+    db_pool_timeout: float = 30
+    # seconds after which a connection is reopened, -1 to disable
+    db_pool_recycle: int = 1800
+    # check a connection with a round trip before handing it out
+    db_pool_pre_ping: bool = True
+    # prepared statements cached per connection by SQLAlchemy and asyncpg,
+    # 0 for pgbouncer in transaction mode: statements get unique names
+    db_statement_cache_size: int = 100
+
+    # directory of uploaded media and the maximum size of a file in bytes
+    media_dir: str = "./images"
+    media_max_size: int = 20 * 1024 * 1024
+    # internal nginx location sending media files by X-Accel-Redirect,
+    # empty to send them from the application
+    media_accel_redirect: str = ""
+    # processes making variants of uploaded images
+    media_workers: int = 2
+    # unattached media older than the grace period in seconds are deleted
+    # every media_gc_interval seconds in batches, 0 disables the collector
+    media_gc_grace_period: float = 24 * 60 * 60
+    media_gc_interval: float = 60 * 60
+    media_gc_batch_size: int = 100
+    # pause between batches in seconds to spread disk and database load
+    media_gc_pause: float = 0.5
+
+    # tombstones of deleted tweets older than the retention in seconds
+    # are pruned every changes_prune_interval seconds, 0 disables pruning;
+    # clients synced before a pruned tombstone reload the timeline
+    changes_retention: float = 7 * 24 * 60 * 60
+    changes_prune_interval: float = 60 * 60
+
+    # inboxes of home feeds are trimmed to the newest inbox_max_size
+    # tweets every inbox_trim_interval seconds, 0 disables trimming;
+    # older tweets of fanned-out authors drop out of the home feed
+    inbox_max_size: int = 800
+    inbox_trim_interval: float = 60 * 60
+
+    # events kept for a slow client of the live stream before it is
+    # disconnected, and seconds between keep-alive comments of the stream
+    events_queue_size: int = 100
+    events_heartbeat: float = 15
+
+    # requests executing more SQL statements are logged as warnings
+    request_query_budget: int = 20
+
+    auth_cache_size: int = 10000
+    auth_cache_ttl: float = 60
+
+    # pages of the timeline kept serialized for ttl seconds, writes of the
+    # same worker drop them, 0 only joins concurrent loads of a page
+    timeline_cache_size: int = 256
+    timeline_cache_ttl: float = 1
+    # serialized profiles kept for ttl seconds, follows drop them at once
+    # in all workers
+    profile_cache_size: int = 10000
+    profile_cache_ttl: float = 60
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """
+        Create settings overriding defaults by environment variables.
+
+        Raises:
+            ValueError: if a variable can't be converted to the field type.
+
+        Returns:
+            Settings: settings instance.
+        """
+        values = {}
+        for field in dataclasses.fields(cls):
+            raw = os.environ.get(field.name.upper())
+            if raw is None:
+                continue
+            if field.type is bool:
+                values[field.name] = raw.strip().lower() in {
+                    "1",
+                    "true",
+                    "yes",
+                }
+            else:
+                values[field.name] = field.type(raw)
+        return cls(**values)
+
+
+settings = Settings.from_env()
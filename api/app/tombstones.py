@@ -0,0 +1,105 @@
+"""
+Pruning of old tombstones of deleted tweets.
+
+Tombstones let syncing clients remove deleted tweets (see GET
+/api/tweets/changes). The ones older than the retention period are
+deleted and the change horizon is moved past them; clients synced before
+the horizon reload the whole timeline.
+
+Usage:
+    python -m app.tombstones
+"""
+
+import asyncio
+import logging
+from datetime import timedelta
+
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .database import async_session
+from .models import change_horizon, tweet_tombstones
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+# the only row of change_horizon
+HORIZON_ID = 1
+
+
+async def prune_tombstones(
+    session: AsyncSession,
+    retention: float = settings.changes_retention,
+) -> int:
+    """
+    Delete tombstones older than the retention period.
+
+    Args:
+        session (AsyncSession): async session instance.
+        retention (float): age in seconds of tombstones to delete.
+
+    Returns:
+        int: number of deleted tombstones.
+    """
+    result = await session.execute(
+        delete(tweet_tombstones)
+        .where(
+            tweet_tombstones.c.deleted_at
+            < func.now() - timedelta(seconds=retention)
+        )
+        .returning(tweet_tombstones.c.version)
+    )
+    versions = result.scalars().all()
+    if not versions:
+        await session.rollback()
+        return 0
+
+    horizon = pg_insert(change_horizon).values(
+        id=HORIZON_ID, version=max(versions)
+    )
+    await session.execute(
+        horizon.on_conflict_do_update(
+            index_elements=[change_horizon.c.id],
+            set_={
+                "version": func.greatest(
+                    change_horizon.c.version, horizon.excluded.version
+                )
+            },
+        )
+    )
+    await session.commit()
+    return len(versions)
+
+
+async def run_periodically(
+    session_maker: async_sessionmaker = async_session,
+    interval: float = settings.changes_prune_interval,
+) -> None:
+    """
+    Prune tombstones every interval seconds until cancelled.
+
+    Args:
+        session_maker (async_sessionmaker): factory of sessions.
+        interval (float): pause in seconds between runs.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_maker() as session:
+                pruned = await prune_tombstones(session)
+        except Exception:
+            logger.exception("Pruning of tombstones failed")
+            continue
+        if pruned:
+            logger.info("Tombstones pruned: %d", pruned)
+
+
+async def main() -> None:
+    async with async_session() as session:
+        pruned = await prune_tombstones(session)
+    print(f"{pruned} tombstones pruned")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,263 @@
+"""Streaming upload of media files into content-addressed storage."""
+
+import hashlib
+import os
+import uuid
+from typing import NamedTuple
+
+import aiofiles
+from fastapi import HTTPException, Request, status
+from multipart.multipart import MultipartParser, parse_options_header
+
+from .media_processing import sniff_mime_type
+
+# room for boundaries and part headers around the file in the request body
+MULTIPART_OVERHEAD = 64 * 1024
+# leading bytes of the file checked to find its type
+SNIFF_SIZE = 16
+# extension of the stored name by the type sniffed from the content,
+# files of other types are stored without an extension
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+
+class SavedFile(NamedTuple):
+    path: str
+    size: int
+    checksum: str
+    temp_path: str
+
+
+class FileUploadParser:
+    """
+    Multipart parser that streams one file field into the storage.
+
+    Callbacks of python-multipart are synchronous, so they only collect
+    data of the file; it is written to disk between chunks of the request
+    body, in blocks of chunk_size bytes.
+    """
+
+    def __init__(
+        self,
+        field_name: str,
+        directory: str,
+        max_size: int,
+        chunk_size: int,
+    ) -> None:
+        """
+        Prepare the parser for one request.
+
+        Args:
+            field_name (str): name of the form field with the file.
+            directory (str): directory the file is saved to.
+            max_size (int): maximum size of the file in bytes.
+            chunk_size (int): size of blocks written to disk.
+        """
+        self.field_name = field_name
+        self.directory = directory
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.filename: str | None = None
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._head = b""
+        self._pending = bytearray()
+        self._in_file = False
+        self._file_done = False
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def on_part_begin(self) -> None:
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if name != self.field_name or not filename or self._file_done:
+            return
+        self.filename = filename.decode("utf-8", "replace")
+        self._in_file = True
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if not self._in_file:
+            return
+        chunk = data[start:end]
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            raise_too_large(self.max_size)
+        self._hash.update(chunk)
+        if len(self._head) < SNIFF_SIZE:
+            self._head += chunk[: SNIFF_SIZE - len(self._head)]
+        self._pending += chunk
+
+    def on_part_end(self) -> None:
+        if self._in_file:
+            self._in_file = False
+            self._file_done = True
+
+    @property
+    def extension(self) -> str:
+        """
+        Return the extension of the type sniffed from the content.
+
+        The name of the client file is ignored, so the same content is
+        always stored under the same name.
+
+        Returns:
+            str: extension with the leading dot or an empty string.
+        """
+        return EXTENSIONS.get(sniff_mime_type(self._head), "")
+
+    async def save(self, request: Request) -> SavedFile:
+        """
+        Read the request body and write the file as it arrives.
+
+        The file is named by its SHA-256 checksum, so the content behind
+        a path never changes and equal files are stored once. It is left
+        in a temporary file until store_file puts it in place.
+
+        Args:
+            request (Request): request with multipart/form-data body.
+
+        Raises:
+            HTTPException: if there is no file in the body or it is too big.
+
+        Returns:
+            SavedFile: path, size, SHA-256 checksum and temporary path
+                of the saved file.
+        """
+        content_type, options = parse_options_header(
+            request.headers.get("content-type", "")
+        )
+        if (
+            content_type != b"multipart/form-data"
+            or b"boundary" not in options
+        ):
+            raise_no_file(self.field_name)
+        content_length = request.headers.get("content-length", "")
+        # oversized bodies are rejected before reading them,
+        # the exact size of the file is checked while streaming
+        limit = self.max_size + MULTIPART_OVERHEAD
+        if content_length.isdigit() and int(content_length) > limit:
+            raise_too_large(self.max_size)
+
+        parser = MultipartParser(
+            options[b"boundary"],
+            {
+                "on_part_begin": self.on_part_begin,
+                "on_part_data": self.on_part_data,
+                "on_part_end": self.on_part_end,
+                "on_header_field": self.on_header_field,
+                "on_header_value": self.on_header_value,
+                "on_header_end": self.on_header_end,
+                "on_headers_finished": self.on_headers_finished,
+            },
+        )
+        # the name is known only at the end, so the file is streamed into
+        # a temporary file in the same directory and renamed in place
+        temp_path = os.path.join(self.directory, f".{uuid.uuid4().hex}.part")
+        file = None
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if file is None and self.filename:
+                    file = await aiofiles.open(temp_path, mode="wb")
+                if file is None or not self._pending:
+                    continue
+                if len(self._pending) >= self.chunk_size or self._file_done:
+                    await file.write(bytes(self._pending))
+                    self._pending.clear()
+            parser.finalize()
+            if not self._file_done:
+                raise_no_file(self.field_name)
+        except BaseException:
+            if file is not None:
+                await file.close()
+                os.remove(temp_path)
+            raise
+        await file.close()
+
+        checksum = self._hash.hexdigest()
+        path = os.path.join(self.directory, checksum + self.extension)
+        return SavedFile(path, self.size, checksum, temp_path)
+
+
+def store_file(saved_file: SavedFile) -> None:
+    """
+    Put a saved file in place unless the same content is already stored.
+
+    Args:
+        saved_file (SavedFile): file saved by save_upload.
+    """
+    if os.path.exists(saved_file.path):
+        os.remove(saved_file.temp_path)
+    else:
+        os.replace(saved_file.temp_path, saved_file.path)
+
+
+def discard_file(saved_file: SavedFile) -> None:
+    """
+    Delete a saved file which is not put in place.
+
+    Args:
+        saved_file (SavedFile): file saved by save_upload.
+    """
+    if os.path.exists(saved_file.temp_path):
+        os.remove(saved_file.temp_path)
+
+
+def raise_no_file(field_name: str):
+    raise HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail=f"Ожидается файл в поле {field_name} формы multipart/form-data",
+    )
+
+
+def raise_too_large(max_size: int):
+    raise HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Размер файла превышает {max_size} байт",
+    )
+
+
+async def save_upload(
+    request: Request,
+    field_name: str,
+    directory: str,
+    max_size: int,
+    chunk_size: int,
+) -> SavedFile:
+    """
+    Stream a file from multipart request body to a temporary file.
+
+    Args:
+        request (Request): request with multipart/form-data body.
+        field_name (str): name of the form field with the file.
+        directory (str): directory the file is saved to.
+        max_size (int): maximum size of the file in bytes.
+        chunk_size (int): size of blocks written to disk.
+
+    Returns:
+        SavedFile: path, size, SHA-256 checksum and temporary path
+            of the saved file.
+    """
+    parser = FileUploadParser(field_name, directory, max_size, chunk_size)
+    return await parser.save(request)
@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from ..api.app.cache import SingleFlightCache, TTLCache
+from ..api.app.dependencies import auth_cache, timeline_cache
+from ..api.app.models import Tweet
+from .conftest import assert_query_budget, test_session
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """Check for evicting the least recently used entry when full."""
+
+    cache = TTLCache("test-lru", maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None, "Вытеснена не та запись"
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats() == {"hits": 3, "misses": 1, "size": 2}
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    """Check for dropping entries older than ttl."""
+
+    cache = TTLCache("test-ttl", maxsize=2, ttl=10)
+    monkeypatch.setattr("time.monotonic", lambda: 100.0)
+    cache.set("a", 1)
+    monkeypatch.setattr("time.monotonic", lambda: 111.0)
+    assert cache.get("a") is None, "Запись не устарела"
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_auth_cache_hits(client: AsyncClient):
+    """Check for authorizing repeated requests from the auth cache."""
+
+    await client.get("/api/users/me", headers={"api-key": "test"})
+    hits = auth_cache.hits
+    response = await client.get("/api/users/me", headers={"api-key": "test"})
+    assert response.status_code == 200, "Запрос не выполнен"
+    assert auth_cache.hits == hits + 1, "Ключ не взят из кэша"
+
+    await client.get("/api/users/me", headers={"api-key": "incorrect-key"})
+    assert auth_cache.get("incorrect-key") is None, "Неверный ключ закэширован"
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cache_coalesces_loads():
+    """Check for one load shared by concurrent lookups of a key."""
+
+    cache = SingleFlightCache("test-single-flight", maxsize=2, ttl=60)
+    loads = 0
+
+    async def load():
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.01)
+        return loads
+
+    values = await asyncio.gather(
+        *(cache.get_or_load("a", load) for _ in range(5))
+    )
+    assert values == [1] * 5 and loads == 1, "Загрузка не объединена"
+    assert await cache.get_or_load("a", load) == 1, "Значение не закэшировано"
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1, "coalesced": 4}
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cache_clear_during_load():
+    """Check for not caching a load started before clear."""
+
+    cache = SingleFlightCache("test-single-flight-clear", maxsize=2, ttl=60)
+    started = asyncio.Event()
+
+    async def load():
+        started.set()
+        await asyncio.sleep(0.01)
+        return "old"
+
+    task = asyncio.create_task(cache.get_or_load("a", load))
+    await started.wait()
+    cache.clear()
+
+    async def reload():
+        return "new"
+
+    assert (
+        await cache.get_or_load("a", reload) == "new"
+    ), "Новый запрос получил старое значение"
+    assert await task == "old"
+    assert cache.get("a") == "new", "Закэшировано устаревшее значение"
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cache_errors_and_cancellation():
+    """Check for sharing errors and reloading after a cancelled load."""
+
+    cache = SingleFlightCache("test-single-flight-errors", maxsize=2, ttl=60)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("error")
+
+    results = await asyncio.gather(
+        cache.get_or_load("a", fail),
+        cache.get_or_load("a", fail),
+        return_exceptions=True,
+    )
+    assert all(
+        isinstance(result, ValueError) for result in results
+    ), "Ошибка не передана"
+    assert len(cache) == 0, "Ошибка закэширована"
+
+    async def hang():
+        await asyncio.sleep(60)
+
+    async def load():
+        return "loaded"
+
+    leader = asyncio.create_task(cache.get_or_load("b", hang))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_load("b", load))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await waiter == "loaded", "Ожидающий запрос не загрузил значение"
+
+
+@pytest.mark.asyncio
+async def test_timeline_cache(client: AsyncClient):
+    """Check for serving the timeline from the cache until a write."""
+
+    headers = {"api-key": "test"}
+    first = await client.get("/api/tweets", headers=headers)
+    hits = timeline_cache.hits
+    cached = await client.get("/api/tweets", headers=headers)
+    assert timeline_cache.hits == hits + 1, "Лента не взята из кэша"
+    assert cached.content == first.content, "Кэш вернул другую ленту"
+    assert (
+        cached.headers["etag"] == first.headers["etag"]
+    ), "Кэш вернул другой ETag"
+    # the ETag is still checked against the database
+    assert_query_budget(cached, 1)
+
+    await client.post(
+        "/api/tweets", json={"tweet_data": "new"}, headers=headers
+    )
+    response = await client.get("/api/tweets", headers=headers)
+    assert len(response.json()["tweets"]) == 2, "Кэш не сброшен после записи"
+
+
+@pytest.mark.asyncio
+async def test_timeline_cache_checks_etag(client: AsyncClient):
+    """Check for not serving a cached page older than the database."""
+
+    headers = {"api-key": "test"}
+    await client.get("/api/tweets", headers=headers)
+    # a change the cache of this worker is not told about
+    async with test_session() as session:
+        session.add(Tweet(content="unseen", author_id=2))
+        await session.commit()
+
+    response = await client.get("/api/tweets", headers=headers)
+    assert (
+        len(response.json()["tweets"]) == 2
+    ), "Отдана устаревшая лента из кэша"
@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import insert, update
+
+from ..api.app.models import tweet_tombstones
+from ..api.app.routes.crud import get_changes
+from ..api.app.tombstones import prune_tombstones
+from .conftest import test_session
+
+HEADERS = {"api-key": "test"}
+
+
+async def get_changes_since(client: AsyncClient, since: int) -> dict:
+    """Return the changes of the timeline since the version."""
+
+    response = await client.get(
+        "/api/tweets/changes", params={"since": since}, headers=HEADERS
+    )
+    assert response.status_code == 200, "Запрос не выполнен"
+    return response.json()
+
+
+@pytest.mark.asyncio
+async def test_changes_since_version(client: AsyncClient):
+    """Check for returning only created, deleted and liked tweets."""
+
+    first = await get_changes_since(client, 0)
+    assert [tweet["id"] for tweet in first["created"]] == [
+        1
+    ], "Нет существующего твита"
+    assert not first["resync"], "Лишняя полная синхронизация"
+
+    response = await client.post(
+        "/api/tweets", json={"tweet_data": "new"}, headers=HEADERS
+    )
+    new_id = response.json()["tweet_id"]
+    response = await client.post(
+        "/api/tweets", json={"tweet_data": "gone"}, headers=HEADERS
+    )
+    gone_id = response.json()["tweet_id"]
+    await client.delete(f"/api/tweets/{gone_id}", headers=HEADERS)
+    await client.delete("/api/tweets/1/likes", headers=HEADERS)
+
+    changes = await get_changes_since(client, first["version"])
+    assert changes["version"] > first["version"], "Версия не выросла"
+    assert [tweet["id"] for tweet in changes["created"]] == [
+        new_id
+    ], "Неверные новые твиты"
+    assert changes["created"][0]["content"] == "new", "Твит без содержимого"
+    assert changes["deleted"] == [gone_id], "Неверные удаленные твиты"
+    assert changes["likes"] == [
+        {"id": 1, "like_count": 0}
+    ], "Неверные счетчики лайков"
+
+    unchanged = await get_changes_since(client, changes["version"])
+    assert (
+        unchanged["created"]
+        == unchanged["deleted"]
+        == unchanged["likes"]
+        == []
+    ), "Изменения возвращены повторно"
+
+
+@pytest.mark.asyncio
+async def test_changes_resync(client: AsyncClient):
+    """Check for a full resync when the version is too old or unknown."""
+
+    since = (await get_changes_since(client, 0))["version"]
+    response = await client.post(
+        "/api/tweets", json={"tweet_data": "gone"}, headers=HEADERS
+    )
+    await client.delete(
+        f"/api/tweets/{response.json()['tweet_id']}", headers=HEADERS
+    )
+    await client.post(
+        "/api/tweets", json={"tweet_data": "one"}, headers=HEADERS
+    )
+    await client.post(
+        "/api/tweets", json={"tweet_data": "two"}, headers=HEADERS
+    )
+
+    async with test_session() as session:
+        version, changes = await get_changes(session, since=since, limit=1)
+        assert (
+            changes is None
+        ), "Нет полной синхронизации при превышении лимита"
+
+        deleted_at = tweet_tombstones.c.deleted_at - timedelta(days=30)
+        await session.execute(
+            update(tweet_tombstones).values(deleted_at=deleted_at)
+        )
+        await session.commit()
+        assert (
+            await prune_tombstones(session, retention=3600) == 1
+        ), "Надгробие не удалено"
+
+    assert (await get_changes_since(client, since))[
+        "resync"
+    ], "Нет полной синхронизации"
+    assert (await get_changes_since(client, 2**62))[
+        "resync"
+    ], "Неизвестная версия принята"
+    assert not (await get_changes_since(client, version))[
+        "resync"
+    ], "Лишняя синхронизация"
+
+
+@pytest.mark.asyncio
+async def test_delete_tweet_with_reused_id(client: AsyncClient):
+    """Check for deleting a tweet whose ID has a tombstone left before."""
+
+    first = await get_changes_since(client, 0)
+    response = await client.post(
+        "/api/tweets", json={"tweet_data": "new"}, headers=HEADERS
+    )
+    tweet_id = response.json()["tweet_id"]
+    async with test_session() as session:
+        await session.execute(
+            insert(tweet_tombstones).values(tweet_id=tweet_id, version=0)
+        )
+        await session.commit()
+
+    response = await client.delete(f"/api/tweets/{tweet_id}", headers=HEADERS)
+
+    assert response.status_code == 200, "Твит не удален"
+    changes = await get_changes_since(client, first["version"])
+    assert tweet_id in changes["deleted"], "Удаление не попало в изменения"
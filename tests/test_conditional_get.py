@@ -0,0 +1,93 @@
+import pytest
+from httpx import AsyncClient
+
+HEADERS = {"api-key": "test"}
+
+
+async def revalidate(client: AsyncClient, url: str, etag: str) -> int:
+    """Repeat the request with the ETag and return the status code."""
+
+    response = await client.get(
+        url, headers={**HEADERS, "if-none-match": etag}
+    )
+    return response.status_code
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "url", ["/api/tweets", "/api/tweets/feed", "/api/users/me", "/api/users/1"]
+)
+async def test_not_modified(client: AsyncClient, url: str):
+    """Check for an empty 304 response while the data is unchanged."""
+
+    response = await client.get(url, headers=HEADERS)
+    assert response.status_code == 200, "Запрос не выполнен"
+    etag = response.headers["etag"]
+    assert (
+        response.headers["cache-control"] == "private, no-cache"
+    ), "Нет Cache-Control"
+
+    response = await client.get(
+        url, headers={**HEADERS, "if-none-match": f'"other", W/{etag}'}
+    )
+    assert response.status_code == 304, "Данные отправлены повторно"
+    assert response.content == b"", "Ответ 304 с телом"
+    assert response.headers["etag"] == etag, "Ответ 304 без ETag"
+
+
+@pytest.mark.asyncio
+async def test_timeline_etag_changes(client: AsyncClient):
+    """Check for a new ETag of the timeline after a like, a tweet, a delete."""
+
+    etag = (await client.get("/api/tweets", headers=HEADERS)).headers["etag"]
+    await client.delete("/api/tweets/1/likes", headers=HEADERS)
+    assert (
+        await revalidate(client, "/api/tweets", etag) == 200
+    ), "Лайк не изменил ETag"
+
+    etag = (await client.get("/api/tweets", headers=HEADERS)).headers["etag"]
+    response = await client.post(
+        "/api/tweets", json={"tweet_data": "new"}, headers=HEADERS
+    )
+    assert (
+        await revalidate(client, "/api/tweets", etag) == 200
+    ), "Новый твит не изменил ETag"
+
+    etag = (await client.get("/api/tweets", headers=HEADERS)).headers["etag"]
+    await client.delete(
+        f"/api/tweets/{response.json()['tweet_id']}", headers=HEADERS
+    )
+    assert (
+        await revalidate(client, "/api/tweets", etag) == 200
+    ), "Удаление не изменило ETag"
+
+    other = (await client.get("/api/tweets?limit=1", headers=HEADERS)).headers[
+        "etag"
+    ]
+    assert (
+        other
+        != (await client.get("/api/tweets", headers=HEADERS)).headers["etag"]
+    ), "Одинаковый ETag у страниц разного размера"
+
+
+@pytest.mark.asyncio
+async def test_profile_etag_changes(client: AsyncClient):
+    """Check for new ETags of both users after a follow and an unfollow."""
+
+    me = (await client.get("/api/users/me", headers=HEADERS)).headers["etag"]
+    other = (await client.get("/api/users/3", headers=HEADERS)).headers["etag"]
+
+    response = await client.delete("/api/users/3/follow", headers=HEADERS)
+    assert response.status_code == 200, "Отписка не выполнена"
+    assert (
+        await revalidate(client, "/api/users/me", me) == 200
+    ), "Отписка не изменила ETag"
+    assert (
+        await revalidate(client, "/api/users/3", other) == 200
+    ), "ETag автора не изменился"
+
+    me = (await client.get("/api/users/me", headers=HEADERS)).headers["etag"]
+    await client.delete("/api/users/3/follow", headers=HEADERS)
+    assert (
+        await revalidate(client, "/api/users/me", me) == 304
+    ), "Повторная отписка изменила ETag"
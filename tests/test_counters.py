@@ -0,0 +1,29 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import update
+
+from ..api.app.counters import repair_counters
+from ..api.app.models import Tweet, User
+from .conftest import test_session
+
+
+@pytest.mark.asyncio
+async def test_repair_counters(client: AsyncClient):
+    """Check for recomputing drifted counters from the association tables."""
+
+    async with test_session() as session:
+        await session.execute(update(Tweet).values(like_count=10))
+        await session.execute(update(User).values(follower_count=10))
+        await session.commit()
+
+        fixed = await repair_counters(session, batch_size=2)
+
+    assert fixed == {"tweets": 1, "users": 3}, "Неверное число исправлений"
+    response = await client.get("/api/users/3", headers={"api-key": "test"})
+    assert (
+        response.json()["user"]["follower_count"] == 1
+    ), "Счетчик не исправлен"
+    response = await client.get("/api/tweets", headers={"api-key": "test"})
+    assert (
+        response.json()["tweets"][0]["like_count"] == 1
+    ), "Счетчик не исправлен"
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from ..api.app import init_db, migrate
+from ..api.app.database import warm_up_pool
+from ..api.app.main import app
+from ..api.app.models import User
+from ..api.app.routes import health
+from .conftest import DATABASE_URL, engine, test_session
+from .test_migrations import drop_schema
+
+
+@pytest.mark.asyncio
+async def test_liveness(client: AsyncClient):
+    """Check for the liveness probe."""
+
+    response = await client.get("/api/health/live")
+    assert response.status_code == 200, "Запрос не выполнен"
+    assert response.json() == {"result": True}, "Неверный формат ответа"
+
+
+@pytest.mark.asyncio
+async def test_readiness(client: AsyncClient, monkeypatch):
+    """Check for the readiness probe before and after startup."""
+
+    monkeypatch.setattr(health, "engine", engine)
+    monkeypatch.setattr(app.state, "ready", False, raising=False)
+    response = await client.get("/api/health/ready")
+    assert response.status_code == 503, "Приложение готово до запуска"
+    assert "message" in response.json(), "Неверный формат ответа"
+
+    monkeypatch.setattr(app.state, "ready", True)
+    response = await client.get("/api/health/ready")
+    assert response.status_code == 200, "Приложение не готово после запуска"
+
+
+@pytest.mark.asyncio
+async def test_bootstrap_in_concurrent_workers():
+    """Check for the database initialized once by workers starting together."""
+
+    await drop_schema()
+
+    await asyncio.gather(
+        *(init_db.bootstrap_database(engine, test_session) for _ in range(4))
+    )
+
+    assert (
+        await migrate.check_database(engine) == []
+    ), "Схема отличается от моделей"
+    async with test_session() as session:
+        users = await session.scalar(select(func.count()).select_from(User))
+    assert users == 2, "База данных заполнена несколько раз"
+
+
+@pytest.mark.asyncio
+async def test_warm_up_pool():
+    """Check for opening connections of the pool in advance."""
+
+    pool_engine = create_async_engine(DATABASE_URL, pool_size=3)
+    try:
+        await warm_up_pool(pool_engine, 3)
+        pool = pool_engine.sync_engine.pool
+        assert pool.checkedin() == 3, "Соединения не открыты заранее"
+        assert pool.checkedout() == 0, "Соединения не возвращены в пул"
+    finally:
+        await pool_engine.dispose()
@@ -0,0 +1,125 @@
+import os
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, select, update
+
+from ..api.app.media_gc import collect_media
+from ..api.app.models import Media
+from ..api.app.routes import media
+from .conftest import test_session
+from .test_media_routes import make_png, upload
+
+
+async def age_media(*media_ids: int) -> None:
+    """Move upload time of media two hours back."""
+
+    async with test_session() as session:
+        await session.execute(
+            update(Media)
+            .where(Media.id.in_(media_ids))
+            .values(created_at=func.now() - func.make_interval(0, 0, 0, 0, 2))
+        )
+        await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_collect_orphaned_media(client: AsyncClient, media_dir):
+    """Check for deleting old unattached media with their files."""
+
+    orphaned = [await upload(client, make_png(400, 400)) for _ in range(3)]
+    recent = await upload(client, make_png(16, 16))
+    attached = await upload(client, make_png(16, 16))
+    await client.post(
+        "/api/tweets",
+        headers={"api-key": "test"},
+        json={"tweet_data": "test", "tweet_media_ids": [attached]},
+    )
+    await age_media(*orphaned, attached)
+    files_before = set(os.listdir(media_dir))
+    size_before = sum(
+        os.path.getsize(media_dir / name) for name in files_before
+    )
+
+    async with test_session() as session:
+        collected = await collect_media(
+            session, grace_period=3600, batch_size=2, pause=0
+        )
+        media_ids = (
+            await session.scalars(select(Media.id).order_by(Media.id))
+        ).all()
+
+    assert media_ids == [recent, attached], "Удалены не те медиа"
+    assert collected.rows == 3, "Неверное число удаленных медиа"
+    # the upload and three variants of every image
+    assert collected.files == 12, "Неверное число удаленных файлов"
+    assert (
+        len(os.listdir(media_dir)) == len(files_before) - 12
+    ), "Файлы не удалены"
+    size_after = sum(
+        os.path.getsize(media_dir / name) for name in os.listdir(media_dir)
+    )
+    assert (
+        collected.bytes == size_before - size_after
+    ), "Неверный объем удаленных файлов"
+
+
+@pytest.mark.asyncio
+async def test_collect_media_of_deleted_tweet(client: AsyncClient, media_dir):
+    """Check for deleting media of a deleted tweet and keeping shared files."""
+
+    content = make_png(16, 16)
+    first = await upload(client, content)
+    response = await client.post(
+        "/api/tweets",
+        headers={"api-key": "test"},
+        json={"tweet_data": "test", "tweet_media_ids": [first]},
+    )
+    tweet_id = response.json()["tweet_id"]
+    # the same content in another tweet is stored in the same file
+    second = await upload(client, content)
+    await client.post(
+        "/api/tweets",
+        headers={"api-key": "test"},
+        json={"tweet_data": "test", "tweet_media_ids": [second]},
+    )
+    await client.delete(f"/api/tweets/{tweet_id}", headers={"api-key": "test"})
+    await age_media(first, second)
+
+    async with test_session() as session:
+        collected = await collect_media(
+            session, grace_period=3600, batch_size=10, pause=0
+        )
+
+    assert collected == (1, 0, 0), "Удален файл, используемый другим медиа"
+    assert (
+        len(os.listdir(media_dir)) == 4
+    ), "Удален файл, используемый другим медиа"
+
+
+@pytest.mark.asyncio
+async def test_collect_media_during_upload(
+    client: AsyncClient, monkeypatch, media_dir
+):
+    """Check for keeping the file of an upload collected before its row."""
+
+    content = make_png(16, 16)
+    orphaned = await upload(client, content)
+    await age_media(orphaned)
+    create_media = media.create_media
+
+    async def collect_and_create(*args, **kwargs):
+        # the collector runs between saving the file and adding its row
+        async with test_session() as session:
+            await collect_media(
+                session, grace_period=3600, batch_size=10, pause=0
+            )
+        return await create_media(*args, **kwargs)
+
+    monkeypatch.setattr(media, "create_media", collect_and_create)
+    media_id = await upload(client, content)
+
+    response = await client.get(
+        f"/api/medias/{media_id}", headers={"api-key": "test"}
+    )
+    assert response.status_code == 200, "Файл загрузки удален сборщиком"
@@ -1,5 +1,30 @@
+import asyncio
+import dataclasses
+import hashlib
+import io
+import os
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+
 import pytest
 from httpx import AsyncClient
+from PIL import Image
+
+from ..api.app import media_processing
+from ..api.app.models import Media
+from ..api.app.routes import media
+from .conftest import test_session
+
+
+def make_png(width: int, height: int) -> bytes:
+    """Return PNG image with random pixels."""
+
+    image = Image.frombytes(
+        "RGB", (width, height), os.urandom(width * height * 3)
+    )
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
 
 
 @pytest.mark.asyncio
@@ -17,3 +42,333 @@ async def test_upload_tweet(client: AsyncClient):
     assert "result" and "media_id" in response.json(), "Неверный формат ответа"
     assert response.json()["result"], "Неверный результат ответа"
     assert response.json()["media_id"] == 1, "Неправильный id медиа"
+
+
+@pytest.mark.asyncio
+async def test_uploaded_file_content(client: AsyncClient, media_dir):
+    """Check for saving the uploaded file byte by byte."""
+
+    content = os.urandom(3 * 1024 * 1024 + 7)
+    files = {"file": ("streamed.bin", content), "comment": (None, "text")}
+    response = await client.post(
+        "/api/medias", headers={"api-key": "test"}, files=files
+    )
+
+    assert response.status_code == 201, "Запрос не выполнен"
+    path = media_dir / hashlib.sha256(content).hexdigest()
+    assert path.read_bytes() == content, "Файл сохранен с ошибками"
+
+
+@pytest.mark.asyncio
+async def test_upload_same_content(client: AsyncClient, media_dir):
+    """
+    Check for storing the same content once.
+
+    The media is reused while it is not attached to a tweet, the name
+    of the file doesn't depend on the client file name.
+    """
+
+    content = make_png(16, 16)
+    checksum = hashlib.sha256(content).hexdigest()
+    path = media_dir / f"{checksum}.png"
+    media_ids = []
+    for filename in ("first.png", "second.PNG", "third.jpeg"):
+        response = await client.post(
+            "/api/medias",
+            headers={"api-key": "test"},
+            files={"file": (filename, content)},
+        )
+        media_ids.append(response.json()["media_id"])
+        if len(media_ids) == 2:
+            await client.post(
+                "/api/tweets",
+                headers={"api-key": "test"},
+                json={"tweet_data": "test", "tweet_media_ids": [media_ids[0]]},
+            )
+
+    assert media_ids == [1, 1, 2], "Неверные id медиа"
+    originals = [name for name in os.listdir(media_dir) if "_" not in name]
+    assert originals == [path.name], "Файл сохранен не один раз"
+    response = await client.get("/api/tweets", headers={"api-key": "test"})
+    assert response.json()["tweets"][0]["attachments"] == [
+        str(media_dir / f"{checksum}_original.png")
+    ], "Неверный путь к файлу"
+
+
+@pytest.mark.asyncio
+async def test_upload_too_large_file(
+    client: AsyncClient, monkeypatch, media_dir
+):
+    """Check for status 413 and no partial file if the file is too large."""
+
+    monkeypatch.setattr(
+        media,
+        "settings",
+        dataclasses.replace(media.settings, media_max_size=1024),
+    )
+    files = {"file": ("too_large.bin", os.urandom(2048))}
+    response = await client.post(
+        "/api/medias", headers={"api-key": "test"}, files=files
+    )
+
+    assert response.status_code == 413, "Слишком большой файл принят"
+    assert os.listdir(media_dir) == [], "Файл не удален"
+
+
+@pytest.mark.asyncio
+async def test_upload_without_file(client: AsyncClient):
+    """Check for status 422 if there is no file in the form."""
+
+    response = await client.post(
+        "/api/medias",
+        headers={"api-key": "test"},
+        files={"image": (None, "text")},
+    )
+    assert response.status_code == 422, "Запрос без файла принят"
+
+
+@pytest.mark.asyncio
+async def test_media_variants(client: AsyncClient, media_dir):
+    """Check for downscaled variants without metadata of an uploaded image."""
+
+    with open("uploaded_image.jpg", "rb") as file:
+        content = file.read()
+    response = await client.post(
+        "/api/medias",
+        headers={"api-key": "test"},
+        files={"file": ("photo.jpg", content)},
+    )
+    media_id = response.json()["media_id"]
+    await client.post(
+        "/api/tweets",
+        headers={"api-key": "test"},
+        json={"tweet_data": "test", "tweet_media_ids": [media_id]},
+    )
+
+    response = await client.get("/api/tweets", headers={"api-key": "test"})
+    variants = response.json()["tweets"][0]["attachment_variants"]
+    checksum = hashlib.sha256(content).hexdigest()
+    assert variants == [
+        {
+            "original": str(media_dir / f"{checksum}_original.jpg"),
+            "thumbnail": str(media_dir / f"{checksum}_thumbnail.jpg"),
+            "preview": str(media_dir / f"{checksum}_preview.jpg"),
+        }
+    ], "Неверные копии файла"
+    with Image.open(variants[0]["thumbnail"]) as image:
+        assert max(image.size) == 320, "Миниатюра не уменьшена"
+        assert "exif" not in image.info, "Метаданные не удалены"
+    with Image.open(variants[0]["original"]) as image:
+        assert "exif" not in image.info, "Метаданные оригинала не удалены"
+
+
+@pytest.mark.asyncio
+async def test_media_not_image(client: AsyncClient, media_dir):
+    """Check for rejecting a file which is not an image despite its name."""
+
+    response = await client.post(
+        "/api/medias",
+        headers={"api-key": "test"},
+        files={"file": ("fake.jpg", b"<?php echo 1; ?>" * 64)},
+    )
+    media_id = response.json()["media_id"]
+    await client.post(
+        "/api/tweets",
+        headers={"api-key": "test"},
+        json={"tweet_data": "test", "tweet_media_ids": [media_id]},
+    )
+
+    response = await client.get("/api/tweets", headers={"api-key": "test"})
+    tweet = response.json()["tweets"][0]
+    assert tweet["attachments"] == [], "Файл неверного типа присоединен"
+    assert (
+        tweet["attachment_variants"] == []
+    ), "Файл неверного типа присоединен"
+    assert (
+        len(os.listdir(media_dir)) == 1
+    ), "Созданы копии файла неверного типа"
+
+
+class BrokenExecutor(Executor):
+    """Executor whose worker processes have crashed."""
+
+    def submit(self, fn, *args, **kwargs):
+        raise BrokenProcessPool("worker crashed")
+
+
+@pytest.mark.asyncio
+async def test_media_processing_failure(client: AsyncClient, monkeypatch):
+    """Check for failing media when the process pool breaks and a retry."""
+
+    content = make_png(16, 16)
+    start_pool = media_processing.start_pool
+    monkeypatch.setattr(media_processing, "start_pool", BrokenExecutor)
+    monkeypatch.setattr(media_processing, "_semaphore", asyncio.Semaphore())
+    media_id = await upload(client, content)
+
+    async with test_session() as session:
+        failed = await session.get(Media, media_id)
+    assert failed.status == "failed", "Медиа не отмечено как сбойное"
+    response = await client.get(
+        f"/api/medias/{media_id}", headers={"api-key": "test"}
+    )
+    assert response.status_code == 404, "Сбойное медиа опубликовано"
+
+    monkeypatch.setattr(media_processing, "start_pool", start_pool)
+    assert (
+        await upload(client, content) == media_id
+    ), "Медиа не переиспользовано"
+    response = await client.get(
+        f"/api/medias/{media_id}", headers={"api-key": "test"}
+    )
+    assert response.status_code == 200, "Медиа не обработано повторно"
+
+
+async def upload(
+    client: AsyncClient, content: bytes, filename: str = "photo.png"
+) -> int:
+    """Upload a file and return its id."""
+
+    response = await client.post(
+        "/api/medias",
+        headers={"api-key": "test"},
+        files={"file": (filename, content)},
+    )
+    return response.json()["media_id"]
+
+
+@pytest.mark.asyncio
+async def test_download_media(client: AsyncClient):
+    """Check for downloading a media file and its validators."""
+
+    content = make_png(64, 64)
+    media_id = await upload(client, content)
+
+    response = await client.get(
+        f"/api/medias/{media_id}", headers={"api-key": "test"}
+    )
+    assert response.status_code == 200, "Запрос не выполнен"
+    assert response.content == content, "Неверное содержимое файла"
+    assert (
+        response.headers["content-type"] == "image/png"
+    ), "Неверный тип файла"
+    etag = response.headers["etag"]
+
+    response = await client.get(
+        f"/api/medias/{media_id}",
+        headers={"api-key": "test", "if-none-match": etag},
+    )
+    assert response.status_code == 304, "Не учтен заголовок If-None-Match"
+    assert response.content == b"", "Тело ответа 304 не пустое"
+
+    response = await client.get(
+        f"/api/medias/{media_id}",
+        headers={"api-key": "test"},
+        params={"variant": "thumbnail"},
+    )
+    assert response.headers["etag"] != etag, "Одинаковый ETag у разных файлов"
+
+    response = await client.get("/api/medias/100", headers={"api-key": "test"})
+    assert response.status_code == 404, "Найдено несуществующее медиа"
+    response = await client.get(f"/api/medias/{media_id}")
+    assert response.status_code == 422, "Файл отдан без api-key"
+
+
+@pytest.mark.asyncio
+async def test_download_media_range(client: AsyncClient):
+    """Check for downloading byte ranges of a media file."""
+
+    content = make_png(64, 64)
+    size = len(content)
+    media_id = await upload(client, content)
+    url = f"/api/medias/{media_id}"
+
+    cases = [
+        ("bytes=0-99", 206, content[:100], f"bytes 0-99/{size}"),
+        ("bytes=100-", 206, content[100:], f"bytes 100-{size - 1}/{size}"),
+        (
+            "bytes=-10",
+            206,
+            content[-10:],
+            f"bytes {size - 10}-{size - 1}/{size}",
+        ),
+        (f"bytes={size}-", 416, b"", f"bytes */{size}"),
+        ("bytes=0-1,5-6", 200, content, None),
+    ]
+    for byte_range, status_code, body, content_range in cases:
+        response = await client.get(
+            url, headers={"api-key": "test", "range": byte_range}
+        )
+        assert (
+            response.status_code == status_code
+        ), f"Неверный статус для {byte_range}"
+        assert (
+            response.content == body
+        ), f"Неверное содержимое для {byte_range}"
+        assert (
+            response.headers.get("content-range") == content_range
+        ), f"Неверный заголовок Content-Range для {byte_range}"
+
+    response = await client.get(
+        url,
+        headers={"api-key": "test", "range": "bytes=0-9", "if-range": '"old"'},
+    )
+    assert response.status_code == 200, "Не учтен заголовок If-Range"
+
+
+@pytest.mark.asyncio
+async def test_download_media_accel_redirect(
+    client: AsyncClient, monkeypatch, media_dir
+):
+    """Check for handing the file over to nginx by X-Accel-Redirect."""
+
+    monkeypatch.setattr(
+        media,
+        "settings",
+        dataclasses.replace(
+            media.settings, media_accel_redirect="/protected-images/"
+        ),
+    )
+    content = make_png(64, 64)
+    media_id = await upload(client, content)
+
+    response = await client.get(
+        f"/api/medias/{media_id}", headers={"api-key": "test"}
+    )
+    checksum = hashlib.sha256(content).hexdigest()
+    assert response.status_code == 200, "Запрос не выполнен"
+    assert response.content == b"", "Файл отдан приложением"
+    assert (
+        response.headers["x-accel-redirect"]
+        == f"/protected-images/{checksum}_original.png"
+    ), "Неверный путь для nginx"
+
+
+@pytest.mark.asyncio
+async def test_download_legacy_media_accel_redirect(
+    client: AsyncClient, monkeypatch, media_dir
+):
+    """Check for quoting the client file name of media stored before."""
+
+    monkeypatch.setattr(
+        media,
+        "settings",
+        dataclasses.replace(
+            media.settings, media_accel_redirect="/protected-images/"
+        ),
+    )
+    path = media_dir / "фото 100%?.png"
+    path.write_bytes(make_png(16, 16))
+    async with test_session() as session:
+        legacy = Media(path=str(path))
+        session.add(legacy)
+        await session.commit()
+
+    response = await client.get(
+        f"/api/medias/{legacy.id}", headers={"api-key": "test"}
+    )
+    assert response.status_code == 200, "Запрос не выполнен"
+    assert (
+        response.headers["x-accel-redirect"]
+        == "/protected-images/%D1%84%D0%BE%D1%82%D0%BE%20100%25%3F.png"
+    ), "Неверный путь для nginx"
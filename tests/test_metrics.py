@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+from prometheus_client import REGISTRY
+
+from ..api.app.metrics import MetricsMiddleware
+
+
+def sample(name: str, **labels) -> float:
+    """Return value of a metric sample or 0 if there is none."""
+
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.asyncio
+async def test_request_metrics(client: AsyncClient):
+    """Check for counting requests by route template and status."""
+
+    labels = {"method": "GET", "route": "/api/users/{id}"}
+    requests_before = sample("http_requests_total", status="200", **labels)
+    not_found_before = sample("http_requests_total", status="404", **labels)
+    queries_before = sample("http_request_db_queries_sum", **labels)
+
+    await client.get("/api/users/1", headers={"api-key": "test"})
+    await client.get("/api/users/2", headers={"api-key": "test"})
+    await client.get("/api/users/100", headers={"api-key": "test"})
+
+    assert (
+        sample("http_requests_total", status="200", **labels)
+        == requests_before + 2
+    ), "Запросы не учтены по шаблону пути"
+    assert (
+        sample("http_requests_total", status="404", **labels)
+        == not_found_before + 1
+    ), "Запросы не учтены по статусу"
+    assert (
+        sample("http_request_db_queries_sum", **labels) > queries_before
+    ), "Запросы к базе данных не учтены"
+    assert (
+        sample("http_requests_in_flight") == 0
+    ), "Неверное число активных запросов"
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client: AsyncClient):
+    """Check for exporting metrics in Prometheus format."""
+
+    await client.get("/api/tweets", headers={"api-key": "test"})
+    await client.get("/api/no-such-route")
+    response = await client.get("/metrics")
+
+    assert response.status_code == 200, "Запрос не выполнен"
+    assert response.headers["content-type"].startswith(
+        "text/plain"
+    ), "Неверный формат"
+    for line in (
+        "http_request_duration_seconds_bucket"
+        '{le="0.005",method="GET",route="/api/tweets"}',
+        'http_requests_total{method="GET",route="unmatched",status="404"}',
+        'db_pool_checked_out{pool="primary"}',
+        'cache_hit_ratio{cache="auth"}',
+    ):
+        assert line in response.text, f"Нет метрики {line}"
+
+
+@pytest.mark.asyncio
+async def test_event_stream_metrics():
+    """Check for measuring a live event stream until its response starts."""
+
+    in_flight = []
+
+    async def stream_app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/event-stream")],
+            }
+        )
+        await asyncio.sleep(0.2)
+        in_flight.append(sample("http_requests_in_flight"))
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": "/stream"}
+    labels = {"method": "GET", "route": "unmatched"}
+    duration_before = sample("http_request_duration_seconds_sum", **labels)
+    await MetricsMiddleware(stream_app)(scope, receive, send)
+
+    assert in_flight == [0], "Поток событий учтен как активный запрос"
+    assert (
+        sample("http_request_duration_seconds_sum", **labels) - duration_before
+        < 0.1
+    ), "Длительность потока учтена как длительность запроса"
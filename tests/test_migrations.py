@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import text
+
+from ..api.app import migrate
+from ..api.app.database import Base
+from .conftest import engine
+
+
+async def drop_schema() -> None:
+    """Drop all tables including the version table of migrations."""
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+
+
+@pytest.mark.asyncio
+async def test_migrations_match_models():
+    """Check for the schema made by migrations matching the models."""
+
+    await drop_schema()
+    await migrate.upgrade_database(engine)
+
+    assert (
+        await migrate.check_database(engine) == []
+    ), "Схема отличается от моделей"
+
+
+@pytest.mark.asyncio
+async def test_migrate_legacy_database():
+    """Check for upgrading a database created before migrations existed."""
+
+    await drop_schema()
+    async with engine.connect() as conn:
+        await conn.run_sync(migrate.upgrade, migrate.BASELINE_REVISION)
+        await conn.execute(text("DROP TABLE alembic_version"))
+        await conn.commit()
+    assert (
+        await migrate.check_database(engine) != []
+    ), "Не найдены отличия схемы"
+
+    await migrate.upgrade_database(engine)
+
+    assert (
+        await migrate.check_database(engine) == []
+    ), "Схема отличается от моделей"
+    async with engine.connect() as conn:
+        invalid = await conn.scalar(
+            text("SELECT count(*) FROM pg_index WHERE NOT indisvalid")
+        )
+        not_validated = await conn.scalar(
+            text("SELECT count(*) FROM pg_constraint WHERE NOT convalidated")
+        )
+    assert invalid == 0, "Индексы построены с ошибками"
+    assert not_validated == 0, "Внешние ключи не проверены"
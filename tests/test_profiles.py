@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import update
+
+from ..api.app.events import EventBroker
+from ..api.app.models import User
+from ..api.app.profiles import (
+    CHANNEL,
+    MemoryBackend,
+    ProfileCache,
+    profile_cache,
+)
+from .conftest import DATABASE_URL, assert_query_budget, test_session
+
+HEADERS = {"api-key": "test"}
+
+
+@pytest.fixture()
+def shared_backend(monkeypatch) -> MemoryBackend:
+    """Fixture plugging the in-memory fake of the shared backend."""
+
+    backend = MemoryBackend()
+    monkeypatch.setattr(profile_cache, "backend", backend)
+    return backend
+
+
+@pytest.mark.asyncio
+async def test_profile_cache_hits(
+    client: AsyncClient, shared_backend: MemoryBackend
+):
+    """Check for serving repeated profiles by the version query only."""
+
+    first = await client.get("/api/users/3", headers=HEADERS)
+    assert first.status_code == 200, "Запрос не выполнен"
+    assert (
+        await shared_backend.get("profile:3") is not None
+    ), "Профиль не сохранен в общем кэше"
+
+    cached = await client.get("/api/users/3", headers=HEADERS)
+    assert cached.json() == first.json(), "Кэш вернул другой профиль"
+    assert (
+        cached.headers["etag"] == first.headers["etag"]
+    ), "Кэш вернул другой ETag"
+    assert_query_budget(cached, 1)
+
+    # другой воркер берет профиль из общего кэша
+    profile_cache.clear()
+    shared = await client.get("/api/users/3", headers=HEADERS)
+    assert shared.json() == first.json(), "Общий кэш вернул другой профиль"
+    assert_query_budget(shared, 1)
+
+    response = await client.get("/api/users/100", headers=HEADERS)
+    assert response.status_code == 404, "Несуществующий пользователь найден"
+
+
+@pytest.mark.asyncio
+async def test_follow_invalidates_both_users(
+    client: AsyncClient, shared_backend: MemoryBackend
+):
+    """Check for dropping profiles of both users after follow and unfollow."""
+
+    for method in (client.delete, client.post):
+        me = (await client.get("/api/users/me", headers=HEADERS)).json()[
+            "user"
+        ]
+        author = (await client.get("/api/users/3", headers=HEADERS)).json()[
+            "user"
+        ]
+
+        response = await method("/api/users/3/follow", headers=HEADERS)
+        assert response.status_code in (200, 201), "Подписка не изменена"
+        assert (
+            await shared_backend.get("profile:2") is None
+        ), "Профиль остался в общем кэше"
+        assert (
+            await shared_backend.get("profile:3") is None
+        ), "Профиль остался в общем кэше"
+
+        new_me = (await client.get("/api/users/me", headers=HEADERS)).json()[
+            "user"
+        ]
+        new_author = (
+            await client.get("/api/users/3", headers=HEADERS)
+        ).json()["user"]
+        assert (
+            new_me["following_count"] != me["following_count"]
+        ), "Профиль подписчика устарел"
+        assert (
+            new_author["follower_count"] != author["follower_count"]
+        ), "Профиль автора устарел"
+
+
+@pytest.mark.asyncio
+async def test_invalidation_reaches_other_workers(client: AsyncClient):
+    """Check for dropping profiles cached by another worker via NOTIFY."""
+
+    other_cache = ProfileCache(maxsize=10, ttl=60)
+    broker = EventBroker(DATABASE_URL, queue_size=10)
+    broker.listen(CHANNEL, other_cache.on_notification)
+    broker.start()
+    await broker.wait_listening()
+    try:
+
+        async def load():
+            return '"3-0"', b"{}"
+
+        await other_cache.get_or_load(3, '"3-0"', load)
+        await other_cache.get_or_load(4, '"3-0"', load)
+        await client.post(
+            "/api/users/1/follow", headers={"api-key": "Elon1234"}
+        )
+        for _ in range(100):
+            if other_cache.local.get(3) is None:
+                break
+            await asyncio.sleep(0.01)
+        assert (
+            other_cache.local.get(3) is None
+        ), "Профиль не удален в другом воркере"
+        assert (
+            other_cache.local.get(4) is not None
+        ), "Удален профиль другого пользователя"
+
+        other_cache.on_notification(None)
+        assert (
+            len(other_cache.local) == 0
+        ), "Кэш не сброшен после потери соединения"
+    finally:
+        await broker.stop()
+
+
+@pytest.mark.asyncio
+async def test_profile_cache_checks_version(
+    client: AsyncClient, shared_backend: MemoryBackend
+):
+    """Check for not serving a cached profile of an older user version."""
+
+    first = await client.get("/api/users/3", headers=HEADERS)
+    # a change the caches are not told about, e.g. read from a lagging replica
+    async with test_session() as session:
+        await session.execute(
+            update(User).where(User.id == 3).values(version=User.version + 1)
+        )
+        await session.commit()
+
+    response = await client.get("/api/users/3", headers=HEADERS)
+    assert (
+        response.headers["etag"] != first.headers["etag"]
+    ), "Отдан профиль старой версии"
+    packed = await shared_backend.get("profile:3")
+    assert (
+        packed.split(b"\n", 1)[0].decode() == response.headers["etag"]
+    ), "Общий кэш не обновлен"
+
+    not_modified = await client.get(
+        "/api/users/3",
+        headers={**HEADERS, "if-none-match": response.headers["etag"]},
+    )
+    assert not_modified.status_code == 304, "Профиль не проверен по ETag"
+    assert_query_budget(not_modified, 1)
@@ -0,0 +1,92 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+
+from ..api.app.models import Media, User
+from .conftest import assert_query_budget, test_session
+
+# Число запросов к базе данных не должно расти с числом твитов,
+# лайков, вложений и подписок (проверка N+1)
+BUDGETS = {
+    "/api/tweets": 2,
+    "/api/tweets/feed": 2,
+    "/api/users/me": 3,
+    "/api/users/3": 3,
+}
+
+
+@pytest_asyncio.fixture()
+async def crowded_client(client: AsyncClient) -> AsyncClient:
+    """Fixture filling the database with tweets, likes, media and follows."""
+
+    async with test_session() as session:
+        async with session.begin():
+            session.add_all(
+                User(name=f"user{i}", api_key=f"key{i}") for i in range(10)
+            )
+    for i in range(10):
+        await client.post(
+            "/api/users/3/follow", headers={"api-key": f"key{i}"}
+        )
+        await client.post(
+            "/api/users/1/follow", headers={"api-key": f"key{i}"}
+        )
+        await client.post(
+            "/api/users/{}/follow".format(4 + i), headers={"api-key": "test"}
+        )
+    for i in range(10):
+        response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": f"tweet {i}"},
+            headers={"api-key": f"key{i}"},
+        )
+        tweet_id = response.json()["tweet_id"]
+        async with test_session() as session:
+            async with session.begin():
+                session.add_all(
+                    Media(
+                        path=f"{tweet_id}_{n}.png",
+                        tweet_id=tweet_id,
+                        status="ready",
+                    )
+                    for n in range(3)
+                )
+        for n in range(i):
+            await client.post(
+                f"/api/tweets/{tweet_id}/likes", headers={"api-key": f"key{n}"}
+            )
+    return client
+
+
+@pytest.mark.asyncio
+async def test_server_timing(client: AsyncClient):
+    """Check for reporting SQL statements in the Server-Timing header."""
+
+    response = await client.get("/api/users/me", headers={"api-key": "test"})
+
+    assert response.status_code == 200, "Запрос не выполнен"
+    assert response.headers["server-timing"].startswith(
+        "db;desc="
+    ), "Нет заголовка"
+    assert ";dur=" in response.headers["server-timing"], "Нет времени запросов"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("path", BUDGETS)
+async def test_query_budget(crowded_client: AsyncClient, path: str):
+    """Check for endpoints staying in their SQL statement budgets."""
+
+    response = await crowded_client.get(path, headers={"api-key": "test"})
+
+    assert response.status_code == 200, "Запрос не выполнен"
+    assert_query_budget(response, BUDGETS[path])
+
+
+@pytest.mark.asyncio
+async def test_query_budget_exceeded(client: AsyncClient):
+    """Check for failing when an endpoint exceeds its budget."""
+
+    response = await client.get("/api/users/me", headers={"api-key": "test"})
+
+    with pytest.raises(AssertionError, match="бюджет 0"):
+        assert_query_budget(response, 0)
@@ -0,0 +1,93 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import func, select, text
+
+from ..api.app.counters import repair_counters
+from ..api.app.models import (
+    Tweet,
+    associated_followers,
+    associated_likes,
+    timeline_inbox,
+)
+from ..api.app.seed import seed_database, truncate_database
+from .conftest import engine, test_session
+
+
+async def snapshot() -> list:
+    """Return all seeded rows in a stable order."""
+
+    async with test_session() as session:
+        tweets = await session.execute(
+            select(
+                Tweet.id, Tweet.author_id, Tweet.content, Tweet.like_count
+            ).order_by(Tweet.id)
+        )
+        follows = await session.execute(
+            select(associated_followers).order_by(*associated_followers.c)
+        )
+        likes = await session.execute(
+            select(associated_likes).order_by(*associated_likes.c)
+        )
+        return [tweets.all(), follows.all(), likes.all()]
+
+
+@pytest.mark.asyncio
+async def test_seed_database(client: AsyncClient):
+    """Check for loading consistent data with working sequences."""
+
+    await truncate_database(engine)
+    stats = await seed_database(
+        engine, users=50, tweets=200, likes=600, following=5, batch_size=64
+    )
+
+    assert stats.users == 50 and stats.tweets == 200, "Неверное число строк"
+    assert stats.follows > 0 and stats.likes > 0, "Нет подписок или лайков"
+    async with test_session() as session:
+        assert (
+            await session.scalar(
+                select(func.count()).select_from(associated_likes)
+            )
+            == stats.likes
+        )
+        assert (
+            await session.scalar(
+                select(func.count()).select_from(timeline_inbox)
+            )
+            > 0
+        ), "Ленты не заполнены"
+        assert await repair_counters(session) == {
+            "tweets": 0,
+            "users": 0,
+        }, "Счетчики не совпадают"
+        own_likes = await session.scalar(
+            select(func.count())
+            .select_from(associated_likes.join(Tweet))
+            .where(Tweet.author_id == associated_likes.c.user_id)
+        )
+        assert own_likes == 0, "Автор лайкнул свой твит"
+        foreign_keys = await session.scalar(
+            text("SELECT count(*) FROM pg_constraint WHERE contype = 'f'")
+        )
+        assert foreign_keys == 8, "Внешние ключи не восстановлены"
+
+    response = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "new tweet"},
+        headers={"api-key": "key1"},
+    )
+    assert response.json()["tweet_id"] == 201, "Последовательность не сдвинута"
+
+
+@pytest.mark.asyncio
+async def test_seed_deterministic(client: AsyncClient):
+    """Check for the same data from the same seed and refusing to overwrite."""
+
+    snapshots = []
+    for _ in range(2):
+        await truncate_database(engine)
+        await seed_database(engine, users=30, tweets=100, likes=200, seed=7)
+        snapshots.append(await snapshot())
+
+    assert snapshots[0] == snapshots[1], "Данные зависят не только от seed"
+    with pytest.raises(ValueError):
+        await seed_database(engine, users=30, tweets=100, likes=200)
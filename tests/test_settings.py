@@ -0,0 +1,57 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from ..api.app import database
+from ..api.app.settings import Settings
+from .conftest import DATABASE_URL
+
+
+def test_settings_from_env(monkeypatch):
+    """Check for overriding default settings by environment variables."""
+
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+    monkeypatch.setenv("DB_POOL_TIMEOUT", "2.5")
+
+    settings = Settings.from_env()
+    assert settings.db_pool_size == 20, "Неверный размер пула"
+    assert settings.db_pool_pre_ping is False, "Неверное булево значение"
+    assert settings.db_pool_timeout == 2.5, "Неверное значение"
+    assert settings.db_echo is False, "Неверное значение по умолчанию"
+
+
+@pytest.mark.asyncio
+async def test_get_pool_status(client: AsyncClient):
+    """Check for getting statistics of the connection pool."""
+
+    response = await client.get("/api/health/pool")
+    assert response.status_code == 404, "Статистика пула опубликована в /api"
+
+    response = await client.get("/health/pool")
+    assert response.status_code == 200, "Запрос не выполнен"
+    assert {"size", "checked_out", "wait_seconds_max"} <= set(
+        response.json()
+    ), "Неверный формат ответа"
+
+
+@pytest.mark.asyncio
+async def test_engine_without_statement_cache():
+    """Check for disabling prepared statements cached by asyncpg as well."""
+
+    engine = create_async_engine(
+        DATABASE_URL, connect_args=database.get_connect_args(0)
+    )
+    try:
+        async with engine.connect() as conn:
+            for _ in range(2):
+                assert await conn.scalar(select(1)) == 1, "Запрос не выполнен"
+            driver_connection = (
+                await conn.get_raw_connection()
+            ).driver_connection
+            cache_size = driver_connection._stmt_cache.get_max_size()
+    finally:
+        await engine.dispose()
+
+    assert cache_size == 0, "Кэш asyncpg не отключен"
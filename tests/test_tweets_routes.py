@@ -1,5 +1,15 @@
+import asyncio
+import time
+
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import func, select
+
+from ..api.app import dependencies
+from ..api.app.inbox import trim_inboxes
+from ..api.app.models import Media, associated_likes
+from ..api.app.routes import crud, utils
+from .conftest import test_session
 
 
 @pytest.mark.asyncio
@@ -28,11 +38,74 @@ async def test_get_tweets_list(client: AsyncClient):
             "id",
             "content",
             "attachments",
+            "attachment_variants",
             "author",
             "likes",
+            "like_count",
         ], "Неверный формат данных"
 
 
+@pytest.mark.asyncio
+async def test_get_tweets_pages(client: AsyncClient):
+    """Check for walking the tweets list page by page with the cursor."""
+
+    for number in range(2):
+        await client.post(
+            "/api/tweets",
+            headers={"api-key": "test"},
+            json={"tweet_data": str(number)},
+        )
+
+    response = await client.get(
+        "/api/tweets?limit=2", headers={"api-key": "test"}
+    )
+    assert response.status_code == 200, "Запрос не выполнен"
+    first_page = response.json()
+    assert [tweet["id"] for tweet in first_page["tweets"]] == [
+        3,
+        2,
+    ], "Неверный порядок твитов"
+    assert first_page["next_cursor"], "Нет курсора следующей страницы"
+
+    response = await client.get(
+        "/api/tweets",
+        headers={"api-key": "test"},
+        params={"limit": 2, "cursor": first_page["next_cursor"]},
+    )
+    assert response.status_code == 200, "Запрос не выполнен"
+    second_page = response.json()
+    assert [tweet["id"] for tweet in second_page["tweets"]] == [
+        1
+    ], "Неверная страница ленты"
+    assert second_page["next_cursor"] is None, "Лента должна закончиться"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"cursor": "not-a-cursor"},
+        {"cursor": utils.encode_cursor(2**31)},
+        {"cursor": utils.encode_cursor(0)},
+        {"limit": 0},
+    ],
+)
+async def test_get_tweets_with_bad_params(client: AsyncClient, params: dict):
+    """
+    Check for rejecting bad pagination parameters.
+
+    Case 1: malformed cursor.
+    Case 2: tweet ID of the cursor overflows the id column.
+    Case 3: tweet ID of the cursor is not positive.
+    Case 4: limit out of range.
+    """
+
+    response = await client.get(
+        "/api/tweets", headers={"api-key": "test"}, params=params
+    )
+    assert response.status_code in (400, 422), "Неправильные параметры запроса"
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("route", ["/api/tweets", "/api/tweets/1/likes"])
 async def test_authorization_for_post_methods(client: AsyncClient, route: str):
@@ -132,6 +205,28 @@ async def test_delete_nonexistent_tweet(client: AsyncClient):
     assert "не найден" in response.json()["message"], "Неправильное сообщение"
 
 
+@pytest.mark.asyncio
+async def test_delete_tweet_cascades(client: AsyncClient):
+    """Check for deleting likes and detaching media of a deleted tweet."""
+
+    async with test_session() as session:
+        session.add(Media(path="./images/photo.jpg", tweet_id=1))
+        await session.commit()
+
+    response = await client.delete(
+        "/api/tweets/1", headers={"api-key": "admin"}
+    )
+    assert response.status_code == 200, "Запрос не выполнен"
+
+    async with test_session() as session:
+        likes = await session.scalar(
+            select(func.count()).select_from(associated_likes)
+        )
+        media_tweet_id = await session.scalar(select(Media.tweet_id))
+    assert likes == 0, "Лайки удаленного твита не удалены"
+    assert media_tweet_id is None, "Медиа не отсоединено от удаленного твита"
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
     ("route", "header"),
@@ -186,3 +281,210 @@ async def test_like_nonexistent_tweet(client: AsyncClient):
     assert response.status_code == 404, "Запрос на несуществующий твит"
     assert "message" in response.json(), "Неверный формат ответа"
     assert "не найден" in response.json()["message"], "Неправильное сообщение"
+
+
+@pytest.mark.asyncio
+async def test_home_feed_from_followed_authors(client: AsyncClient):
+    """Check for getting tweets of followed authors only in the home feed."""
+
+    response = await client.post(
+        "/api/tweets",
+        headers={"api-key": "Elon1234"},
+        json={"tweet_data": "test"},
+    )
+    tweet_id = response.json()["tweet_id"]
+
+    response = await client.get(
+        "/api/tweets/feed", headers={"api-key": "test"}
+    )
+    assert response.status_code == 200, "Запрос не выполнен"
+    assert [tweet["id"] for tweet in response.json()["tweets"]] == [
+        tweet_id
+    ], "В ленте должны быть твиты только тех, на кого подписан пользователь"
+
+    response = await client.get(
+        "/api/tweets/feed", headers={"api-key": "admin"}
+    )
+    assert response.json()["tweets"] == [], "Лента должна быть пустой"
+
+
+@pytest.mark.asyncio
+async def test_home_feed_after_follow_and_unfollow(client: AsyncClient):
+    """Check for backfilling the home feed on follow, purging on unfollow."""
+
+    await client.post("/api/users/1/follow", headers={"api-key": "test"})
+    response = await client.get(
+        "/api/tweets/feed", headers={"api-key": "test"}
+    )
+    assert [tweet["id"] for tweet in response.json()["tweets"]] == [
+        1
+    ], "Твиты нового автора не попали в ленту"
+
+    await client.delete("/api/users/1/follow", headers={"api-key": "test"})
+    response = await client.get(
+        "/api/tweets/feed", headers={"api-key": "test"}
+    )
+    assert response.json()["tweets"] == [], "Твиты автора остались в ленте"
+
+
+@pytest.mark.asyncio
+async def test_home_feed_merges_popular_authors(
+    client: AsyncClient, monkeypatch
+):
+    """Check for merging tweets of authors with many followers at read time."""
+
+    monkeypatch.setattr(crud, "FANOUT_FOLLOWERS_LIMIT", 1)
+    response = await client.post(
+        "/api/tweets",
+        headers={"api-key": "Elon1234"},
+        json={"tweet_data": "test"},
+    )
+    tweet_id = response.json()["tweet_id"]
+
+    response = await client.get(
+        "/api/tweets/feed", headers={"api-key": "test"}
+    )
+    assert [tweet["id"] for tweet in response.json()["tweets"]] == [
+        tweet_id
+    ], "Твиты популярного автора не попали в ленту"
+
+    # автор потерял подписчиков, но его прежние твиты не разосланы
+    monkeypatch.setattr(crud, "FANOUT_FOLLOWERS_LIMIT", 1000)
+    response = await client.get(
+        "/api/tweets/feed", headers={"api-key": "test"}
+    )
+    assert [tweet["id"] for tweet in response.json()["tweets"]] == [
+        tweet_id
+    ], "Твиты автора пропали из ленты после смены режима рассылки"
+
+
+@pytest.mark.asyncio
+async def test_trim_inboxes(client: AsyncClient):
+    """Check for keeping only the newest tweets in the inbox of a user."""
+
+    tweet_ids = []
+    for _ in range(3):
+        response = await client.post(
+            "/api/tweets",
+            headers={"api-key": "Elon1234"},
+            json={"tweet_data": "test"},
+        )
+        tweet_ids.append(response.json()["tweet_id"])
+
+    async with test_session() as session:
+        trimmed = await trim_inboxes(session, size=2)
+    response = await client.get(
+        "/api/tweets/feed", headers={"api-key": "test"}
+    )
+
+    assert trimmed == 1, "Неверное число удаленных записей"
+    assert [tweet["id"] for tweet in response.json()["tweets"]] == [
+        tweet_ids[2],
+        tweet_ids[1],
+    ], "Удалены не самые старые твиты"
+
+
+@pytest.mark.asyncio
+async def test_tweets_json_matches_orm(client: AsyncClient):
+    """Check that the timeline serialized by the database matches the ORM."""
+
+    files = {"file": open("uploaded_image.jpg", "rb")}
+    await client.post("/api/medias", headers={"api-key": "test"}, files=files)
+    await client.post(
+        "/api/tweets",
+        headers={"api-key": "test"},
+        json={"tweet_data": "test", "tweet_media_ids": [1]},
+    )
+    await client.post("/api/tweets/1/likes", headers={"api-key": "Elon1234"})
+
+    response = await client.get(
+        "/api/tweets?limit=1", headers={"api-key": "test"}
+    )
+    assert response.headers["content-type"] == "application/json"
+    async with test_session() as session:
+        tweets_orm = await crud.get_tweets(session, limit=2)
+        expected = await utils.get_formatted_tweets(tweets_orm, limit=1)
+    assert response.json() == expected.model_dump(
+        mode="json", by_alias=True
+    ), "Ответ не совпадает с сериализацией через ORM"
+
+    response = await client.get("/api/tweets", headers={"api-key": "test"})
+    async with test_session() as session:
+        tweets_orm = await crud.get_tweets(session, limit=3)
+        expected = await utils.get_formatted_tweets(tweets_orm, limit=2)
+    assert response.json() == expected.model_dump(
+        mode="json", by_alias=True
+    ), "Ответ не совпадает с сериализацией через ORM"
+
+
+@pytest.mark.asyncio
+async def test_like_counter(client: AsyncClient):
+    """Check for updating the like counter on like and unlike."""
+
+    await client.post("/api/tweets/1/likes", headers={"api-key": "Elon1234"})
+    response = await client.get("/api/tweets", headers={"api-key": "test"})
+    assert response.json()["tweets"][0]["like_count"] == 2, "Лайк не учтен"
+
+    await client.delete("/api/tweets/1/likes", headers={"api-key": "test"})
+    await client.delete("/api/tweets/1/likes", headers={"api-key": "Elon1234"})
+    response = await client.get("/api/tweets", headers={"api-key": "test"})
+    assert response.json()["tweets"][0]["like_count"] == 0, "Лайк не удален"
+    assert response.json()["tweets"][0]["likes"] == [], "Лайк не удален"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_repeated_likes(client: AsyncClient):
+    """Check for counting a like once when it is posted repeatedly at once."""
+
+    responses = await asyncio.gather(
+        *[
+            client.post("/api/tweets/1/likes", headers={"api-key": "Elon1234"})
+            for _ in range(5)
+        ]
+    )
+    assert {response.status_code for response in responses} == {
+        201
+    }, "Повторный лайк должен быть успешным"
+    response = await client.get("/api/tweets", headers={"api-key": "test"})
+    assert response.json()["tweets"][0]["like_count"] == 2, "Лайк учтен дважды"
+
+
+@pytest.mark.asyncio
+async def test_reads_routed_to_replica(client: AsyncClient, monkeypatch):
+    """Check for reading from the replica except right after own writes."""
+
+    replica_sessions = []
+
+    def replica_session():
+        replica_sessions.append(True)
+        return test_session()
+
+    monkeypatch.setattr(dependencies, "read_session", replica_session)
+
+    response = await client.get("/api/tweets", headers={"api-key": "test"})
+    assert response.status_code == 200, "Запрос не выполнен"
+    assert len(replica_sessions) == 1, "Чтение должно идти с реплики"
+
+    await client.post("/api/tweets/1/likes", headers={"api-key": "Elon1234"})
+    response = await client.get("/api/tweets", headers={"api-key": "Elon1234"})
+    assert (
+        response.json()["tweets"][0]["like_count"] == 2
+    ), "Не видна своя запись"
+    assert len(replica_sessions) == 1, "После записи чтение идет с основной БД"
+
+    await client.get("/api/tweets", headers={"api-key": "admin"})
+    assert len(replica_sessions) == 2, "Чтение должно идти с реплики"
+
+    # окно хранится у клиента и действует в любом воркере
+    last_write = client.cookies[dependencies.LAST_WRITE_COOKIE]
+    assert dependencies.wrote_recently(last_write, 3), "Запись не учтена"
+    assert not dependencies.wrote_recently(
+        last_write, 1
+    ), "Окно чужого пользователя"
+    user_id, written_at, digest = last_write.split(":")
+    forged = f"{user_id}:{float(written_at) + 1:.3f}:{digest}"
+    assert not dependencies.wrote_recently(
+        forged, 3
+    ), "Принята поддельная метка"
+    old = dependencies.sign_last_write(3, time.time() - 60)
+    assert not dependencies.wrote_recently(old, 3), "Окно не истекло"
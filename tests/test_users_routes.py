@@ -28,6 +28,8 @@ async def test_get_current_user(client: AsyncClient, route: str):
             "name",
             "followers",
             "following",
+            "follower_count",
+            "following_count",
         ], "Неверный формат данных"
     assert (
         response.json()["user"]["id"] == 2
@@ -142,3 +144,24 @@ async def test_bad_request_when_unfollow(client: AsyncClient):
     assert response.status_code == 400, "Неправильные параметры запроса"
     assert "message" in response.json(), "Неверный формат ответа"
     assert "Вы не подписаны" in response.json()["message"], "Неверный результат ответа"
+
+
+@pytest.mark.asyncio
+async def test_follow_counters(client: AsyncClient):
+    """Check for updating follower counters on follow and unfollow."""
+
+    await client.post("/api/users/1/follow", headers={"api-key": "test"})
+    response = await client.get("/api/users/1", headers={"api-key": "test"})
+    assert response.json()["user"]["follower_count"] == 1, "Подписка не учтена"
+    response = await client.get("/api/users/me", headers={"api-key": "test"})
+    assert (
+        response.json()["user"]["following_count"] == 2
+    ), "Подписка не учтена"
+    assert [user["id"] for user in response.json()["user"]["following"]] == [
+        1,
+        3,
+    ], "Неверный список подписок"
+
+    await client.delete("/api/users/1/follow", headers={"api-key": "test"})
+    response = await client.get("/api/users/me", headers={"api-key": "test"})
+    assert response.json()["user"]["following_count"] == 1, "Отписка не учтена"